@@ -1,103 +1,93 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import ast
 import os
-from collections import defaultdict
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from datetime import datetime
 from datetime import date
+from shuttle import core
+from shuttle.core import INDEX_BACKEND, RERANK_CANDIDATES, SEARCH_MODE, SEARCH_PARAMS, Retriever
+from shuttle.results import display_frame, to_csv
+from shuttle.filters import SORT_LABELS, SORT_ORDERS
+from shuttle.hybrid import MODES, MODE_LABELS
 
-# Configuration
-CORPUS_PATH = "full_corpus_SBERT_trained"
-EMBEDDING_FILES = [
-    "embeddings_part1.csv.gz",
-    "embeddings_part2.csv.gz"
-]
-METADATA_FILES = [
-    "metadata_part1_final.csv",
-    "metadata_part2_final.csv"
-]
+# Retrieval runs in this process unless SHUTTLE_SERVICE_URL points at a
+# `python -m shuttle.service` instance, which lets many UI sessions and
+# batch jobs share one warm index. Model, corpus and index settings live in
+# shuttle/core.py.
+SERVICE_URL = os.environ.get("SHUTTLE_SERVICE_URL")
 
 @st.cache_resource
 def load_model():
-    return SentenceTransformer('StephKeddy/sbert-IR-covid-search-v2')    
+    return core.load_model()
 
-@st.cache_data
-def load_corpus():
-    # Load metadata with tag processing
-    meta_dfs = []
-    tag_frequency = defaultdict(int)
-    
-    for f in METADATA_FILES:
-        path = os.path.join(CORPUS_PATH, f)
-        df = pd.read_csv(path, index_col='cord_uid')
-        
-        # Convert string lists to actual lists
-        df['tags'] = df['tags'].apply(
-            lambda x: ast.literal_eval(x) if pd.notnull(x) and x.startswith('[') else []
-        )
-        
-        # Process dates
-        df['publish_time'] = pd.to_datetime(
-            df['publish_time'],
-            format='mixed',
-            dayfirst=True
-        )
-        
-        # Count tag frequencies
-        for tags in df['tags']:
-            for tag in tags:
-                tag_frequency[tag] += 1
-                
-        meta_dfs.append(df)
-    
-    metadata = pd.concat(meta_dfs)
-    
-    # Load embeddings
-    embed_dfs = []
-    for f in EMBEDDING_FILES:
-        path = os.path.join(CORPUS_PATH, f)
-        df = pd.read_csv(path, compression='gzip', index_col='cord_uid')
-        df.columns = df.columns.astype(int)
-        df = df.apply(pd.to_numeric, errors='coerce')
-        embed_dfs.append(df)
-    
-    embeddings = pd.concat(embed_dfs)
-    
-    # Validate embeddings
-    if embeddings.shape[1] != 768:
-        st.error(f"Expected 768 embedding dimensions, found {embeddings.shape[1]}")
-        st.stop()
+@st.cache_resource
+def load_retriever():
+    if SERVICE_URL:
+        from shuttle.client import RemoteRetriever
+        return RemoteRetriever(SERVICE_URL)
+    # Shared by all sessions of this process
+    return Retriever.load(model=load_model())
+
+def show_results(display_df):
+    """Results table for a frame from shuttle.results.display_frame."""
+    st.dataframe(
+        display_df,
+        column_config={
+            "Rank": st.column_config.NumberColumn(
+                "Rank",
+                width=45
+            ),
+            "title": "Title",
+            "publish_time": st.column_config.DateColumn(
+                "Published",
+                format="DD MMM YYYY",
+            ),
+            "abstract": st.column_config.TextColumn(
+                "Abstract",
+                width="large"
+            ),
+            "referenced_by_count": st.column_config.NumberColumn(
+                "# Cited By",
+                format="%d"
+            ),
+            "url": st.column_config.LinkColumn(
+                "URL",
+                display_text="Link"
+            ),
+            "similarity": st.column_config.NumberColumn(
+                "Relevance",
+                format="%.1f"
+            )
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+
+def browse_documents(retriever, page_size, filters):
+    """'*' query: every document matching the filters, one page at a time."""
+    st.info("Showing all documents matching filters (date, tags, references).")
+    sort = st.selectbox("Sort by", SORT_ORDERS, format_func=SORT_LABELS.get)
+    cursor = retriever.browse(sort=sort, page_size=page_size, **filters)
+    if cursor.total == 0:
+        st.warning("No documents match your search criteria. Try adjusting the filters.")
+        return
     
-    # Merge data
-    corpus = metadata.merge(embeddings, left_index=True, right_index=True, how='inner')
+    page = st.number_input(f"Page (of {cursor.pages})", min_value=1, max_value=cursor.pages, value=1, step=1)
+    results = cursor.page(page - 1)
+    first = (page - 1) * page_size + 1
+    # No similarity for '*' query; ranks are positions
+    display_df = display_frame(results, first_rank=first)
     
-    # Sort tags by frequency then alphabetically
-    sorted_tags = sorted(
-        tag_frequency.keys(),
-        key=lambda x: (-tag_frequency[x], x)
-    )
+    st.subheader(f"Showing {first}-{first + len(results) - 1} of {cursor.total} documents")
+    show_results(display_df)
     
-    return corpus, sorted_tags, tag_frequency
-
-def search(query, corpus, model, top_k=50):
-    query_embedding = model.encode(query, convert_to_tensor=False).reshape(1, -1)
-    doc_embeddings = corpus[list(range(768))].values
-    similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
-    top_indices = similarities.argsort()[-top_k:][::-1]
-    return corpus.iloc[top_indices], similarities[top_indices]
-
-def preprocess_text(text):
-    if isinstance(text, str):
-        return ' '.join(text.lower().split())
-    return text
-
-def recalibrate_score(score, low=0.999, high=1.0):
-    """Rescales cosine similarity to a 0-100 relevance score."""
-    score = np.clip(score, low, high)
-    return round(100 * (score - low) / (high - low), 1)
+    # The export is built page by page, and only on request
+    if st.button(f"Prepare CSV of all {cursor.total} documents"):
+        with st.spinner("Writing CSV..."):
+            csv = "".join(cursor.csv_chunks()).encode('utf-8')
+        st.download_button(
+            "Download Results",
+            data=csv,
+            file_name="search_results.csv",
+            mime="text/csv"
+        )
 
 def main():
     st.set_page_config(layout="wide", page_title="Document Search", page_icon="🔍")
@@ -108,8 +98,15 @@ def main():
     
     # Load data and model
     with st.spinner("Loading corpus and model..."):
-        corpus, all_tags, tag_freq = load_corpus()
-        model = load_model()
+        retriever = load_retriever()
+        # Documents ingested as segments since the last run become searchable
+        retriever.refresh()
+        # Corpus facts for the filter controls
+        info = retriever.info()
+    
+    # Sidebar tag list and counts, most frequent first
+    all_tags = info['tags']
+    tag_freq = info['tag_frequency']
     
     # Initialize session state for query
     if 'query' not in st.session_state:
@@ -123,8 +120,15 @@ def main():
         st.session_state.query = sidebar_query
         
         top_k = st.slider("Number of results to display", 10, 100, 50)
+        mode = st.selectbox(
+            "Ranking",
+            MODES,
+            index=MODES.index(SEARCH_MODE),
+            format_func=MODE_LABELS.get,
+            help="Keyword and hybrid ranking help short queries that need exact term matches."
+        )
         # Number input for minimum referenced_by_count
-        max_refs = int(corpus['referenced_by_count'].max())
+        max_refs = info['max_refs']
         min_refs = st.number_input(
             "Minimum cited by",
             min_value=0,
@@ -135,8 +139,8 @@ def main():
         )
         
         # Date range filter with validation
-        min_date = corpus['publish_time'].min().date()
-        max_date = corpus['publish_time'].max().date()
+        min_date = info['min_date']
+        max_date = info['max_date']
         
         try:
             date_selection = st.date_input(
@@ -173,6 +177,52 @@ def main():
                     key=f"tag_{tag}"
                 ):
                     selected_tags.append(tag)
+        tag_match = st.radio(
+            "Match documents with",
+            ["any", "all"],
+            format_func=lambda m: f"{m} selected tags",
+            horizontal=True
+        )
+
+        # Retrieval backend and its recall/speed knob
+        with st.expander("Retrieval settings"):
+            backends = info['backends']
+            backend = st.selectbox(
+                "Index backend",
+                backends,
+                index=backends.index(INDEX_BACKEND),
+                help="exact scores every document; ivf and hnsw are approximate and faster on large corpora; "
+                     "sq8 and pq score compressed vectors and re-rank a shortlist exactly."
+            )
+            search_params = dict(SEARCH_PARAMS)
+            if backend == "ivf":
+                search_params["nprobe"] = st.slider(
+                    "nprobe (clusters scanned)", 1, 256, SEARCH_PARAMS["nprobe"],
+                    help="Higher is more accurate but slower."
+                )
+            elif backend == "hnsw":
+                search_params["ef_search"] = st.slider(
+                    "efSearch (candidate list size)", 16, 1024, SEARCH_PARAMS["ef_search"],
+                    help="Higher is more accurate but slower."
+                )
+            elif backend in ("sq8", "pq"):
+                search_params["rerank"] = st.slider(
+                    "Re-ranked candidates", 50, 2000, SEARCH_PARAMS["rerank"],
+                    help="Higher is more accurate but slower."
+                )
+            # Cross-encoder re-ranking of the top results, when configured
+            rerank_candidates = 0
+            if info.get('reranker') and st.checkbox(
+                "Re-rank top results",
+                help="A cross-encoder re-scores the top results; slower but more precise at the top of the list."
+            ):
+                rerank_candidates = st.slider("Re-ranked results", 10, 100, RERANK_CANDIDATES)
+            cache_stats = retriever.stats().get('query_cache')
+            if cache_stats:
+                st.caption(
+                    f"Query cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+                    f"{cache_stats['misses']} misses"
+                )
 
         # CSS for tag display
         st.markdown("""
@@ -188,103 +238,48 @@ def main():
         
     # Main interface
     query = st.session_state.query
-    if query:
-        # Preprocess query unless it's '*'
-        processed_query = query if query.strip() == '*' else preprocess_text(query)
+    filters = dict(
+        start_date=start_date,
+        end_date=end_date,
+        tags=selected_tags,
+        tag_match=tag_match,
+        min_refs=min_refs
+    )
+    if query.strip() == '*':
+        browse_documents(retriever, top_k, filters)
+    elif query:
         with st.spinner(f"Searching for '{query}'..."):
-            if query.strip() == '*':
-                # Special case: '*' returns all documents
-                raw_results = corpus
-                scores = np.zeros(len(corpus))  # Placeholder scores
-                st.info("Showing all documents matching filters (date, tags, references).")
-            else:
-                # Regular semantic search with preprocessed query
-                raw_results, scores = search(processed_query, corpus, model, top_k=1000)
-            
-            # Apply date filter
-            date_filtered = raw_results[
-                (raw_results['publish_time'].dt.date >= start_date) &
-                (raw_results['publish_time'].dt.date <= end_date)
-            ]
-            
-            # Apply tag filter
-            if selected_tags:
-                tag_filtered = date_filtered[
-                    date_filtered['tags'].apply(
-                        lambda x: any(tag in x for tag in selected_tags)
-                    )
-                ]
-            else:
-                tag_filtered = date_filtered
-            
-            # Apply referenced_by_count filter
-            results = tag_filtered[
-                tag_filtered['referenced_by_count'] >= min_refs
-            ]
-            
-            # Trim to top_k results after filtering
-            results = results.iloc[:top_k]
-            scores = scores[:len(results)]
+            # Date, tag and referenced_by_count filters restrict the search
+            # itself
+            results, scores = retriever.search(
+                query,
+                top_k=top_k,
+                mode=mode,
+                backend=backend,
+                rerank_candidates=rerank_candidates,
+                **filters,
+                **search_params
+            )
+            if rerank_candidates and not results.attrs.get('reranked'):
+                st.caption("Re-ranking ran out of time; showing the first-stage ranking.")
             
             if results.empty:
                 st.warning("No documents match your search criteria. Try adjusting the filters.")
                 return
             
-            # Prepare display dataframe
-            display_df = results.reset_index()[['title', 'publish_time', 'abstract', 'referenced_by_count', 'url']]
-            if query.strip() == '*':
-                display_df['similarity'] = None  # No similarity for '*' query
-                display_df['Rank'] = range(1, len(display_df) + 1)  # Sequential rank
-            else:
-                # Recalibrate scores for display
-                display_df['similarity'] = np.array([recalibrate_score(score) for score in scores])
-                # Rank based on original scores to preserve granularity
-                display_df['Rank'] = pd.Series(scores).rank(ascending=False, method='min').astype(int)
-            display_df['publish_time'] = display_df['publish_time'].dt.strftime('%d %b %Y')
-            
-            # Reorder columns to show Rank first
-            display_df = display_df[['Rank', 'title', 'publish_time', 'abstract', 'referenced_by_count', 'url', 'similarity']]
+            # Rank and relevance (cross-encoder scores when re-ranked), with
+            # the calibration ranges fitted on the qrels when available
+            score_mode = 'rerank' if results.attrs.get('reranked') else mode
+            display_df = display_frame(results, scores, score_mode, info.get('calibration'))
             
             # Display results
             st.subheader(f"Showing {len(results)} Results ({start_date} to {end_date})")
             if len(results) < top_k:
                 st.info(f"Only {len(results)} results found after applying filters. Adjust filters to see more.")
-            
-            st.dataframe(
-                display_df,
-                column_config={
-                    "Rank": st.column_config.NumberColumn(
-                        "Rank",
-                        width=45
-                    ),
-                    "title": "Title",
-                    "publish_time": st.column_config.DateColumn(
-                        "Published",
-                        format="DD MMM YYYY",
-                    ),
-                    "abstract": st.column_config.TextColumn(
-                        "Abstract",
-                        width="large"
-                    ),
-                    "referenced_by_count": st.column_config.NumberColumn(
-                        "# Cited By",
-                        format="%d"
-                    ),
-                    "url": st.column_config.LinkColumn(
-                        "URL",
-                        display_text="Link"
-                    ),
-                    "similarity": st.column_config.NumberColumn(
-                        "Relevance",
-                        format="%.1f"
-                    )
-                },
-                hide_index=True,
-                use_container_width=True
-            )
+            show_results(display_df)
             
             # Download button
-            csv = display_df.to_csv(index=False, na_rep='').encode('utf-8')
+            csv = to_csv(display_df).encode('utf-8')
             st.download_button(
                 "Download Results",
                 data=csv,
@@ -0,0 +1,86 @@
+"""Recall@k vs latency of the approximate index backends, measured against
+the exact backend on DEMO_test_queries.csv.
+
+    python benchmarks/ann_recall.py full_corpus_SBERT_trained --top-k 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.embedding_store import DEFAULT_MODEL, load_embedding_frame  # noqa: E402
+from shuttle.engine import DenseSearchEngine  # noqa: E402
+from shuttle.text import preprocess_text  # noqa: E402
+
+
+def run(engine, query_embeddings, top_k, backend, **params):
+    results, timings = [], []
+    for q in query_embeddings:
+        start = time.perf_counter()
+        indices, _ = engine.search(q, top_k, backend=backend, **params)
+        timings.append(time.perf_counter() - start)
+        results.append(indices)
+    return results, np.array(timings) * 1000
+
+
+def recall(approx, exact):
+    return np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus_path")
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256, 512])
+    parser.add_argument("--n-lists", type=int, default=None)
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.queries)
+    model = SentenceTransformer(args.model)
+    query_embeddings = model.encode(
+        [preprocess_text(q) for q in queries["query"]],
+        convert_to_tensor=False,
+        batch_size=32
+    )
+
+    engine = DenseSearchEngine.from_frame(
+        load_embedding_frame(args.corpus_path),
+        index_params={"ivf": {"n_lists": args.n_lists}}
+    )
+    print(f"{len(engine)} documents, {len(queries)} queries, k={args.top_k}")
+
+    exact, exact_ms = run(engine, query_embeddings, args.top_k, "exact")
+    rows = [("exact", "-", 1.0, np.percentile(exact_ms, 50), np.percentile(exact_ms, 95))]
+
+    start = time.perf_counter()
+    engine.get_index("ivf")
+    print(f"ivf build: {time.perf_counter() - start:.1f}s")
+    for nprobe in args.nprobe:
+        approx, ms = run(engine, query_embeddings, args.top_k, "ivf", nprobe=nprobe)
+        rows.append(("ivf", f"nprobe={nprobe}", recall(approx, exact), np.percentile(ms, 50), np.percentile(ms, 95)))
+
+    try:
+        start = time.perf_counter()
+        engine.get_index("hnsw")
+        print(f"hnsw build: {time.perf_counter() - start:.1f}s")
+    except ImportError as e:
+        print(f"Skipping hnsw: {e}")
+    else:
+        for ef in args.ef_search:
+            approx, ms = run(engine, query_embeddings, args.top_k, "hnsw", ef_search=ef)
+            rows.append(("hnsw", f"ef_search={ef}", recall(approx, exact), np.percentile(ms, 50), np.percentile(ms, 95)))
+
+    report = pd.DataFrame(rows, columns=["backend", "params", f"recall@{args.top_k}", "p50_ms", "p95_ms"])
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Memory saved and recall lost by the compressed backends (int8 scalar and
+product quantization, with exact re-ranking) against exact search, on
+DEMO_test_queries.csv.
+
+    python benchmarks/compressed_recall.py full_corpus_SBERT_trained --pq-m 48 96 192 --rerank 50 200 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.embedding_store import DEFAULT_MODEL, load_embedding_frame  # noqa: E402
+from shuttle.engine import DenseSearchEngine  # noqa: E402
+from shuttle.index import PQIndex, SQ8Index  # noqa: E402
+from shuttle.text import preprocess_text  # noqa: E402
+
+
+def run(search, query_embeddings, top_k, **params):
+    results, timings = [], []
+    for q in query_embeddings:
+        start = time.perf_counter()
+        indices, _ = search(q, top_k, **params)
+        timings.append(time.perf_counter() - start)
+        results.append(indices)
+    return results, np.array(timings) * 1000
+
+
+def recall(approx, exact):
+    return np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus_path")
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[48, 96, 192])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[50, 200, 1000])
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.queries)
+    model = SentenceTransformer(args.model)
+    query_embeddings = model.encode(
+        [preprocess_text(q) for q in queries["query"]],
+        convert_to_tensor=False,
+        batch_size=32
+    )
+
+    embeddings = load_embedding_frame(args.corpus_path)
+    engine = DenseSearchEngine.from_frame(embeddings)
+    n, dim = engine.matrix.shape
+    float64_bytes = n * dim * 8  # what pandas holds after parsing the CSV parts
+    print(f"{n} documents x {dim} dims, {len(queries)} queries, k={args.top_k}")
+
+    exact, exact_ms = run(lambda q, k: engine.search(q, k, backend="exact"), query_embeddings, args.top_k)
+    rows = [{
+        "backend": "exact float32", "rerank": "-", "MB": engine.matrix.nbytes / 2**20,
+        "x smaller than float64": float64_bytes / engine.matrix.nbytes,
+        f"recall@{args.top_k}": 1.0, "p50_ms": np.percentile(exact_ms, 50), "p95_ms": np.percentile(exact_ms, 95),
+    }]
+
+    indexes = [("sq8", SQ8Index.build(engine.matrix))]
+    for m in args.pq_m:
+        start = time.perf_counter()
+        indexes.append((f"pq m={m}", PQIndex.build(engine.matrix, m=m)))
+        print(f"pq m={m} trained and encoded in {time.perf_counter() - start:.1f}s")
+
+    for name, index in indexes:
+        for rerank in args.rerank:
+            approx, ms = run(
+                lambda q, k, **p: index.search(engine.normalize_query(q), k, **p),
+                query_embeddings, args.top_k, rerank=rerank
+            )
+            rows.append({
+                "backend": name, "rerank": rerank, "MB": index.nbytes / 2**20,
+                "x smaller than float64": float64_bytes / index.nbytes,
+                f"recall@{args.top_k}": recall(approx, exact),
+                "p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95),
+            })
+
+    print("In-memory size of the scored representation; re-ranking reads only the")
+    print("shortlist rows from the memory-mapped store.")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""CrossRef enrichment against a local stand-in for api.crossref.org.
+
+The stand-in answers ``/works/{doi}`` after a simulated network latency,
+returns 404 for a share of DOIs and throttles (429) or fails (503) a share
+of requests, so retries and backoff are exercised. Each run uses a fresh
+response cache and then a second, cached rerun; the one-request-at-a-time
+run approximates the notebook's sequential ``df.apply``.
+
+    python benchmarks/crossref_enrichment.py --dois 2000 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import zlib
+
+import pandas as pd
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.crossref import enrich  # noqa: E402
+
+
+def stand_in_app(latency_ms, not_found, throttled, failed, seed=0):
+    rng = random.Random(seed)
+
+    async def work(request):
+        doi = request.match_info["doi"]
+        await asyncio.sleep(latency_ms / 1000)
+        draw = rng.random()
+        if draw < throttled:
+            return web.json_response({"status": "error"}, status=429, headers={"Retry-After": "0.05"})
+        if draw < throttled + failed:
+            return web.json_response({"status": "error"}, status=503)
+        if zlib.crc32(doi.encode()) % 1000 < not_found * 1000:
+            return web.Response(status=404, text="Resource not found.")
+        return web.json_response({"status": "ok", "message": {
+            "DOI": doi,
+            "is-referenced-by-count": len(doi),
+            "container-title": [f"Journal {len(doi) % 7}"],
+        }})
+
+    app = web.Application()
+    app.router.add_get("/works/{doi:.+}", work)
+    return app
+
+
+def serve_in_background(app, port):
+    """Runs `app` on its own event loop thread; returns once it is listening."""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dois", type=int, default=2000, help="Distinct DOIs (rows repeat some of them)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--rate", type=float, default=0, help="Client rate limit (0: unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--not-found", type=float, default=0.05)
+    parser.add_argument("--throttled", type=float, default=0.02)
+    parser.add_argument("--failed", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    serve_in_background(
+        stand_in_app(args.latency_ms, args.not_found, args.throttled, args.failed), args.port
+    )
+    base_url = f"http://127.0.0.1:{args.port}/works/"
+    dois = [f"10.1000/test.{i}" for i in range(args.dois)]
+    # Duplicate DOIs, as in the metadata, are fetched once
+    frame = pd.DataFrame({"doi": dois + random.Random(1).sample(dois, args.dois // 10)})
+
+    rows = []
+    for concurrency in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "cache.sqlite")
+            for run in ("cold", "cached"):
+                enriched, stats = enrich(
+                    frame, cache_path=cache_path, base_url=base_url,
+                    concurrency=concurrency, rate=args.rate, backoff=0.05
+                )
+                rows.append({
+                    "concurrency": concurrency,
+                    "run": run,
+                    "rows": stats["rows"],
+                    "fetched": stats["fetched"],
+                    "requests": stats["requests"],
+                    "retries": stats["retries"],
+                    "errors": stats["errors"],
+                    "seconds": stats["seconds"],
+                    "requests/sec": stats["requests_per_sec"],
+                    "rows filled": int(enriched["referenced_by_count"].notna().sum()),
+                })
+    print(f"Stand-in latency {args.latency_ms:.0f} ms; {args.throttled:.0%} throttled, "
+          f"{args.failed:.0%} failed, {args.not_found:.0%} unknown DOIs")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Query-encoding throughput under concurrent load: one ``model.encode`` per
+query vs ``MicroBatchEncoder`` at several batching windows.
+
+    python benchmarks/encoder_batching.py --threads 1 8 32 --wait-ms 2 5 10
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.batch_encoder import MicroBatchEncoder  # noqa: E402
+from shuttle.embedding_store import DEFAULT_MODEL  # noqa: E402
+from shuttle.text import preprocess_text  # noqa: E402
+
+
+def load(encode_one, queries, threads):
+    """Encodes every query from `threads` concurrent callers; returns
+    (queries/sec, per-query latencies in ms)."""
+    def timed(query):
+        start = time.perf_counter()
+        encode_one(query)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        timings = list(pool.map(timed, queries))
+        elapsed = time.perf_counter() - start
+    return len(queries) / elapsed, np.asarray(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=4, help="Passes over the query file per run")
+    args = parser.parse_args()
+
+    queries = [preprocess_text(q) for q in pd.read_csv(args.queries)["query"]] * args.repeat
+    model = SentenceTransformer(args.model)
+    encode_batch = lambda texts: model.encode(texts, convert_to_tensor=False)
+    encode_batch(queries[:8])  # warm-up
+
+    rows = []
+    for threads in args.threads:
+        qps, ms = load(lambda q: encode_batch([q]), queries, threads)
+        rows.append({"encoder": "per query", "threads": threads, "queries/sec": qps,
+                     "p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95),
+                     "mean_batch": 1.0, "wait_p95_ms": 0.0})
+        for wait_ms in args.wait_ms:
+            encoder = MicroBatchEncoder(encode_batch, max_batch_size=args.batch_size, max_wait_ms=wait_ms)
+            qps, ms = load(lambda q: encoder([q]), queries, threads)
+            stats = encoder.stats()
+            encoder.close()
+            rows.append({"encoder": f"batched {wait_ms:g}ms", "threads": threads, "queries/sec": qps,
+                         "p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95),
+                         "mean_batch": stats["mean_batch_size"], "wait_p95_ms": stats["queue_wait_p95_ms"]})
+
+    print(f"{len(queries)} encodes per run, max batch {args.batch_size}")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
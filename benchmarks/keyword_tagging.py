@@ -0,0 +1,82 @@
+"""Search-purpose tagging: the notebook's two ``df.apply`` passes vs the
+keyword automaton, single-process and in parallel chunks.
+
+The reference is ``assign_research_tags`` followed by
+``assign_strict_abstract_tags`` as written in ``Search_Purpose_pt1_SE.ipynb``
+(one ``keyword in text`` scan per keyword). Every automaton run must give
+the same tags for every row.
+
+    python benchmarks/keyword_tagging.py metadata_cut_clean.csv --repeat 4 --workers 1 4
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.tagging import ABSTRACT_RULES, TITLE_RULES, tag_documents  # noqa: E402
+
+
+def assign_research_tags(row):
+    title = str(row['title']).lower()
+    return [tag for tag, keywords in TITLE_RULES if any(keyword in title for keyword in keywords)]
+
+
+def assign_strict_abstract_tags(row, initial_tags_col='tags'):
+    if row[initial_tags_col]:
+        return row[initial_tags_col]
+    abstract = str(row['abstract']).lower()
+    return [tag for tag, keywords in ABSTRACT_RULES if any(keyword in abstract for keyword in keywords)]
+
+
+def reference(frame):
+    frame = frame.copy()
+    frame['tags'] = frame.apply(assign_research_tags, axis=1)
+    return frame.apply(assign_strict_abstract_tags, axis=1).tolist()
+
+
+def native_available():
+    return importlib.util.find_spec("ahocorasick") is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="Metadata CSV with title and abstract columns")
+    parser.add_argument("--rows", type=int, default=None, help="Use only the first N rows")
+    parser.add_argument("--repeat", type=int, default=1, help="Concatenate the rows N times")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.input, usecols=["title", "abstract"], nrows=args.rows)
+    frame = pd.concat([frame] * args.repeat, ignore_index=True)
+
+    start = time.perf_counter()
+    expected = reference(frame)
+    baseline = time.perf_counter() - start
+    rows = [{"method": "df.apply (notebook)", "workers": 1, "seconds": baseline,
+             "docs/sec": len(frame) / baseline, "speedup": 1.0, "identical": True}]
+
+    automata = [("pure-Python automaton", False)]
+    if native_available():
+        automata.append(("pyahocorasick automaton", True))
+    for name, native in automata:
+        for workers in args.workers:
+            start = time.perf_counter()
+            tags = tag_documents(frame["title"], frame["abstract"], workers, args.chunk_size, native)
+            elapsed = time.perf_counter() - start
+            rows.append({"method": name, "workers": workers, "seconds": elapsed,
+                         "docs/sec": len(frame) / elapsed, "speedup": baseline / elapsed,
+                         "identical": tags == expected})
+
+    print(f"{len(frame)} documents, {sum(1 for tags in expected if tags)} tagged")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    if not all(row["identical"] for row in rows):
+        sys.exit("Automaton tags differ from the notebook rules")
+
+
+if __name__ == "__main__":
+    main()
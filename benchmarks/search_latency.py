@@ -0,0 +1,86 @@
+"""Per-query latency of the old DataFrame/cosine_similarity path vs DenseSearchEngine.
+
+Runs on synthetic embeddings at the current corpus size and at 10x / 100x,
+and checks that both paths return the same top-k (up to the order of
+documents whose float32 and float64 scores tie).
+
+    python benchmarks/search_latency.py --docs 30000 --scales 1 10 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.engine import DenseSearchEngine  # noqa: E402
+
+
+def baseline_search(query_embedding, corpus, top_k):
+    # Mirrors the original app.search(): column copy + cosine_similarity + full argsort
+    doc_embeddings = corpus[list(range(len(query_embedding)))].values
+    similarities = cosine_similarity(query_embedding.reshape(1, -1), doc_embeddings)[0]
+    top_indices = similarities.argsort()[-top_k:][::-1]
+    return top_indices, similarities[top_indices]
+
+
+def time_calls(fn, queries, repeats):
+    timings = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            fn(q)
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=30000, help="Current corpus size")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--top-k", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline-max-docs", type=int, default=1_000_000,
+                        help="Skip the float64 DataFrame baseline above this size (memory)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    print(f"{'docs':>10} {'path':>10} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8}")
+    for scale in args.scales:
+        n = args.docs * scale
+        vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+        engine = DenseSearchEngine(vectors)
+        fast = time_calls(lambda q: engine.search(q, args.top_k), queries, args.repeats)
+
+        if n <= args.baseline_max_docs:
+            corpus = pd.DataFrame(vectors.astype(np.float64))
+            # Non-numeric metadata columns force the mixed-dtype copy seen in the app
+            corpus["title"] = "x"
+            slow = time_calls(lambda q: baseline_search(q, corpus, args.top_k), queries, 1)
+
+            for q in queries[:5]:
+                expected, expected_scores = baseline_search(q, corpus, args.top_k)
+                got, scores = engine.search(q, args.top_k)
+                # float32 vs float64 may swap documents whose scores tie to ~1e-7
+                same_scores = np.allclose(expected_scores, scores, atol=1e-5)
+                if not (np.array_equal(np.sort(expected), np.sort(got)) and same_scores):
+                    overlap = len(np.intersect1d(expected, got))
+                    print(f"  warning: ranking differs at {n} docs ({overlap}/{args.top_k} shared)")
+            print(f"{n:>10} {'baseline':>10} {np.percentile(slow, 50):9.2f} {np.percentile(slow, 95):9.2f} {'':>8}")
+            speedup = f"{np.percentile(slow, 50) / np.percentile(fast, 50):7.1f}x"
+            del corpus
+        else:
+            speedup = "n/a"
+        print(f"{n:>10} {'engine':>10} {np.percentile(fast, 50):9.2f} {np.percentile(fast, 95):9.2f} {speedup:>8}")
+        del vectors, engine
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Load test for a running ``shuttle.service``: concurrent clients replay the
+demo queries against /search (or /batch_search) and report throughput and
+latency percentiles.
+
+    python -m shuttle.service full_corpus_SBERT_trained &
+    python benchmarks/service_load.py --concurrency 1 8 32 --requests 500
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+
+async def client(session, url, bodies, counter, total, timings, errors):
+    while next(counter) < total:
+        body = next(bodies)
+        start = time.perf_counter()
+        try:
+            async with session.post(url, json=body) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(type(e).__name__)
+            continue
+        timings.append(time.perf_counter() - start)
+
+
+async def run(base_url, bodies, endpoint, concurrency, total):
+    timings, errors = [], []
+    counter = itertools.count()
+    body_cycle = itertools.cycle(bodies)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client(session, base_url + endpoint, body_cycle, counter, total, timings, errors)
+            for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+    ms = np.asarray(timings) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests/sec": len(timings) / elapsed,
+        "p50_ms": np.percentile(ms, 50) if len(ms) else np.nan,
+        "p95_ms": np.percentile(ms, 95) if len(ms) else np.nan,
+        "p99_ms": np.percentile(ms, 99) if len(ms) else np.nan,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--mode", default="dense")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Send /batch_search requests of this many queries instead of /search")
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.queries)["query"].tolist()
+    options = {"top_k": args.top_k, "mode": args.mode}
+    if args.batch_size:
+        endpoint = "/batch_search"
+        bodies = [
+            {"queries": queries[i:i + args.batch_size], **options}
+            for i in range(0, len(queries), args.batch_size)
+        ]
+    else:
+        endpoint = "/search"
+        bodies = [{"query": q, **options} for q in queries]
+
+    print(f"{endpoint}: {len(queries)} distinct queries, {args.requests} requests per level")
+    rows = [asyncio.run(run(args.url.rstrip("/"), bodies, endpoint, c, args.requests)) for c in args.concurrency]
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Cold-start time of ``Retriever.load`` from the raw CSV parts vs the
+prebuilt startup bundle.
+
+Every run times the whole ``Retriever.load`` (corpus, search engine, filter
+index, BM25, caches) in a fresh interpreter, so nothing is reused between
+runs except the operating system's file cache:
+
+* ``csv`` - a clean copy of only the metadata and embedding CSV parts, as
+  before any of the prebuilt stores or indexes existed
+* ``no_bundle`` - the corpus directory with the bundle disabled (Parquet
+  metadata store, embedding store and persisted indexes, where present)
+* ``bundle`` - the corpus directory with its bundle, which is built first
+  if missing or stale
+
+The sentence-transformer is replaced by a stub so the numbers measure the
+corpus load, not the model download or torch import, which every method
+pays alike.
+
+    python benchmarks/startup_time.py full_corpus_SBERT_trained --repeats 3
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shuttle.bundle import build_bundle, load_bundle  # noqa: E402
+from shuttle.core import EMBEDDING_DIM, EMBEDDING_FILES, METADATA_FILES, MODEL_NAME, Retriever  # noqa: E402
+
+METHODS = ("csv", "no_bundle", "bundle")
+
+
+class StubModel:
+    """Stands in for the sentence-transformer; never called while timing."""
+
+    def encode(self, texts, convert_to_tensor=False):
+        return np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+
+
+def load(method, corpus_path):
+    """Seconds for ``Retriever.load`` with `method`, and for its first query."""
+    start = time.perf_counter()
+    retriever = Retriever.load(corpus_path, MODEL_NAME, model=StubModel(), query_cache_path=None,
+                               reranker_model=None, use_bundle=method == "bundle")
+    elapsed = time.perf_counter() - start
+
+    # First query: with the bundle or store this pages the vectors in
+    query = np.random.default_rng(0).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    start = time.perf_counter()
+    retriever.engine.search(query, 50)
+    first_query = time.perf_counter() - start
+    return {"load_s": elapsed, "first_query_s": first_query, "documents": len(retriever.corpus)}
+
+
+def csv_copy(corpus_path, out_path):
+    """Copies only the CSV parts, so nothing prebuilt is picked up."""
+    for f in METADATA_FILES + EMBEDDING_FILES:
+        shutil.copy2(os.path.join(corpus_path, f), os.path.join(out_path, f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus_path")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(load(args.child, args.corpus_path)))
+        return
+
+    if load_bundle(args.corpus_path, MODEL_NAME) is None:
+        start = time.perf_counter()
+        build_bundle(args.corpus_path, MODEL_NAME)
+        print(f"Built the bundle in {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as clean:
+        csv_copy(args.corpus_path, clean)
+        for method in METHODS:
+            corpus_path = clean if method == "csv" else args.corpus_path
+            runs = []
+            for _ in range(args.repeats):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), corpus_path, "--child", method],
+                    check=True, capture_output=True, text=True
+                )
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            results[method] = runs
+            load_s = [r["load_s"] for r in runs]
+            first_query_ms = [1000 * r["first_query_s"] for r in runs]
+            print(f"{method:10s} {runs[0]['documents']} docs: load median {np.median(load_s):.2f}s "
+                  f"(min {min(load_s):.2f}s), first query median {np.median(first_query_ms):.1f} ms")
+
+    bundle_s = np.median([r["load_s"] for r in results["bundle"]])
+    for method in ("csv", "no_bundle"):
+        print(f"bundle loads {np.median([r['load_s'] for r in results[method]]) / bundle_s:.1f}x faster than {method}")
+
+
+if __name__ == "__main__":
+    main()
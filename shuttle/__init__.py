@@ -0,0 +1 @@
+"""Retrieval core for the Shuttle document search engine."""
@@ -0,0 +1,139 @@
+"""Micro-batching query encoder.
+
+Concurrent searches (Streamlit sessions, service requests) each need one
+query embedding; encoding them one string at a time leaves most of the
+transformer's CPU throughput unused. ``MicroBatchEncoder`` queues single
+encodes, and a worker thread gathers whatever arrives within ``max_wait_ms``
+of the first queued query (up to ``max_batch_size``) into one forward pass,
+then hands each caller its row.
+
+It is a drop-in ``encode_batch`` (list of texts -> 2-D array), so it sits
+under ``QueryEmbeddingCache`` and only cache misses reach the model::
+
+    encoder = MicroBatchEncoder(lambda texts: model.encode(texts, convert_to_tensor=False))
+    cache = QueryEmbeddingCache(encoder, model_name)
+
+``stats()`` reports batch sizes, queue wait and throughput.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatchEncoder:
+    """Batches concurrent `encode_batch` calls into shared forward passes."""
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0, window=10000):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        # Metrics over the last `window` batches/requests
+        self.batch_sizes = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+        self.encode_times = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.started = None
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="micro-batch-encoder", daemon=True)
+        self._worker.start()
+
+    def __call__(self, texts):
+        return self.encode(texts)
+
+    def submit(self, text):
+        """Queues one text; the returned Future resolves to its embedding."""
+        request = _Request(text)
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts):
+        """Embeddings for `texts` (2-D array), encoded alongside concurrent callers."""
+        futures = [self.submit(text) for text in texts]
+        if not futures:
+            return np.asarray(self.encode_batch([]))
+        return np.stack([f.result() for f in futures])
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first):
+        """The batch opened by `first`: everything queued until its window
+        closes or the batch is full. Returns (batch, stop)."""
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # A backlog built up during the previous forward pass is
+                # drained without waiting
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+
+            start = time.perf_counter()
+            try:
+                vectors = np.asarray(self.encode_batch([r.text for r in batch]))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                if self.started is None:
+                    self.started = first.enqueued
+                self.requests += len(batch)
+                self.batches += 1
+                self.batch_sizes.append(len(batch))
+                self.encode_times.append(elapsed)
+                self.queue_waits.extend(start - r.enqueued for r in batch)
+            for request, vector in zip(batch, vectors):
+                request.future.set_result(vector)
+
+    def stats(self):
+        with self._lock:
+            sizes = np.asarray(self.batch_sizes, dtype=np.float64)
+            waits = np.asarray(self.queue_waits) * 1000
+            encode_secs = float(np.sum(self.encode_times))
+            elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": float(sizes.mean()) if len(sizes) else 0.0,
+                "max_batch_size": int(sizes.max()) if len(sizes) else 0,
+                "queue_wait_p50_ms": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "queue_wait_p95_ms": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                "mean_encode_ms": 1000 * encode_secs / len(self.encode_times) if self.encode_times else 0.0,
+                # Over the metrics window vs since the first request
+                "encode_queries_per_sec": float(sizes.sum()) / encode_secs if encode_secs else 0.0,
+                "queries_per_sec": self.requests / elapsed if elapsed else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
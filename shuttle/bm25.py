@@ -0,0 +1,227 @@
+"""BM25 inverted index over title + summarised abstract.
+
+Posting lists are stored CSR-style: for term ``t`` the slice
+``offsets[t]:offsets[t + 1]`` of ``docs`` (int32 row numbers, ascending) and
+``impacts`` (float32) holds every document containing the term together with
+its precomputed BM25 contribution. A query is then just a sum of impact
+slices.
+
+Queries are evaluated term-at-a-time in decreasing order of each term's
+maximum impact with MaxScore-style pruning: once the k-th best accumulated
+score exceeds the summed maxima of the terms still to process, no unseen
+document can reach the top k, so the remaining terms only update the
+existing candidates that can still make it.
+
+Build and persist the index with::
+
+    python -m shuttle.bm25 full_corpus_SBERT_trained
+"""
+import argparse
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from shuttle.engine import top_k_indices
+from shuttle.tag_index import METADATA_FILES
+
+BM25_INDEX_FILE = "bm25_index.npz"
+TEXT_COLUMNS = ["title", "summarised_abstracts"]
+
+# Small English stop list: these terms occur in most documents, carry almost
+# no BM25 weight and have the longest posting lists
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had has
+have how if in into is it its may more most no not of on or other our over should so such than that
+the their them then there these they this those through to under was we were what when where which
+while who why will with would
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def document_text(frame):
+    """The text BM25 indexes for each row: title and summarised abstract."""
+    return (frame["title"].fillna("") + " " + frame["summarised_abstracts"].fillna("")).tolist()
+
+
+class BM25Index:
+    """BM25 postings with precomputed impacts over a fixed document order."""
+
+    def __init__(self, ids, vocab, offsets, docs, impacts):
+        self.ids = np.asarray(ids)
+        self.vocab = list(vocab)
+        self.term_ids = {term: t for t, term in enumerate(self.vocab)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.docs = np.asarray(docs, dtype=np.int32)
+        self.impacts = np.asarray(impacts, dtype=np.float32)
+        # Upper bound of each term's contribution, for MaxScore pruning
+        self.max_impacts = np.zeros(len(self.vocab), dtype=np.float32)
+        nonempty = self.offsets[1:] > self.offsets[:-1]
+        self.max_impacts[nonempty] = np.maximum.reduceat(self.impacts, self.offsets[:-1][nonempty])
+
+    @classmethod
+    def build(cls, ids, texts, k1=1.2, b=0.75):
+        term_ids = {}
+        doc_terms = []
+        lengths = np.empty(len(texts), dtype=np.float32)
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[i] = sum(counts.values())
+            doc_terms.append({term_ids.setdefault(term, len(term_ids)): tf for term, tf in counts.items()})
+
+        # Flatten to (term, doc, tf) triples and group by term
+        n_postings = sum(len(d) for d in doc_terms)
+        terms = np.empty(n_postings, dtype=np.int32)
+        docs = np.empty(n_postings, dtype=np.int32)
+        tfs = np.empty(n_postings, dtype=np.float32)
+        pos = 0
+        for i, d in enumerate(doc_terms):
+            end = pos + len(d)
+            terms[pos:end] = list(d.keys())
+            tfs[pos:end] = list(d.values())
+            docs[pos:end] = i
+            pos = end
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+
+        n_docs = len(texts)
+        df = np.bincount(terms, minlength=len(term_ids))
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = lengths.mean() if n_docs else 0
+        norm = k1 * (1 - b + b * lengths[docs] / max(avgdl, 1e-9))
+        impacts = idf[terms] * tfs * (k1 + 1) / (tfs + norm)
+
+        offsets = np.concatenate([[0], np.cumsum(df)])
+        vocab = [None] * len(term_ids)
+        for term, t in term_ids.items():
+            vocab[t] = term
+        return cls(ids, vocab, offsets, docs, impacts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, top_k=50, mask=None):
+        """Returns (row indices, BM25 scores) of the `top_k` best matches,
+        best first. Only documents matching at least one query term are
+        returned; `mask` restricts results to rows where it is True."""
+        terms = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not terms or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        terms.sort(key=lambda t: -self.max_impacts[t])
+        # remaining[i]: best score a document could still gain from terms i..end
+        remaining = np.cumsum(self.max_impacts[terms][::-1])[::-1]
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        candidates = np.empty(0, dtype=np.int32)
+        for i, t in enumerate(terms):
+            docs = self.docs[self.offsets[t]:self.offsets[t + 1]]
+            impacts = self.impacts[self.offsets[t]:self.offsets[t + 1]]
+            if mask is not None:
+                keep = mask[docs]
+                docs, impacts = docs[keep], impacts[keep]
+
+            threshold = self._kth_score(scores, candidates, top_k)
+            if threshold > remaining[i]:
+                # Unseen documents can no longer reach the top k: drop them,
+                # and only keep candidates still within reach of the threshold
+                candidates = candidates[scores[candidates] + remaining[i] >= threshold]
+                keep = np.isin(docs, candidates, assume_unique=True)
+                docs, impacts = docs[keep], impacts[keep]
+            else:
+                candidates = np.union1d(candidates, docs)
+            scores[docs] += impacts
+
+        best = top_k_indices(scores[candidates], top_k)
+        rows = candidates[best].astype(np.int64)
+        return rows, scores[rows]
+
+    @staticmethod
+    def _kth_score(scores, candidates, k):
+        if len(candidates) < k:
+            return 0.0
+        return np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+
+    def align(self, ids):
+        """Re-numbers rows to positions in `ids` (documents not in it are dropped)."""
+        ids = pd.Index(ids)
+        if ids.equals(pd.Index(self.ids)):
+            return self
+        new_rows = ids.get_indexer(self.ids)
+        mapped = new_rows[self.docs]
+        keep = mapped >= 0
+        term_of = np.repeat(np.arange(len(self.vocab)), np.diff(self.offsets))[keep]
+        mapped, impacts = mapped[keep], self.impacts[keep]
+        order = np.lexsort((mapped, term_of))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_of, minlength=len(self.vocab)))])
+        return BM25Index(ids.to_numpy(), self.vocab, offsets, mapped[order], impacts[order])
+
+    def save(self, path):
+        np.savez(
+            path,
+            ids=self.ids.astype(str),
+            vocab=np.array(self.vocab, dtype=str),
+            offsets=self.offsets,
+            docs=self.docs,
+            impacts=self.impacts,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["ids"], data["vocab"].tolist(), data["offsets"], data["docs"], data["impacts"])
+
+
+def load_bm25_index(corpus_path, metadata_files=METADATA_FILES):
+    """The persisted BM25 index for a corpus directory, or None when it is
+    missing or older than any of the metadata files."""
+    path = os.path.join(corpus_path, BM25_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    built = os.path.getmtime(path)
+    for f in metadata_files:
+        meta_path = os.path.join(corpus_path, f)
+        if os.path.exists(meta_path) and os.path.getmtime(meta_path) > built:
+            return None
+    return BM25Index.load(path)
+
+
+def build_from_corpus(corpus_path, metadata_files=METADATA_FILES, k1=1.2, b=0.75):
+    """Builds a BM25 index from the metadata store, or the CSV parts if there is none."""
+    from shuttle.metadata_store import open_metadata_store
+
+    store = open_metadata_store(corpus_path, metadata_files)
+    if store is not None:
+        frame = store.read(TEXT_COLUMNS)
+    else:
+        frame = pd.concat([
+            pd.read_csv(os.path.join(corpus_path, p), usecols=["cord_uid"] + TEXT_COLUMNS, index_col="cord_uid")
+            for p in metadata_files
+        ])
+    return BM25Index.build(frame.index.astype(str).to_numpy(), document_text(frame), k1=k1, b=b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the BM25 index from the corpus metadata.")
+    parser.add_argument("corpus_path", help="Directory holding the metadata store or metadata_part*_final.csv")
+    parser.add_argument("--parts", nargs="+", default=METADATA_FILES)
+    parser.add_argument("--k1", type=float, default=1.2)
+    parser.add_argument("--b", type=float, default=0.75)
+    args = parser.parse_args()
+
+    index = build_from_corpus(args.corpus_path, args.parts, k1=args.k1, b=args.b)
+    out_path = os.path.join(args.corpus_path, BM25_INDEX_FILE)
+    index.save(out_path)
+    print(f"Wrote BM25 index ({len(index.vocab)} terms, {len(index.docs)} postings) to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Paginated browsing of the documents matching the filters ('*' queries).
+
+A ``BrowseCursor`` holds only the matching row numbers, in one of the
+precomputed ``FilterIndex`` orderings; metadata and display text are read
+for one page at a time, and ``csv_chunks`` writes the CSV export page by
+page, so browsing everything costs memory in proportion to the page size
+rather than the corpus.
+"""
+import math
+
+from shuttle.results import display_frame, to_csv
+
+
+class BrowseCursor:
+    """Pages of documents; `fetch(rows)` returns the result frame for a
+    sequence of corpus row numbers."""
+
+    def __init__(self, rows, fetch, page_size=50):
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        self.rows = rows
+        self.fetch = fetch
+        self.page_size = page_size
+
+    @property
+    def total(self):
+        return len(self.rows)
+
+    @property
+    def pages(self):
+        return math.ceil(self.total / self.page_size)
+
+    def page(self, number):
+        """Result frame for page `number` (0-based); empty past the end."""
+        start = number * self.page_size
+        return self.fetch(self.rows[start:start + self.page_size])
+
+    def __iter__(self):
+        for number in range(self.pages):
+            yield self.page(number)
+
+    def csv_chunks(self):
+        """The whole result set as CSV text in the app's download layout,
+        one chunk per page."""
+        # At least one page, so an empty result still gets a header
+        for number in range(max(self.pages, 1)):
+            page = display_frame(self.page(number), first_rank=number * self.page_size + 1)
+            yield to_csv(page, header=number == 0)
@@ -0,0 +1,236 @@
+"""Parallel, resumable encoding of the whole corpus into the binary store.
+
+Replaces the notebook's single ``model.encode(texts_to_encode)`` call, which
+holds every embedding in RAM and has to start over if it dies::
+
+    python -m shuttle.bulk_encode full_corpus_SBERT_trained --workers 4 --threads 2
+
+The metadata CSVs are streamed in shards of ``--shard-size`` rows. Each shard
+goes to a pool of worker processes, each of which loads the model once,
+sorts the shard's texts by token length so batches pad as little as
+possible, and returns the shard's embeddings. The parent writes each shard
+straight into its rows of a preallocated ``vectors.bin`` and records it in
+``encode_progress.json``; rerunning the same command after a crash skips
+the recorded shards. The store header is written last, so readers keep
+treating the store as incomplete until every shard is in.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from shuttle.embedding_store import (
+    DEFAULT_MODEL, HEADER_FILE, IDS_FILE, STORE_DIRNAME, SUPPORTED_DTYPES, VECTORS_FILE, write_header
+)
+from shuttle.engine import l2_normalize
+from shuttle.segments import encoding_text
+from shuttle.tag_index import METADATA_FILES
+
+PROGRESS_FILE = "encode_progress.json"
+TEXT_COLUMNS = ["cord_uid", "title", "summarised_abstracts", "combined_sum_text"]
+
+_model = None
+
+
+def _init_worker(model_name, threads):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_shard(number, texts, batch_size):
+    """Embeds one shard in token-length order; returns (number, vectors,
+    tokens, padded tokens)."""
+    lengths = np.array([
+        len(ids) for ids in _model.tokenizer(
+            texts, truncation=True, max_length=_model.max_seq_length
+        )["input_ids"]
+    ])
+    order = np.argsort(lengths, kind="stable")
+    vectors = None
+    padded = 0
+    for start in range(0, len(texts), batch_size):
+        batch = order[start:start + batch_size]
+        embedded = _model.encode([texts[i] for i in batch], batch_size=len(batch), convert_to_tensor=False)
+        if vectors is None:
+            vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+        vectors[batch] = embedded
+        padded += len(batch) * int(lengths[batch].max())
+    return number, vectors, int(lengths.sum()), padded
+
+
+def scan_ids(metadata_paths):
+    """cord_uids of every metadata row, in file order."""
+    return pd.concat([
+        pd.read_csv(p, usecols=["cord_uid"])["cord_uid"].astype(str) for p in metadata_paths
+    ]).tolist()
+
+
+def iter_shards(metadata_paths, shard_size):
+    """Yields (shard number, first row, texts) over the metadata CSVs with
+    every shard exactly `shard_size` rows except the last."""
+    number, row, carry = 0, 0, []
+    for path in metadata_paths:
+        chunks = pd.read_csv(path, usecols=lambda c: c in TEXT_COLUMNS, chunksize=shard_size)
+        for chunk in chunks:
+            carry.extend(encoding_text(chunk))
+            while len(carry) >= shard_size:
+                yield number, row, carry[:shard_size]
+                number, row, carry = number + 1, row + shard_size, carry[shard_size:]
+    if carry:
+        yield number, row, carry
+
+
+def _read_progress(out_path):
+    path = os.path.join(out_path, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_progress(out_path, progress):
+    path = os.path.join(out_path, PROGRESS_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+
+def encode_corpus(metadata_paths, out_path, model_name=DEFAULT_MODEL, workers=2, threads=1,
+                  shard_size=4096, batch_size=32, dtype="float32", normalize=True, restart=False, log=print):
+    """Encodes every metadata row into the store at `out_path`, resuming a
+    previous run with the same settings. Returns the store header."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+    os.makedirs(out_path, exist_ok=True)
+    settings = {
+        "parts": [os.path.abspath(p) for p in metadata_paths],
+        "model": model_name,
+        "shard_size": shard_size,
+        "dtype": dtype,
+        "normalized": normalize,
+    }
+    progress = None if restart else _read_progress(out_path)
+    if progress is not None and progress["settings"] != settings:
+        raise ValueError(
+            f"{out_path} holds a partial run with different settings {progress['settings']}; "
+            "rerun with the same settings or pass --restart"
+        )
+
+    if progress is None:
+        header_path = os.path.join(out_path, HEADER_FILE)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        ids = scan_ids(metadata_paths)
+        with open(os.path.join(out_path, IDS_FILE), "w") as f:
+            f.writelines(f"{doc_id}\n" for doc_id in ids)
+        progress = {"settings": settings, "count": len(ids), "dim": None, "done": []}
+        _write_progress(out_path, progress)
+
+    count = progress["count"]
+    done = set(progress["done"])
+    vectors_path = os.path.join(out_path, VECTORS_FILE)
+    matrix = None
+    if progress["dim"] is not None:
+        matrix = np.memmap(vectors_path, dtype=dtype, mode="r+", shape=(count, progress["dim"]))
+    if done:
+        log(f"Resuming: {len(done)} shards already encoded")
+
+    starts = {}
+    encoded = tokens = padded = 0
+    started = time.perf_counter()
+
+    def store(result):
+        nonlocal matrix, encoded, tokens, padded
+        number, vectors, shard_tokens, shard_padded = result
+        if matrix is None:
+            progress["dim"] = vectors.shape[1]
+            matrix = np.memmap(vectors_path, dtype=dtype, mode="w+", shape=(count, progress["dim"]))
+        if normalize:
+            vectors = l2_normalize(vectors)
+        start = starts.pop(number)
+        matrix[start:start + len(vectors)] = vectors
+        matrix.flush()
+        # Recorded only once its rows are on disk, so a crash redoes the shard
+        done.add(number)
+        progress["done"] = sorted(done)
+        _write_progress(out_path, progress)
+
+        encoded += len(vectors)
+        tokens += shard_tokens
+        padded += shard_padded
+        elapsed = time.perf_counter() - started
+        log(f"shard {number}: {len(done)} shards, {encoded} docs this run, {encoded / elapsed:.1f} docs/sec")
+
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(model_name, threads)) as pool:
+        pending = set()
+        for number, start, texts in iter_shards(metadata_paths, shard_size):
+            if number in done:
+                continue
+            # Bound the shards held in memory
+            while len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    store(future.result())
+            starts[number] = start
+            pending.add(pool.submit(_encode_shard, number, texts, batch_size))
+        for future in wait(pending).done:
+            store(future.result())
+
+    if matrix is None:
+        raise ValueError("No metadata rows found in the given CSV parts")
+    del matrix
+    header = write_header(out_path, count, progress["dim"], dtype, model_name, normalize)
+    os.remove(os.path.join(out_path, PROGRESS_FILE))
+
+    elapsed = time.perf_counter() - started
+    if encoded:
+        log(
+            f"Encoded {encoded} docs in {elapsed:.1f}s ({encoded / elapsed:.1f} docs/sec); "
+            f"padding overhead {padded / max(tokens, 1) - 1:.1%} of {tokens} tokens"
+        )
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode the corpus metadata into the binary embedding store.")
+    parser.add_argument("corpus_path", help="Directory holding metadata_part*_final.csv")
+    parser.add_argument("--parts", nargs="+", default=METADATA_FILES)
+    parser.add_argument("--out", default=None, help=f"Output directory (default: <corpus_path>/{STORE_DIRNAME})")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--workers", type=int, default=2, help="Encoder processes")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per encoder process")
+    parser.add_argument("--shard-size", type=int, default=4096, help="Rows per checkpointed shard")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float32")
+    parser.add_argument("--no-normalize", action="store_true", help="Store the raw (not unit-length) embeddings")
+    parser.add_argument("--restart", action="store_true", help="Discard a partial run instead of resuming it")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(args.corpus_path, STORE_DIRNAME)
+    header = encode_corpus(
+        [os.path.join(args.corpus_path, p) for p in args.parts],
+        out_path,
+        model_name=args.model,
+        workers=args.workers,
+        threads=args.threads,
+        shard_size=args.shard_size,
+        batch_size=args.batch_size,
+        dtype=args.dtype,
+        normalize=not args.no_normalize,
+        restart=args.restart,
+    )
+    print(f"Wrote {header['count']} x {header['dim']} {header['dtype']} embeddings to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
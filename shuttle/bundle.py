@@ -0,0 +1,193 @@
+"""Startup snapshot: everything ``Retriever.load`` derives from the raw
+corpus files, prebuilt into one versioned bundle directory.
+
+Building the corpus from the CSV parts parses dates, ``literal_eval``s the
+tags, coerces 768 embedding columns and merges metadata with embeddings on
+every cold start. The bundle stores the result once::
+
+    python -m shuttle.bundle full_corpus_SBERT_trained
+
+``<corpus>/bundle/`` then holds, aligned row for row:
+
+* ``ids.npy`` - cord_uids
+* ``vectors.npy`` - L2-normalised float32 embeddings, memory-mapped at load
+* ``publish_time.npy`` and ``referenced_by_count.npy`` - the filter columns
+* ``tag_index.npz`` - the tag index
+* ``bm25_index.npz`` - the BM25 postings (``python -m shuttle.bm25``'s
+  index when current, otherwise built over the bundle's documents)
+* ``bundle.json`` - format version, model, corpus version, sidebar stats
+  (date range, max citations) and a fingerprint of the source files
+
+``load_bundle`` returns None when the bundle is missing, was built for
+another model or format, or its source files (the metadata and embedding
+parts, ``<corpus>/tag_index.npz``, e.g. after ``python -m
+shuttle.purpose_classifier``, and ``<corpus>/bm25_index.npz``) changed
+since, and the
+retriever falls back to ``load_corpus``. Display text still comes from
+the Parquet metadata store, which the build creates if needed; the tag
+index it refreshes on the way keeps every tag of the existing
+``tag_index.npz`` (see ``shuttle.tag_index.save_tag_index``).
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from shuttle.bm25 import BM25_INDEX_FILE, TEXT_COLUMNS, BM25Index, document_text, load_bm25_index
+from shuttle.embedding_store import DEFAULT_MODEL, EMBEDDING_FILES, embedding_fingerprint
+from shuttle.engine import l2_normalize
+from shuttle.metadata_store import METADATA_STORE_FILE, convert_csv_parts, open_metadata_store
+from shuttle.tag_index import METADATA_FILES, TAG_INDEX_FILE, TagIndex, load_tag_index, save_tag_index
+
+BUNDLE_DIRNAME = "bundle"
+BUNDLE_FILE = "bundle.json"
+FORMAT_VERSION = 2
+FILTER_COLUMNS = ["publish_time", "referenced_by_count"]
+
+
+def bundle_path(corpus_path):
+    return os.path.join(corpus_path, BUNDLE_DIRNAME)
+
+
+def source_fingerprint(corpus_path, metadata_files=METADATA_FILES, embedding_files=EMBEDDING_FILES):
+    """Sizes and modification times of the files a bundle is built from,
+    including the persisted tag and BM25 indexes, which can be rewritten
+    without touching the metadata."""
+    metadata = [os.path.join(corpus_path, f) for f in list(metadata_files) + [TAG_INDEX_FILE, BM25_INDEX_FILE]]
+    return ";".join([embedding_fingerprint(corpus_path, embedding_files)] + [
+        f"{os.path.basename(f)}:{os.path.getsize(f)}:{os.path.getmtime(f):.0f}"
+        for f in metadata if os.path.exists(f)
+    ])
+
+
+class Bundle:
+    def __init__(self, path, header, ids, vectors, corpus, tag_index, bm25):
+        self.path = path
+        self.header = header
+        self.ids = ids
+        self.vectors = vectors
+        # Filter columns indexed by cord_uid, in bundle row order
+        self.corpus = corpus
+        self.tag_index = tag_index
+        self.bm25 = bm25
+
+    @property
+    def stats(self):
+        """Sidebar stats: min_date and max_date (dates) and max_refs."""
+        stats = self.header["stats"]
+        return {
+            "min_date": pd.Timestamp(stats["min_date"]).date(),
+            "max_date": pd.Timestamp(stats["max_date"]).date(),
+            "max_refs": stats["max_refs"],
+        }
+
+
+def build_bundle(corpus_path, model_name=DEFAULT_MODEL, metadata_files=METADATA_FILES,
+                 embedding_files=EMBEDDING_FILES):
+    """Builds the bundle from the corpus files and publishes it atomically
+    (readers see the old bundle or the new one). Returns its header."""
+    from shuttle.core import EMBEDDING_DIM, load_corpus, open_store
+
+    metadata_store = open_metadata_store(corpus_path, metadata_files)
+    if metadata_store is None:
+        raw_tags = convert_csv_parts(
+            [os.path.join(corpus_path, f) for f in metadata_files],
+            os.path.join(corpus_path, METADATA_STORE_FILE)
+        )
+    elif load_tag_index(corpus_path, metadata_files) is None:
+        raw_tags = TagIndex.from_strings(metadata_store.ids, metadata_store.read(['tags'])['tags'])
+    else:
+        raw_tags = None
+    if raw_tags is not None:
+        # Merged into the existing file, so predicted purpose tags survive
+        save_tag_index(corpus_path, raw_tags)
+    fingerprint = source_fingerprint(corpus_path, metadata_files, embedding_files)
+    corpus, tag_index = load_corpus(corpus_path, metadata_files, embedding_files, model_name)
+
+    out = bundle_path(corpus_path)
+    tmp = f"{out}.tmp-{os.getpid()}"
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "ids.npy"), corpus.index.to_numpy(dtype=str))
+    store = open_store(corpus_path)
+    if store is not None:
+        # The corpus rows follow the store; its memmap is copied, not parsed
+        vectors = store.vectors if store.normalized else l2_normalize(store.vectors)
+    else:
+        vectors = l2_normalize(corpus[list(range(EMBEDDING_DIM))].to_numpy())
+    np.save(os.path.join(tmp, "vectors.npy"), np.asarray(vectors, dtype=np.float32))
+    np.save(os.path.join(tmp, "publish_time.npy"), corpus["publish_time"].to_numpy(dtype="datetime64[ns]"))
+    np.save(os.path.join(tmp, "referenced_by_count.npy"), corpus["referenced_by_count"].to_numpy(dtype=np.float64))
+    tag_index.align(corpus.index).save(os.path.join(tmp, TAG_INDEX_FILE))
+    bm25 = load_bm25_index(corpus_path, metadata_files)
+    if bm25 is None:
+        # As Retriever.load builds it: over the embedded documents only
+        texts = open_metadata_store(corpus_path, metadata_files).take(corpus.index, TEXT_COLUMNS)
+        bm25 = BM25Index.build(corpus.index.astype(str).to_numpy(), document_text(texts))
+    bm25.align(corpus.index).save(os.path.join(tmp, BM25_INDEX_FILE))
+
+    header = {
+        "format": FORMAT_VERSION,
+        "model": model_name,
+        "version": corpus.attrs["version"],
+        "count": len(corpus),
+        "dim": EMBEDDING_DIM,
+        "stats": {
+            "min_date": corpus["publish_time"].min().isoformat(),
+            "max_date": corpus["publish_time"].max().isoformat(),
+            "max_refs": int(corpus["referenced_by_count"].max()),
+        },
+        "sources": fingerprint,
+    }
+    with open(os.path.join(tmp, BUNDLE_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    old = f"{out}.old-{os.getpid()}"
+    if os.path.exists(out):
+        os.rename(out, old)
+    os.rename(tmp, out)
+    shutil.rmtree(old, ignore_errors=True)
+    return header
+
+
+def load_bundle(corpus_path, model_name=DEFAULT_MODEL, metadata_files=METADATA_FILES,
+                embedding_files=EMBEDDING_FILES):
+    """The corpus bundle with its vectors memory-mapped, or None when there
+    is no bundle usable for `model_name` and the current source files."""
+    path = bundle_path(corpus_path)
+    try:
+        with open(os.path.join(path, BUNDLE_FILE)) as f:
+            header = json.load(f)
+    except FileNotFoundError:
+        return None
+    if header.get("format") != FORMAT_VERSION or header.get("model") != model_name:
+        return None
+    if header["sources"] != source_fingerprint(corpus_path, metadata_files, embedding_files):
+        return None
+
+    ids = np.load(os.path.join(path, "ids.npy"))
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+    index = pd.Index(ids.astype(object), name="cord_uid")
+    corpus = pd.DataFrame({
+        column: np.load(os.path.join(path, f"{column}.npy")) for column in FILTER_COLUMNS
+    }, index=index)
+    corpus.attrs["version"] = header["version"]
+    tag_index = TagIndex.load(os.path.join(path, TAG_INDEX_FILE))
+    bm25 = BM25Index.load(os.path.join(path, BM25_INDEX_FILE))
+    return Bundle(path, header, ids, vectors, corpus, tag_index, bm25)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the startup bundle for a corpus directory.")
+    parser.add_argument("corpus_path", help="Directory holding the metadata and embedding parts")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+
+    header = build_bundle(args.corpus_path, args.model)
+    print(f"Wrote {header['count']} documents ({header['version']}) to {bundle_path(args.corpus_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Relevance calibration ranges fitted on the qrels.
+
+The app shows a 0-100 relevance per result by clipping the raw score to a
+(low, high) range. The dense range used to be hand-set to (0.999, 1.0);
+this fits it from the scores the model actually gives judged documents:
+``low`` is the median score of judged non-relevant hits and ``high`` the
+95th percentile of judged relevant hits, so a typical non-relevant hit
+shows as 0 and the better relevant hits as 100::
+
+    python -m shuttle.calibration full_corpus_SBERT_trained \\
+        [--rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2]
+
+The ranges are written to ``<corpus>/calibration.json`` with the model
+they were fitted for; ``Retriever.load`` uses them only when that model
+is the one serving.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from shuttle.embedding_store import DEFAULT_MODEL, load_embedding_frame
+from shuttle.engine import DenseSearchEngine
+from shuttle.evaluate import load_qrels
+from shuttle.rerank import DEFAULT_RERANKER, CrossEncoderReranker, read_document_texts
+from shuttle.text import preprocess_text
+
+CALIBRATION_FILE = "calibration.json"
+LOW_PERCENTILE = 50
+HIGH_PERCENTILE = 95
+
+
+def load_calibration(corpus_path, model_name=DEFAULT_MODEL):
+    """{mode: (low, high)} fitted for `model_name`, or {} when none is."""
+    path = os.path.join(corpus_path, CALIBRATION_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        calibration = json.load(f)
+    if calibration.get("model") != model_name:
+        return {}
+    return {mode: tuple(bounds) for mode, bounds in calibration["ranges"].items()}
+
+
+def judged_scores(run_rows, topics, qrels):
+    """Scores and judgements of the judged hits in (cord_uids, scores) rows,
+    one row per query with its topic-id in `topics`."""
+    scores, judgements = [], []
+    for topic, (doc_ids, doc_scores) in zip(topics, run_rows):
+        judged = qrels.get(topic, {})
+        for doc_id, score in zip(doc_ids, doc_scores):
+            if doc_id in judged and not np.isnan(score):
+                scores.append(score)
+                judgements.append(judged[doc_id])
+    return np.array(scores, dtype=np.float64), np.array(judgements)
+
+
+def fit_range(scores, judgements, low_percentile=LOW_PERCENTILE, high_percentile=HIGH_PERCENTILE):
+    """(low, high) from the scores of judged hits."""
+    relevant = scores[judgements >= 1]
+    non_relevant = scores[judgements == 0]
+    if not len(relevant) or not len(non_relevant):
+        raise ValueError("Fitting needs both judged relevant and judged non-relevant hits")
+    low = float(np.percentile(non_relevant, low_percentile))
+    high = float(np.percentile(relevant, high_percentile))
+    if high <= low:
+        raise ValueError(f"Relevant hits do not score above non-relevant ones (low {low:.4f}, high {high:.4f})")
+    return low, high
+
+
+def fit(corpus_path, model_name=DEFAULT_MODEL, queries_path="DEMO_test_queries.csv",
+        qrels_path="DEMO_test_qrels.csv", depth=100, rerank_model=None, rerank_candidates=50):
+    """Fits the dense range (and the cross-encoder range with
+    `rerank_model`) and writes calibration.json. Returns its contents."""
+    from sentence_transformers import SentenceTransformer
+
+    queries = pd.read_csv(queries_path)
+    qrels = load_qrels(qrels_path)
+    texts = [preprocess_text(q) for q in queries["query"]]
+    topics = queries["topic-id"].tolist()
+
+    model = SentenceTransformer(model_name)
+    embeddings = model.encode(texts, convert_to_tensor=False, batch_size=32)
+    engine = DenseSearchEngine.from_frame(load_embedding_frame(corpus_path))
+    dense_rows = [
+        (engine.ids[rows].tolist(), scores)
+        for rows, scores in engine.search_batch(embeddings, top_k=depth, backend="exact")
+    ]
+
+    runs = {"dense": dense_rows}
+    if rerank_model:
+        reranker = CrossEncoderReranker.load(rerank_model, candidates=rerank_candidates, budget_ms=None)
+        doc_texts = read_document_texts(
+            corpus_path, sorted({d for doc_ids, _ in dense_rows for d in doc_ids[:rerank_candidates]})
+        )
+        runs["rerank"] = []
+        for text, (doc_ids, _) in zip(texts, dense_rows):
+            order, scores = reranker.rerank(text, [doc_texts.get(d, "") for d in doc_ids])
+            runs["rerank"].append(([doc_ids[i] for i in order], scores))
+
+    calibration = {"model": model_name, "ranges": {}, "fitted_on": {}}
+    for mode, run_rows in runs.items():
+        scores, judgements = judged_scores(run_rows, topics, qrels)
+        calibration["ranges"][mode] = fit_range(scores, judgements)
+        calibration["fitted_on"][mode] = {
+            "queries": len(texts),
+            "depth": depth,
+            "relevant": int((judgements >= 1).sum()),
+            "non_relevant": int((judgements == 0).sum()),
+        }
+    with open(os.path.join(corpus_path, CALIBRATION_FILE), "w") as f:
+        json.dump(calibration, f, indent=2)
+    return calibration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit relevance calibration ranges on the qrels.")
+    parser.add_argument("corpus_path", help="Directory holding the embeddings and metadata")
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--qrels", default="DEMO_test_qrels.csv")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--depth", type=int, default=100, help="Hits per query whose scores are used")
+    parser.add_argument("--rerank-model", default=None,
+                        help=f"Also fit the cross-encoder range, e.g. {DEFAULT_RERANKER}")
+    parser.add_argument("--rerank", type=int, default=50, help="Candidates re-ranked per query")
+    args = parser.parse_args()
+
+    calibration = fit(args.corpus_path, args.model, args.queries, args.qrels, args.depth,
+                      args.rerank_model, args.rerank)
+    for mode, (low, high) in calibration["ranges"].items():
+        fitted_on = calibration["fitted_on"][mode]
+        print(f"{mode}: low {low:.4f}, high {high:.4f} "
+              f"({fitted_on['relevant']} relevant / {fitted_on['non_relevant']} non-relevant judged hits)")
+
+
+if __name__ == "__main__":
+    main()
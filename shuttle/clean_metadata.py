@@ -0,0 +1,217 @@
+"""Streaming clean-up and preprocessing of the metadata CSV.
+
+Reproduces both cells of ``clean_and_prepoc_MJ.ipynb`` - dedupe on
+``cord_uid``, ftfy encoding repair, English-only filter (langdetect on
+title and abstract), whitelist cleaning, date parsing, missing abstracts
+filled from the title, then ``preprocess_text`` on every text column and a
+leading "abstract" stripped - without loading the file at once::
+
+    python -m shuttle.clean_metadata purposes_metadata_final.csv preprocessed_metadata.csv --workers 4
+
+The input is read ``--chunk-size`` rows at a time and every stage runs on
+the chunk before it is appended to the output, so memory is bounded by
+the chunk size (plus the set of cord_uids seen, used to drop duplicates
+across chunks). Encoding repair and language detection are per-document
+Python calls and run in a process pool; the other stages are vectorized
+pandas string operations. Rows/sec is reported for each stage.
+
+Differences from the notebook: langdetect is seeded (``DetectorFactory.seed
+= 0``) so reruns keep the same rows, and ``publish_time`` is parsed with
+``format="mixed"`` so a chunk's first date does not set the format for the
+rest of it.
+
+Needs the optional ``ftfy`` and ``langdetect`` packages (``pip install
+ftfy langdetect``).
+"""
+import argparse
+import importlib.util
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+REPAIR_COLUMNS = ["title", "abstract", "authors", "journal"]
+LANGUAGE_COLUMNS = ["title", "abstract"]
+STAGES = ["dedupe", "repair+language", "clean", "preprocess"]
+DATE_FORMAT = "%Y-%m-%d"
+DEFAULT_CHUNK_SIZE = 20000
+
+# The notebook's whitelist; ",-:" is a range, so it also keeps "-", "." and "/"
+NOT_WHITELISTED = r'[^a-zA-Z0-9\s.,-:;/()]'
+LATEX_ALPHA = r'\$\s*\\alpha\s*\$'
+
+
+def check_dependencies():
+    """Fails with an install hint before any worker process starts."""
+    for module in ("ftfy", "langdetect"):
+        if importlib.util.find_spec(module) is None:
+            raise ImportError(f"Metadata clean-up needs {module}: pip install {module}")
+
+
+def dedupe(chunk, seen):
+    """Rows of `chunk` whose cord_uid is new; adds them to `seen`."""
+    keep = ~chunk["cord_uid"].duplicated() & ~chunk["cord_uid"].isin(seen)
+    seen.update(chunk["cord_uid"][keep])
+    return chunk[keep]
+
+
+def _init_worker():
+    from langdetect import DetectorFactory
+
+    DetectorFactory.seed = 0
+
+
+def fix_encoding(text):
+    import ftfy
+
+    if not isinstance(text, str) or text.strip() == "":
+        return text
+    return ftfy.fix_text(text)
+
+
+def is_english(text):
+    from langdetect import detect
+
+    if not isinstance(text, str) or text.strip() == "":
+        return True
+    try:
+        return detect(text) == 'en'
+    except Exception:
+        return False
+
+
+def _repair_batch(columns):
+    """Repaired text per column and, per row, whether every language column
+    is English (after repair, as in the notebook)."""
+    fixed = {name: [fix_encoding(t) for t in texts] for name, texts in columns.items()}
+    english = [True] * len(next(iter(fixed.values()), []))
+    for name in LANGUAGE_COLUMNS:
+        if name in fixed:
+            english = [e and is_english(t) for e, t in zip(english, fixed[name])]
+    return fixed, english
+
+
+def repair_and_detect(chunk, pool, workers):
+    """`chunk` with encodings repaired, restricted to English rows."""
+    columns = [c for c in REPAIR_COLUMNS if c in chunk.columns]
+    size = -(-len(chunk) // (4 * workers))
+    batches = [
+        {c: chunk[c].iloc[s:s + size].tolist() for c in columns}
+        for s in range(0, len(chunk), size)
+    ]
+    english = []
+    chunk = chunk.copy()
+    repaired = {c: [] for c in columns}
+    for fixed, batch_english in pool.map(_repair_batch, batches):
+        for c in columns:
+            repaired[c].extend(fixed[c])
+        english.extend(batch_english)
+    for c in columns:
+        chunk[c] = repaired[c]
+    return chunk[pd.Series(english, index=chunk.index, dtype=bool)]
+
+
+def clean_text(column):
+    """The notebook's ``clean_text``, vectorized."""
+    column = column.str.normalize('NFC')
+    column = column.str.replace(LATEX_ALPHA, 'alpha', regex=True, flags=re.IGNORECASE)
+    column = column.str.replace(NOT_WHITELISTED, '', regex=True)
+    return column.str.strip()
+
+
+def clean(chunk):
+    chunk = chunk.copy()
+    for c in REPAIR_COLUMNS:
+        if c in chunk.columns:
+            chunk[c] = clean_text(chunk[c])
+    if "publish_time" in chunk.columns:
+        dates = pd.to_datetime(chunk["publish_time"], errors="coerce", format="mixed")
+        chunk["publish_time"] = dates.dt.strftime(DATE_FORMAT)
+    if "abstract" in chunk.columns and "title" in chunk.columns:
+        chunk["abstract"] = chunk["abstract"].fillna(chunk["title"])
+    return chunk
+
+
+def preprocess_column(column):
+    """``shuttle.text.preprocess_text`` over the string cells of `column`,
+    vectorized."""
+    strings = column.map(type) == str
+    if not strings.any():
+        return column
+    column = column.copy()
+    column[strings] = column[strings].str.lower().str.split().str.join(' ')
+    return column
+
+
+def preprocess(chunk):
+    chunk = chunk.copy()
+    for c in chunk.columns:
+        chunk[c] = preprocess_column(chunk[c])
+    if "abstract" in chunk.columns:
+        abstract = chunk["abstract"]
+        # The notebook drops the first 9 characters ("abstract" and the space after it)
+        leading = abstract.str.startswith("abstract", na=False)
+        chunk["abstract"] = abstract.where(~leading, abstract.str[9:])
+    return chunk
+
+
+def clean_csv(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=2, log=print):
+    """Streams `input_path` through every stage into `output_path`.
+    Returns {stage: (rows in, seconds)} and the row counts."""
+    check_dependencies()
+    seen = set()
+    timings = {stage: [0, 0.0] for stage in STAGES}
+    counts = {"rows": 0, "duplicates": 0, "non_english": 0, "written": 0}
+    tmp = f"{output_path}.tmp"
+
+    def timed(stage, function, chunk, *args):
+        start = time.perf_counter()
+        out = function(chunk, *args)
+        timings[stage][0] += len(chunk)
+        timings[stage][1] += time.perf_counter() - start
+        return out
+
+    # Header first, so an input without rows still gives a (header-only) output
+    pd.read_csv(input_path, nrows=0, encoding="utf-8").to_csv(tmp, index=False, encoding="utf-8")
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        # Everything as text, so ids and numbers are written back unchanged
+        reader = pd.read_csv(input_path, chunksize=chunk_size, dtype=str, encoding="utf-8")
+        for number, chunk in enumerate(reader):
+            counts["rows"] += len(chunk)
+            deduped = timed("dedupe", dedupe, chunk, seen)
+            counts["duplicates"] += len(chunk) - len(deduped)
+            english = timed("repair+language", repair_and_detect, deduped, pool, workers) if len(deduped) else deduped
+            counts["non_english"] += len(deduped) - len(english)
+            cleaned = timed("clean", clean, english)
+            out = timed("preprocess", preprocess, cleaned)
+
+            out.to_csv(tmp, mode="a", header=False, index=False, encoding="utf-8")
+            counts["written"] += len(out)
+            log(f"chunk {number}: {counts['rows']} rows read, {counts['written']} written")
+    os.replace(tmp, output_path)
+    return {stage: tuple(t) for stage, t in timings.items()}, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and preprocess the metadata CSV in chunks.")
+    parser.add_argument("input", help="Metadata CSV (e.g. purposes_metadata_final.csv)")
+    parser.add_argument("output")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows processed at a time")
+    parser.add_argument("--workers", type=int, default=2, help="Processes for encoding repair and language detection")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    timings, counts = clean_csv(args.input, args.output, args.chunk_size, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"Original rows: {counts['rows']}")
+    print(f"Duplicates dropped: {counts['duplicates']}, non-English dropped: {counts['non_english']}")
+    print(f"Rows written: {counts['written']} in {elapsed:.1f}s ({counts['rows'] / max(elapsed, 1e-9):.0f} rows/sec)")
+    for stage, (rows, seconds) in timings.items():
+        print(f"  {stage:16s} {rows:9d} rows {seconds:8.1f}s  {rows / max(seconds, 1e-9):10.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
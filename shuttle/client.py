@@ -0,0 +1,140 @@
+"""Client for ``shuttle.service``, with the same ``info``/``search``/``stats``
+calls as an in-process ``Retriever``, so the Streamlit app can use either.
+"""
+import codecs
+import json
+import urllib.error
+import urllib.request
+from datetime import date
+
+from shuttle.core import SEARCH_MODE, from_records
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class RemoteRetriever:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, body=None):
+        with self._open(path, body) as response:
+            return json.load(response)
+
+    def _stream(self, path, body, chunk_size=1 << 16):
+        """Yields the decoded text of a streamed reply as it arrives."""
+        with self._open(path, body) as response:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            while chunk := response.read(chunk_size):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b"", final=True)
+
+    def _open(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="GET" if body is None else "POST"
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServiceError(f"{path}: {message}") from e
+        except urllib.error.URLError as e:
+            raise ServiceError(f"Retrieval service at {self.base_url} unreachable: {e.reason}") from e
+
+    def info(self):
+        info = self._call("/info")
+        info["min_date"] = date.fromisoformat(info["min_date"])
+        info["max_date"] = date.fromisoformat(info["max_date"])
+        return info
+
+    def stats(self):
+        return self._call("/stats")
+
+    def refresh(self):
+        # The service picks up new segments itself
+        return False
+
+    @staticmethod
+    def _filters(start_date, end_date, tags, tag_match, min_refs):
+        return {
+            "start_date": start_date.isoformat() if start_date is not None else None,
+            "end_date": end_date.isoformat() if end_date is not None else None,
+            "tags": list(tags or []),
+            "tag_match": tag_match,
+            "min_refs": int(min_refs or 0),
+        }
+
+    @staticmethod
+    def _request(top_k, mode, backend, start_date, end_date, tags, tag_match, min_refs, rerank_candidates,
+                 rerank_budget_ms, search_params):
+        filters = RemoteRetriever._filters(start_date, end_date, tags, tag_match, min_refs)
+        body = {"top_k": top_k, "mode": mode, "backend": backend, "filters": filters, "params": search_params}
+        if rerank_candidates:
+            body["rerank"] = {"candidates": rerank_candidates}
+            if rerank_budget_ms is not None:
+                body["rerank"]["budget_ms"] = rerank_budget_ms
+        return body
+
+    def search(self, query, top_k=50, mode=SEARCH_MODE, backend=None, start_date=None, end_date=None,
+               tags=None, tag_match="any", min_refs=0, rerank_candidates=0, rerank_budget_ms=None,
+               **search_params):
+        """(results, scores) as ``Retriever.search`` returns them."""
+        body = self._request(top_k, mode, backend, start_date, end_date, tags, tag_match, min_refs,
+                             rerank_candidates, rerank_budget_ms, search_params)
+        body["query"] = query
+        reply = self._call("/search", body)
+        return from_records(reply["results"], reply["reranked"])
+
+    def batch_search(self, queries, top_k=50, mode=SEARCH_MODE, backend=None, start_date=None, end_date=None,
+                     tags=None, tag_match="any", min_refs=0, rerank_candidates=0, rerank_budget_ms=None,
+                     **search_params):
+        """One (results, scores) pair per query."""
+        body = self._request(top_k, mode, backend, start_date, end_date, tags, tag_match, min_refs,
+                             rerank_candidates, rerank_budget_ms, search_params)
+        body["queries"] = list(queries)
+        reply = self._call("/batch_search", body)
+        return [from_records(records, reranked) for records, reranked in zip(reply["results"], reply["reranked"])]
+
+    def browse(self, start_date=None, end_date=None, tags=None, tag_match="any", min_refs=0,
+               sort="corpus", page_size=50):
+        """A cursor like ``Retriever.browse``'s, paging through the service."""
+        body = {
+            "filters": self._filters(start_date, end_date, tags, tag_match, min_refs),
+            "sort": sort,
+            "page_size": page_size,
+        }
+        return RemoteBrowseCursor(self, body)
+
+
+class RemoteBrowseCursor:
+    def __init__(self, client, body):
+        self.client = client
+        self.body = body
+        self.page_size = body["page_size"]
+        self._first = self._fetch(0)
+        self.total = self._first["total"]
+        self.pages = self._first["pages"]
+
+    def _fetch(self, number):
+        return self.client._call("/browse", {**self.body, "page": number})
+
+    def page(self, number):
+        reply = self._first if number == 0 else self._fetch(number)
+        return from_records(reply["results"])[0]
+
+    def __iter__(self):
+        for number in range(self.pages):
+            yield self.page(number)
+
+    def csv_chunks(self):
+        """The service's streamed CSV export, chunk by chunk."""
+        return self.client._stream("/export", {k: v for k, v in self.body.items() if k != "page_size"})
@@ -0,0 +1,556 @@
+"""Retrieval core shared by the Streamlit app, the HTTP service and batch jobs.
+
+``Retriever.load`` loads the SBERT model, the corpus and every index once;
+``Retriever.search`` runs a query with filters and returns the result rows
+with their display text. Nothing here imports Streamlit, so one warm
+retriever can sit behind ``shuttle.service`` and serve many UI sessions.
+"""
+import os
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from shuttle.batch_encoder import MicroBatchEncoder
+from shuttle.browse import BrowseCursor
+from shuttle.bm25 import BM25Index, document_text, load_bm25_index
+from shuttle.bundle import load_bundle
+from shuttle.embedding_store import (
+    STORE_DIRNAME, EmbeddingStore, embedding_fingerprint, read_csv_parts, store_exists
+)
+from shuttle.engine import DenseSearchEngine
+from shuttle.filters import FilterIndex
+from shuttle.hybrid import HybridSearcher
+from shuttle.index import BACKENDS, INDEX_DIRNAME, ids_digest
+from shuttle.metadata_store import EAGER_COLUMNS, open_metadata_store
+from shuttle.query_cache import QueryEmbeddingCache
+from shuttle.rerank import DEFAULT_BUDGET_MS, DEFAULT_CANDIDATES, CrossEncoderReranker
+from shuttle.calibration import load_calibration
+from shuttle.result_cache import CachedSearcher, ResultSetCache
+from shuttle.results import RESULT_COLUMNS, recalibrate_score, relevance_scores  # noqa: F401
+from shuttle.segments import SegmentedBM25, SegmentedEngine, live_mask, open_segments, read_manifest
+from shuttle.tag_index import TagIndex, load_tag_index
+from shuttle.text import preprocess_text
+
+# Configuration
+MODEL_NAME = 'StephKeddy/sbert-IR-covid-search-v2'
+CORPUS_PATH = "full_corpus_SBERT_trained"
+EMBEDDING_FILES = [
+    "embeddings_part1.csv.gz",
+    "embeddings_part2.csv.gz"
+]
+METADATA_FILES = [
+    "metadata_part1_final.csv",
+    "metadata_part2_final.csv"
+]
+EMBEDDING_DIM = 768
+# Query encoder runtime: "torch" (SentenceTransformer), or "onnx" / "onnx-int8"
+# from an export made with `python -m shuttle.onnx_encoder export`
+ENCODER = os.environ.get("SHUTTLE_ENCODER", "torch")
+ONNX_PATH = os.environ.get("SHUTTLE_ONNX_PATH", os.path.join("models", "sbert-onnx"))
+# Text columns shown per result; loaded lazily when the metadata store is used
+DISPLAY_TEXT_COLUMNS = ['title', 'abstract', 'url']
+
+# When the binary store from `python -m shuttle.embedding_store` exists, "mmap"
+# searches its normalised vectors in place, so every process shares one
+# page-cache copy (with the sq8 or pq backend only compact codes stay in
+# memory); "memory" reads them into a private normalised array. A store of
+# raw vectors is always read into one normalised array. Without a store the
+# CSV parts are loaded.
+EMBEDDING_MODE = os.environ.get("SHUTTLE_EMBEDDINGS", "mmap")
+
+# Retrieval backend: "exact", "ivf", "hnsw" (needs hnswlib), or the compressed
+# "sq8" (int8) and "pq" (product quantization) backends. An index saved
+# by `python -m shuttle.index full_corpus_SBERT_trained --backend ivf` is
+# loaded from <corpus>/index/ivf instead of being rebuilt at startup; each
+# backend has its own directory, so switching backends keeps both indexes.
+INDEX_BACKEND = os.environ.get("SHUTTLE_INDEX_BACKEND", "exact")
+INDEX_PARAMS = {
+    "ivf": {"n_lists": None},
+    "hnsw": {"m": 16, "ef_construction": 200},
+    "sq8": {"rerank": 200},
+    "pq": {"m": 96, "rerank": 200},
+}
+# Default recall/speed knobs
+SEARCH_PARAMS = {"nprobe": 16, "ef_search": 64, "rerank": 200}
+# Default ranking mode: "dense", "bm25", "rrf" or "weighted" (see shuttle.hybrid)
+SEARCH_MODE = "dense"
+BM25_TEXT_COLUMNS = ['title', 'summarised_abstracts']
+# Query-embedding cache: in-memory LRU size and on-disk file in the corpus directory
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_FILE = "query_cache.sqlite"
+# Micro-batching of concurrent query encodes: largest batch, and how long the
+# first query of a batch waits for others to join it
+ENCODER_BATCH_SIZE = 32
+ENCODER_WAIT_MS = float(os.environ.get("SHUTTLE_ENCODER_WAIT_MS", 5))
+# Result-set cache: queries kept, and candidates kept per query
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_DEPTH = 1000
+# Optional cross-encoder re-ranking of the top results (see shuttle.rerank):
+# a CrossEncoder name or local directory, the candidates re-scored, and the
+# time budget after which the first-stage order is kept
+RERANKER_MODEL = os.environ.get("SHUTTLE_RERANKER")
+RERANK_CANDIDATES = DEFAULT_CANDIDATES
+RERANK_BUDGET_MS = float(os.environ.get("SHUTTLE_RERANK_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+
+def load_model(model_name=MODEL_NAME, encoder=ENCODER, onnx_path=ONNX_PATH):
+    """Query encoder with a ``SentenceTransformer``-style ``encode``. The
+    int8 ONNX variant only loads once it has passed the qrels quality check."""
+    if encoder != "torch":
+        from shuttle.onnx_encoder import OnnxEncoder
+
+        return OnnxEncoder(onnx_path, encoder)
+
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def encoder_id(model_name=MODEL_NAME, encoder=ENCODER, onnx_path=ONNX_PATH):
+    """Query-cache key for the encoder `load_model` returns. The torch and
+    ONNX variants give different vectors, so each gets its own entries;
+    an ONNX key also changes when the exported file is replaced."""
+    if encoder == "torch":
+        return f"{model_name}:torch"
+    from shuttle.onnx_encoder import variant_fingerprint
+
+    return f"{model_name}:{encoder}:{variant_fingerprint(onnx_path, encoder)}"
+
+
+def open_store(corpus_path=CORPUS_PATH):
+    """The corpus's binary embedding store (memory-mapped), or None."""
+    path = os.path.join(corpus_path, STORE_DIRNAME)
+    return EmbeddingStore(path) if store_exists(path) else None
+
+
+def load_corpus(corpus_path=CORPUS_PATH, metadata_files=METADATA_FILES,
+                embedding_files=EMBEDDING_FILES, model_name=MODEL_NAME):
+    """Filter metadata for the embedded documents, plus the tag index.
+
+    Returns (corpus, tag_index); ``corpus.attrs['version']`` identifies the
+    corpus + model so caches can tell when they are stale. When the binary
+    embedding store exists the corpus holds no embedding columns: its rows
+    follow the store, whose vectors stay on disk (see `open_store`).
+    Otherwise the embedding columns of the CSV parts are merged in.
+    """
+    # Tag index persisted by `python -m shuttle.tag_index`; rebuilt from the
+    # raw tags column below if missing or stale
+    tag_index = load_tag_index(corpus_path, metadata_files)
+
+    # Load metadata: only the filter columns from the Parquet store built by
+    # `python -m shuttle.metadata_store`, or every column from the CSV parts
+    metadata_store = open_metadata_store(corpus_path, metadata_files)
+    if metadata_store is not None:
+        metadata = metadata_store.read(EAGER_COLUMNS)
+        if tag_index is None:
+            tag_index = TagIndex.from_strings(metadata_store.ids, metadata_store.read(['tags'])['tags'])
+    else:
+        meta_dfs = []
+        for f in metadata_files:
+            path = os.path.join(corpus_path, f)
+            df = pd.read_csv(path, index_col='cord_uid')
+
+            # Process dates
+            df['publish_time'] = pd.to_datetime(
+                df['publish_time'],
+                format='mixed',
+                dayfirst=True
+            )
+
+            meta_dfs.append(df)
+
+        metadata = pd.concat(meta_dfs)
+        if tag_index is None:
+            tag_index = TagIndex.from_strings(metadata.index.astype(str), metadata['tags'])
+
+    store = open_store(corpus_path)
+    if store is not None:
+        if store.dim != EMBEDDING_DIM:
+            raise ValueError(f"Expected {EMBEDDING_DIM} embedding dimensions, found {store.dim}")
+        missing = pd.Index(store.ids).difference(metadata.index)
+        if len(missing):
+            raise ValueError(f"{len(missing)} documents in the embedding store have no metadata, e.g. {missing[0]}")
+        corpus = metadata.loc[store.ids]
+    else:
+        embeddings = read_csv_parts([os.path.join(corpus_path, p) for p in embedding_files])
+
+        # Validate embeddings
+        if embeddings.shape[1] != EMBEDDING_DIM:
+            raise ValueError(f"Expected {EMBEDDING_DIM} embedding dimensions, found {embeddings.shape[1]}")
+
+        # Merge data
+        corpus = metadata.merge(embeddings, left_index=True, right_index=True, how='inner')
+
+    corpus.attrs['version'] = ':'.join([
+        model_name,
+        ids_digest(corpus.index),
+        embedding_fingerprint(corpus_path, embedding_files)
+    ])
+
+    return corpus, tag_index
+
+
+def with_text_columns(results, metadata_store, columns=DISPLAY_TEXT_COLUMNS):
+    """Adds the display text columns a store-backed corpus is loaded without,
+    reading them for the result rows only."""
+    missing = [c for c in columns if c not in results.columns]
+    if not missing:
+        return results
+    return results.join(metadata_store.take(results.index, missing))
+
+
+def with_segment_text(results, segment_text, columns=DISPLAY_TEXT_COLUMNS):
+    """Replaces the display text of result rows that live in a segment with
+    the segment's copy. A deleted and re-ingested document keeps its old
+    text in the base store, so the segment must win, including where its
+    new values are missing."""
+    in_segments = results.index.isin(segment_text.index)
+    if not in_segments.any():
+        return results
+    results = results.copy()
+    results.loc[in_segments, columns] = segment_text.reindex(
+        index=results.index[in_segments], columns=columns
+    ).to_numpy()
+    return results
+
+
+def search(query, corpus, searcher, top_k=50, mode="dense", backend=None, mask=None, **search_params):
+    top_indices, scores = searcher.search(
+        query, top_k=top_k, mode=mode, backend=backend, mask=mask, **search_params
+    )
+    return corpus.iloc[top_indices], scores
+
+
+class RetrieverView:
+    """One consistent snapshot of the searchable corpus. Searches read a
+    view once, so a refresh swapping in a new one never mixes row numbers."""
+
+    def __init__(self, corpus, filter_index, searcher, live=None, segment_text=None, generation=0):
+        self.corpus = corpus
+        self.filter_index = filter_index
+        self.searcher = searcher
+        # Rows not deleted by a tombstone (None: all live)
+        self.live = live
+        # Display text of segment rows, which the metadata store lacks
+        self.segment_text = segment_text
+        self.generation = generation
+
+
+class Retriever:
+    """The warm retrieval state: corpus filter columns, filter index, search
+    engine + BM25 behind the cached hybrid searcher, and the metadata store
+    for display text.
+
+    Documents appended with ``python -m shuttle.segments`` are searched
+    alongside the original index; ``refresh`` loads new segments and
+    tombstones without reloading the rest.
+    """
+
+    def __init__(self, corpus, filter_index, engine, bm25, encode, metadata_store=None,
+                 query_cache=None, encoder=None, corpus_path=None, reranker=None, calibration=None,
+                 base_stats=None):
+        self.base_corpus = corpus
+        self.base_filter_index = filter_index
+        self.engine = engine
+        self.bm25 = bm25
+        self.encode = encode
+        self.metadata_store = metadata_store
+        self.query_cache = query_cache
+        self.encoder = encoder
+        self.corpus_path = corpus_path
+        self.reranker = reranker
+        # Relevance ranges per mode fitted by `python -m shuttle.calibration`
+        self.calibration = calibration or {}
+        # Precomputed sidebar stats of the base corpus (from the bundle)
+        self.base_stats = base_stats
+        self.base_version = corpus.attrs.get('version')
+        self.segments = {}
+        self._refresh_lock = threading.Lock()
+        self.view = self._build_view([], {"generation": 0, "tombstones": {}})
+        if corpus_path is not None:
+            self.refresh()
+
+    @property
+    def corpus(self):
+        return self.view.corpus
+
+    @property
+    def filter_index(self):
+        return self.view.filter_index
+
+    @property
+    def searcher(self):
+        return self.view.searcher
+
+    @classmethod
+    def load(cls, corpus_path=CORPUS_PATH, model_name=MODEL_NAME, model=None,
+             metadata_files=METADATA_FILES, embedding_files=EMBEDDING_FILES,
+             backend=INDEX_BACKEND, index_params=INDEX_PARAMS, query_cache_path="default",
+             embedding_mode=EMBEDDING_MODE, reranker_model=RERANKER_MODEL, use_bundle=True):
+        """Loads everything needed to serve queries. `query_cache_path` of
+        "default" keeps the disk tier in the corpus directory; None disables
+        it. Without a `reranker_model`, re-ranking is unavailable.
+
+        A current bundle from `python -m shuttle.bundle` replaces the corpus
+        and BM25 builds; its vectors are searched memory-mapped whatever the
+        `embedding_mode` (see EMBEDDING_MODE).
+        """
+        metadata_store = open_metadata_store(corpus_path, metadata_files)
+        bundle = None
+        if use_bundle and metadata_store is not None:
+            bundle = load_bundle(corpus_path, model_name, metadata_files, embedding_files)
+
+        # Normalised float32 matrix aligned with corpus rows
+        engine_options = dict(
+            backend=backend,
+            index_params=index_params,
+            index_path=os.path.join(corpus_path, INDEX_DIRNAME)
+        )
+        if bundle is not None:
+            corpus, tag_index = bundle.corpus, bundle.tag_index
+            engine = DenseSearchEngine(bundle.vectors, ids=bundle.ids, normalized=True, **engine_options)
+        else:
+            corpus, tag_index = load_corpus(corpus_path, metadata_files, embedding_files, model_name)
+            store = open_store(corpus_path)
+            if store is not None:
+                # No pandas copy: the store's memmap is searched in place when
+                # it is normalised, else normalised once into a numpy array
+                memory_map = embedding_mode == "mmap" and store.normalized
+                engine = DenseSearchEngine.from_store(store, memory_map=memory_map, **engine_options)
+            else:
+                engine = DenseSearchEngine.from_frame(corpus[list(range(EMBEDDING_DIM))], **engine_options)
+                # The engine holds its own normalised copy
+                corpus = corpus.drop(columns=list(range(EMBEDDING_DIM)))
+        filter_index = FilterIndex.from_corpus(corpus, tag_index)
+
+        # BM25 over title + summarised abstract: the bundle's copy, else
+        # `python -m shuttle.bm25`'s when available, otherwise built here
+        bm25 = bundle.bm25 if bundle is not None else load_bm25_index(corpus_path, metadata_files)
+        if bm25 is None:
+            if metadata_store is not None:
+                texts = metadata_store.take(corpus.index, BM25_TEXT_COLUMNS)
+            else:
+                texts = corpus[BM25_TEXT_COLUMNS]
+            bm25 = BM25Index.build(corpus.index.astype(str).to_numpy(), document_text(texts))
+        bm25 = bm25.align(corpus.index)
+
+        if model is None:
+            model = load_model(model_name)
+        if query_cache_path == "default":
+            query_cache_path = os.path.join(corpus_path, QUERY_CACHE_FILE)
+        # Cache misses from concurrent searches share forward passes
+        encoder = MicroBatchEncoder(
+            lambda texts: model.encode(texts, convert_to_tensor=False),
+            max_batch_size=ENCODER_BATCH_SIZE,
+            max_wait_ms=ENCODER_WAIT_MS
+        )
+        query_cache = QueryEmbeddingCache(
+            encoder,
+            encoder_id(model_name),
+            max_size=QUERY_CACHE_SIZE,
+            disk_path=query_cache_path
+        )
+        reranker = None
+        if reranker_model:
+            reranker = CrossEncoderReranker.load(
+                reranker_model, candidates=RERANK_CANDIDATES, budget_ms=RERANK_BUDGET_MS
+            )
+        return cls(corpus, filter_index, engine, bm25, query_cache, metadata_store, query_cache, encoder,
+                   corpus_path, reranker, load_calibration(corpus_path, model_name),
+                   bundle.stats if bundle is not None else None)
+
+    def refresh(self):
+        """Picks up segments and tombstones published since the last call;
+        returns True if the searchable corpus changed."""
+        if self.corpus_path is None:
+            return False
+        manifest = read_manifest(self.corpus_path)
+        if manifest["generation"] == self.view.generation:
+            return False
+        with self._refresh_lock:
+            if manifest["generation"] == self.view.generation:
+                return False
+            # Only segments not loaded before are opened
+            segments = open_segments(self.corpus_path, manifest, self.segments)
+            self.segments = {s.name: s for s in segments}
+            self.view = self._build_view(segments, manifest)
+        return True
+
+    def _build_view(self, segments, manifest):
+        corpus = self.base_corpus
+        filter_index = self.base_filter_index
+        engine, bm25 = self.engine, self.bm25
+        live = segment_text = None
+        if segments:
+            frames = [s.metadata.reindex(columns=corpus.columns) for s in segments]
+            corpus = pd.concat([corpus] + frames)
+            corpus.index.name = 'cord_uid'
+            tag_index = filter_index.tag_index
+            for s in segments:
+                tag_index = tag_index.extend(s.metadata.index.to_numpy(), s.tag_lists)
+            filter_index = FilterIndex.from_corpus(corpus, tag_index)
+            engine = SegmentedEngine([engine] + [s.engine for s in segments])
+            bm25 = SegmentedBM25([bm25] + [s.bm25 for s in segments])
+            text = pd.concat([s.metadata.reindex(columns=DISPLAY_TEXT_COLUMNS) for s in segments])
+            segment_text = text[~text.index.duplicated(keep='last')]
+        if manifest["tombstones"]:
+            numbers = np.repeat(
+                [0] + [s.number for s in segments],
+                [len(self.base_corpus)] + [len(s) for s in segments]
+            )
+            live = live_mask(corpus.index.to_numpy(dtype=str), numbers, manifest["tombstones"])
+
+        if corpus is self.base_corpus:
+            corpus = corpus.copy(deep=False)
+        corpus.attrs['version'] = f"{self.base_version}:{manifest['generation']}"
+        # A fresh result cache per view: cached row numbers belong to one view
+        searcher = CachedSearcher(
+            HybridSearcher(engine, bm25, encode=self.encode),
+            ResultSetCache(max_entries=RESULT_CACHE_SIZE, version=corpus.attrs['version']),
+            depth=RESULT_CACHE_DEPTH
+        )
+        return RetrieverView(corpus, filter_index, searcher, live, segment_text, manifest["generation"])
+
+    def info(self):
+        """Corpus facts the UI needs for its filter controls."""
+        view = self.view
+        tag_index = view.filter_index.tag_index
+        if self.base_stats is not None and not self.segments:
+            stats = self.base_stats
+        else:
+            stats = {
+                "min_date": view.corpus['publish_time'].min().date(),
+                "max_date": view.corpus['publish_time'].max().date(),
+                "max_refs": int(view.corpus['referenced_by_count'].max()),
+            }
+        return {
+            "documents": len(view.corpus) if view.live is None else int(view.live.sum()),
+            "version": view.corpus.attrs.get('version'),
+            "generation": view.generation,
+            "segments": len(self.segments),
+            **stats,
+            "tags": list(tag_index.vocab),
+            "tag_frequency": {tag: int(n) for tag, n in tag_index.tag_frequency.items()},
+            "backends": list(BACKENDS),
+            "default_backend": self.engine.default_backend,
+            "reranker": self.reranker is not None,
+            "calibration": {mode: list(bounds) for mode, bounds in self.calibration.items()},
+        }
+
+    def stats(self):
+        stats = {"result_cache": self.view.searcher.cache.stats()}
+        if self.query_cache is not None:
+            stats["query_cache"] = self.query_cache.stats()
+        if self.encoder is not None:
+            stats["encoder"] = self.encoder.stats()
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.stats()
+        return stats
+
+    def _mask(self, view, start_date, end_date, tags, tag_match, min_refs):
+        # Date, tag and referenced_by_count filters become a row mask that
+        # restricts the search itself
+        mask = view.filter_index.mask(
+            start_date=start_date,
+            end_date=end_date,
+            tags=tags,
+            tag_match=tag_match,
+            min_refs=min_refs
+        )
+        if view.live is not None:
+            mask = view.live if mask is None else mask & view.live
+        return mask
+
+    def _fetch(self, view, rows):
+        """RESULT_COLUMNS for corpus rows `rows` of `view`, in that order."""
+        results = view.corpus.iloc[rows]
+        if self.metadata_store is not None:
+            results = with_text_columns(results, self.metadata_store)
+            if view.segment_text is not None:
+                results = with_segment_text(results, view.segment_text)
+        return results[RESULT_COLUMNS]
+
+    def browse(self, start_date=None, end_date=None, tags=None, tag_match="any", min_refs=0,
+               sort="corpus", page_size=50):
+        """Cursor over every document matching the filters, in `sort` order
+        (see ``shuttle.filters.SORT_ORDERS``), materialised a page at a time."""
+        view = self.view
+        mask = self._mask(view, start_date, end_date, tags, tag_match, min_refs)
+        rows = view.filter_index.matching_rows(mask, sort)
+        return BrowseCursor(rows, lambda page_rows: self._fetch(view, page_rows), page_size)
+
+    def search(self, query, top_k=50, mode=SEARCH_MODE, backend=None, start_date=None, end_date=None,
+               tags=None, tag_match="any", min_refs=0, rerank_candidates=0, rerank_budget_ms=None,
+               **search_params):
+        """Returns (results, scores): RESULT_COLUMNS indexed by cord_uid, best
+        first. A query of '*' returns the matching documents in corpus order
+        with zero scores.
+
+        With `rerank_candidates` the top results are re-scored by the
+        cross-encoder; ``results.attrs['reranked']`` tells whether that
+        happened (it falls back to the first-stage ranking when the time
+        budget runs out), and so whether `scores` are cross-encoder scores.
+        """
+        view = self.view
+        mask = self._mask(view, start_date, end_date, tags, tag_match, min_refs)
+        if query.strip() == '*':
+            # First page of the browse cursor: only top_k rows are materialised
+            rows = view.filter_index.matching_rows(mask)[:top_k]
+            results = self._fetch(view, rows)
+            scores = np.zeros(len(results))
+        else:
+            top_indices, scores = view.searcher.search(
+                preprocess_text(query), top_k=top_k, mode=mode, backend=backend, mask=mask, **search_params
+            )
+            results = self._fetch(view, top_indices)
+        reranked = False
+        if rerank_candidates and query.strip() != '*' and len(results):
+            if self.reranker is None:
+                raise ValueError("Re-ranking needs a cross-encoder; set SHUTTLE_RERANKER")
+            results, scores, reranked = self.reranker.rerank_results(
+                preprocess_text(query), results, scores, rerank_candidates, rerank_budget_ms
+            )
+        results.attrs['reranked'] = reranked
+        return results, scores
+
+    def warm(self, queries):
+        """Encodes not-yet-cached queries in batches (for batch requests)."""
+        if self.query_cache is not None:
+            self.query_cache.warm([q for q in queries if q.strip() != '*'])
+
+
+def to_records(results, scores, mode=SEARCH_MODE, ranges=None):
+    """JSON-ready result dicts (rank, cord_uid, metadata, score, relevance).
+    Pass mode=None for unscored ('*') results and mode="rerank" for
+    cross-encoder scores; `ranges` are the fitted calibration ranges. Rows
+    without a score get None."""
+    relevance = relevance_scores(scores, mode, ranges) if mode is not None and len(scores) else [None] * len(scores)
+    records = []
+    for rank, (cord_uid, row) in enumerate(results.iterrows(), start=1):
+        record = {"rank": rank, "cord_uid": str(cord_uid)}
+        for column in RESULT_COLUMNS:
+            value = row[column]
+            if pd.isna(value):
+                value = None
+            elif isinstance(value, (pd.Timestamp, date)):
+                value = value.strftime('%Y-%m-%d')
+            elif isinstance(value, np.generic):
+                value = value.item()
+            record[column] = value
+        score, rel = scores[rank - 1], relevance[rank - 1]
+        record["score"] = None if pd.isna(score) else float(score)
+        record["relevance"] = None if rel is None or pd.isna(rel) else float(rel)
+        records.append(record)
+    return records
+
+
+def from_records(records, reranked=False):
+    """Inverse of ``to_records``: (results, scores) as ``Retriever.search`` returns them."""
+    results = pd.DataFrame.from_records(records, columns=["cord_uid"] + RESULT_COLUMNS + ["score"])
+    results = results.set_index("cord_uid")
+    results['publish_time'] = pd.to_datetime(results['publish_time'])
+    scores = results.pop("score").to_numpy(dtype=np.float64, na_value=np.nan)
+    results.attrs['reranked'] = reranked
+    return results, scores
@@ -0,0 +1,267 @@
+"""CrossRef enrichment: citation counts and journal names for every DOI.
+
+Replaces the notebook's two sequential ``requests.get`` calls per row
+(``fetch_citation_count`` then ``fetch_journal_name``) with one request per
+distinct DOI, reading both ``is-referenced-by-count`` and
+``container-title``. Requests run on asyncio with a bounded connection
+pool and a global rate limit; 429/5xx replies and connection errors are
+retried with exponential backoff (honouring ``Retry-After``). Replies are
+kept in a SQLite cache, so a rerun only fetches DOIs that are missing,
+older than ``--max-age-days`` or failed last time::
+
+    python -m shuttle.crossref metadata_cut_clean.csv metadata_enriched.csv \\
+        --concurrency 16 --rate 40 --mailto you@example.org
+
+Failed lookups leave ``referenced_by_count`` and ``JournalName_DOI`` empty
+rather than storing "Error: ..." strings. ``--base-url`` points the stage at
+a local stand-in server (see ``benchmarks/crossref_enrichment.py``).
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+from urllib.parse import quote
+
+import aiohttp
+import pandas as pd
+
+CROSSREF_URL = "https://api.crossref.org/works/"
+CACHE_FILE = "crossref_cache.sqlite"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DOI_PREFIXES = ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:")
+FLUSH_EVERY = 500
+
+
+def normalize_doi(doi):
+    """Lower-cased bare DOI, or None for a missing/empty value."""
+    if not isinstance(doi, str):
+        return None
+    doi = doi.strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi or None
+
+
+def parse_work(payload):
+    """(referenced_by_count, journal name) from a /works/{doi} reply."""
+    message = payload.get("message") or {}
+    titles = message.get("container-title") or []
+    return message.get("is-referenced-by-count"), titles[0] if titles else None
+
+
+class ResponseCache:
+    """SQLite cache of looked-up DOIs: found works and DOIs CrossRef does not
+    know. Transient failures are not cached."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS works ("
+            "doi TEXT PRIMARY KEY, status TEXT, referenced_by_count INTEGER, journal TEXT, fetched_at REAL)"
+        )
+        self._db.commit()
+
+    def get_many(self, dois, max_age_seconds=None):
+        """{doi: record} for cached DOIs fetched within `max_age_seconds`."""
+        oldest = time.time() - max_age_seconds if max_age_seconds else 0
+        found = {}
+        dois = list(dois)
+        for start in range(0, len(dois), 900):  # SQLite's bound-parameter limit
+            batch = dois[start:start + 900]
+            rows = self._db.execute(
+                f"SELECT doi, status, referenced_by_count, journal FROM works "
+                f"WHERE fetched_at >= ? AND doi IN ({','.join('?' * len(batch))})",
+                [oldest] + batch,
+            )
+            for doi, status, count, journal in rows:
+                found[doi] = {"status": status, "referenced_by_count": count, "journal": journal}
+        return found
+
+    def put_many(self, records):
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO works VALUES (?, ?, ?, ?, ?)",
+            [
+                (doi, r["status"], r["referenced_by_count"], r["journal"], now)
+                for doi, r in records.items() if r["status"] != "error"
+            ],
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _record(status, count=None, journal=None, error=None):
+    return {"status": status, "referenced_by_count": count, "journal": journal, "error": error}
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+async def fetch_work(session, limiter, base_url, doi, retries, backoff, stats):
+    """The record for one DOI: "ok", "not_found" or, once retries are
+    exhausted, "error"."""
+    url = base_url + quote(doi, safe="/")
+    error = None
+    for attempt in range(retries + 1):
+        await limiter.wait()
+        stats["requests"] += 1
+        delay = None
+        try:
+            async with session.get(url) as response:
+                if response.status == 404:
+                    return _record("not_found")
+                if response.status in RETRY_STATUSES:
+                    error = f"HTTP {response.status}"
+                    delay = _retry_after(response)
+                elif response.status >= 400:
+                    return _record("error", error=f"HTTP {response.status}")
+                else:
+                    count, journal = parse_work(await response.json(content_type=None))
+                    return _record("ok", count, journal)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            error = f"{type(e).__name__}: {e}"
+        if attempt < retries:
+            stats["retries"] += 1
+            await asyncio.sleep(max(delay or 0, backoff * 2 ** attempt * (0.5 + random.random())))
+    return _record("error", error=error)
+
+
+async def fetch_all(dois, base_url=CROSSREF_URL, concurrency=16, rate=40.0, retries=4, backoff=0.5,
+                    timeout=30.0, mailto=None, on_batch=None):
+    """{doi: record} for `dois`, fetched by `concurrency` workers sharing one
+    connection pool. `on_batch` receives finished records every
+    FLUSH_EVERY lookups (and at the end), e.g. to checkpoint the cache.
+    Returns (records, stats)."""
+    queue = asyncio.Queue()
+    for doi in dois:
+        queue.put_nowait(doi)
+    records, pending = {}, {}
+    stats = {"requests": 0, "retries": 0}
+    limiter = RateLimiter(rate)
+    # CrossRef routes clients that identify themselves to its "polite" pool
+    agent = "shuttle-enrichment" + (f" (mailto:{mailto})" if mailto else "")
+
+    async def worker(session):
+        while True:
+            try:
+                doi = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            records[doi] = pending[doi] = await fetch_work(session, limiter, base_url, doi, retries, backoff, stats)
+            if on_batch is not None and len(pending) >= FLUSH_EVERY:
+                on_batch(dict(pending))
+                pending.clear()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": agent},
+    ) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    if on_batch is not None and pending:
+        on_batch(pending)
+    return records, stats
+
+
+def enrich(frame, cache_path=CACHE_FILE, max_age_days=30, doi_column="doi", **fetch_options):
+    """Copy of `frame` with ``referenced_by_count`` and ``JournalName_DOI``
+    filled from CrossRef (empty where the lookup failed or the DOI is
+    unknown), and the run's stats."""
+    dois = frame[doi_column].map(normalize_doi)
+    unique = dois.dropna().unique().tolist()
+
+    start = time.perf_counter()
+    cache = ResponseCache(cache_path)
+    try:
+        records = cache.get_many(unique, max_age_days * 86400 if max_age_days else None)
+        missing = [d for d in unique if d not in records]
+        fetched, stats = asyncio.run(fetch_all(missing, on_batch=cache.put_many, **fetch_options))
+    finally:
+        cache.close()
+    records.update(fetched)
+    elapsed = time.perf_counter() - start
+
+    statuses = pd.Series([r["status"] for r in fetched.values()], dtype=object)
+    stats.update({
+        "rows": len(frame),
+        "dois": len(unique),
+        "cache_hits": len(unique) - len(missing),
+        "fetched": len(missing),
+        "not_found": int((statuses == "not_found").sum()),
+        "errors": int((statuses == "error").sum()),
+        "seconds": elapsed,
+        "requests_per_sec": stats["requests"] / elapsed if elapsed else 0.0,
+    })
+
+    frame = frame.copy()
+    frame["referenced_by_count"] = pd.to_numeric(
+        dois.map(lambda d: records[d]["referenced_by_count"] if d in records else None), errors="coerce"
+    )
+    frame["JournalName_DOI"] = dois.map(lambda d: records[d]["journal"] if d in records else None)
+    return frame, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add CrossRef citation counts and journal names to a metadata CSV.")
+    parser.add_argument("input", help="CSV with a DOI column")
+    parser.add_argument("output")
+    parser.add_argument("--doi-column", default="doi")
+    parser.add_argument("--cache", default=CACHE_FILE, help="SQLite response cache")
+    parser.add_argument("--max-age-days", type=float, default=30, help="Refetch cached replies older than this (0: never)")
+    parser.add_argument("--base-url", default=CROSSREF_URL)
+    parser.add_argument("--concurrency", type=int, default=16, help="Open connections")
+    parser.add_argument("--rate", type=float, default=40.0, help="Requests per second (0: unlimited)")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--mailto", default=None, help="Contact address for CrossRef's polite pool")
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.input)
+    frame, stats = enrich(
+        frame,
+        cache_path=args.cache,
+        max_age_days=args.max_age_days,
+        doi_column=args.doi_column,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        mailto=args.mailto,
+    )
+    frame.to_csv(args.output, index=False)
+    print(
+        f"{stats['dois']} DOIs ({stats['cache_hits']} cached, {stats['fetched']} fetched, "
+        f"{stats['not_found']} unknown, {stats['errors']} failed) in {stats['seconds']:.1f}s; "
+        f"{stats['requests']} requests ({stats['retries']} retries), {stats['requests_per_sec']:.1f} req/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Binary, memory-mapped embedding store.
+
+A store is a directory holding three files:
+
+* ``header.json`` - dimension, dtype, row count, model name and whether the
+  vectors are already L2-normalised
+* ``ids.txt`` - one cord_uid per line, in row order
+* ``vectors.bin`` - the embedding matrix as one contiguous C-ordered block
+
+The matrix is opened with ``np.memmap`` so several app processes share a
+single page-cache copy instead of each parsing the gzipped CSV parts.
+
+Convert the existing CSV parts once with::
+
+    python -m shuttle.embedding_store full_corpus_SBERT_trained
+
+Rows are stored L2-normalised (``--no-normalize`` keeps the raw vectors),
+so the app searches the memory-mapped matrix itself rather than a copy.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+STORE_DIRNAME = "embeddings_store"
+EMBEDDING_FILES = ["embeddings_part1.csv.gz", "embeddings_part2.csv.gz"]
+HEADER_FILE = "header.json"
+IDS_FILE = "ids.txt"
+VECTORS_FILE = "vectors.bin"
+FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+DEFAULT_MODEL = "StephKeddy/sbert-IR-covid-search-v2"
+
+
+class EmbeddingStore:
+    """Read-only view over an on-disk embedding store."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version in {path}: {self.header.get('version')}")
+
+        with open(os.path.join(path, IDS_FILE)) as f:
+            self.ids = [line.rstrip("\n") for line in f]
+        if len(self.ids) != self.header["count"]:
+            raise ValueError(f"{path}: header lists {self.header['count']} rows but found {len(self.ids)} ids")
+
+        self.vectors = np.memmap(
+            os.path.join(path, VECTORS_FILE),
+            dtype=self.header["dtype"],
+            mode="r",
+            shape=(self.header["count"], self.header["dim"]),
+        )
+
+    @property
+    def dim(self):
+        return self.header["dim"]
+
+    @property
+    def dtype(self):
+        return self.header["dtype"]
+
+    @property
+    def model_name(self):
+        return self.header["model"]
+
+    @property
+    def normalized(self):
+        return self.header["normalized"]
+
+    def __len__(self):
+        return self.header["count"]
+
+    def to_frame(self):
+        """Returns the embeddings as a float32 DataFrame indexed by cord_uid."""
+        df = pd.DataFrame(np.asarray(self.vectors, dtype=np.float32), index=self.ids)
+        df.index.name = "cord_uid"
+        return df
+
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, HEADER_FILE))
+
+
+def write_store(path, ids, vectors, model_name=DEFAULT_MODEL, normalized=False, dtype="float32"):
+    """Writes an in-memory (ids, matrix) pair as a new embedding store."""
+    writer = StoreWriter(path, vectors.shape[1], model_name=model_name, normalized=normalized, dtype=dtype)
+    writer.append(ids, vectors)
+    return writer.close()
+
+
+class StoreWriter:
+    """Streams rows into a new store; the header is written last by ``close``."""
+
+    def __init__(self, path, dim, model_name=DEFAULT_MODEL, normalized=False, dtype="float32"):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+        os.makedirs(path, exist_ok=True)
+        # A missing header marks the store as incomplete, so readers never
+        # see a half-written matrix.
+        header_path = os.path.join(path, HEADER_FILE)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.model_name = model_name
+        self.normalized = normalized
+        self.count = 0
+        self._ids = open(os.path.join(path, IDS_FILE), "w")
+        self._vectors = open(os.path.join(path, VECTORS_FILE), "wb")
+
+    def append(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim} embedding dimensions, found {vectors.shape[-1]}")
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        for doc_id in ids:
+            self._ids.write(f"{doc_id}\n")
+        vectors.tofile(self._vectors)
+        self.count += len(vectors)
+
+    def close(self):
+        self._ids.close()
+        self._vectors.close()
+        return write_header(self.path, self.count, self.dim, self.dtype, self.model_name, self.normalized)
+
+
+def write_header(path, count, dim, dtype, model_name, normalized):
+    """Writes ``header.json``, which marks the store as complete."""
+    header = {
+        "version": FORMAT_VERSION,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "model": model_name,
+        "normalized": normalized,
+    }
+    with open(os.path.join(path, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+def read_csv_parts(csv_paths):
+    """Reads gzipped embedding CSV parts into one numeric DataFrame indexed by cord_uid."""
+    embed_dfs = []
+    for path in csv_paths:
+        df = pd.read_csv(path, compression="gzip", index_col="cord_uid")
+        df.columns = df.columns.astype(int)
+        df = df.apply(pd.to_numeric, errors="coerce")
+        embed_dfs.append(df)
+    return pd.concat(embed_dfs)
+
+
+def load_embedding_frame(corpus_path, parts=EMBEDDING_FILES):
+    """Embeddings for a corpus directory, preferring the binary store over the CSV parts."""
+    store_path = os.path.join(corpus_path, STORE_DIRNAME)
+    if store_exists(store_path):
+        return EmbeddingStore(store_path).to_frame()
+    return read_csv_parts([os.path.join(corpus_path, p) for p in parts])
+
+
+def embedding_fingerprint(corpus_path, parts=EMBEDDING_FILES):
+    """Cheap identifier of the embeddings a corpus directory currently
+    serves (file sizes and modification times), for cache invalidation."""
+    store_path = os.path.join(corpus_path, STORE_DIRNAME)
+    if store_exists(store_path):
+        files = [os.path.join(store_path, f) for f in (HEADER_FILE, IDS_FILE, VECTORS_FILE)]
+    else:
+        files = [os.path.join(corpus_path, p) for p in parts]
+    return ";".join(
+        f"{os.path.basename(f)}:{os.path.getsize(f)}:{os.path.getmtime(f):.0f}"
+        for f in files if os.path.exists(f)
+    )
+
+
+def convert_csv_parts(csv_paths, out_path, model_name=DEFAULT_MODEL, dtype="float32", chunksize=10000, normalize=True):
+    """Converts gzipped embedding CSV parts into a binary store, chunk by chunk.
+
+    With `normalize`, rows are stored L2-normalised so the search engine can
+    use the memory-mapped matrix directly instead of a normalised copy.
+    """
+    from shuttle.engine import l2_normalize
+
+    writer = None
+    for csv_path in csv_paths:
+        for chunk in pd.read_csv(csv_path, compression="gzip", index_col="cord_uid", chunksize=chunksize):
+            # Columns are written as "0".."767" by the indexing notebook
+            chunk = chunk[sorted(chunk.columns, key=int)].apply(pd.to_numeric, errors="coerce")
+            if writer is None:
+                writer = StoreWriter(out_path, chunk.shape[1], model_name=model_name, normalized=normalize, dtype=dtype)
+            vectors = chunk.to_numpy(dtype=np.float32)
+            if normalize:
+                vectors = l2_normalize(vectors)
+            writer.append(chunk.index.astype(str).tolist(), vectors)
+    if writer is None:
+        raise ValueError("No embedding rows found in the given CSV parts")
+    return writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert gzipped embedding CSV parts into a binary store.")
+    parser.add_argument("corpus_path", help="Directory holding embeddings_part*.csv.gz")
+    parser.add_argument("--parts", nargs="+", default=EMBEDDING_FILES)
+    parser.add_argument("--out", default=None, help=f"Output directory (default: <corpus_path>/{STORE_DIRNAME})")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float32")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--no-normalize", dest="normalize", action="store_false",
+                        help="Store the raw vectors (the engine then searches a normalised copy, not the memmap)")
+    # Normalising is the default; kept so existing scripts still run
+    parser.add_argument("--normalize", dest="normalize", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(args.corpus_path, STORE_DIRNAME)
+    header = convert_csv_parts(
+        [os.path.join(args.corpus_path, p) for p in args.parts],
+        out_path,
+        model_name=args.model,
+        dtype=args.dtype,
+        normalize=args.normalize,
+    )
+    print(f"Wrote {header['count']} x {header['dim']} {header['dtype']} embeddings to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
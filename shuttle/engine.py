@@ -0,0 +1,191 @@
+"""Dense retrieval over a pre-normalised embedding matrix.
+
+Document vectors are L2-normalised once when the engine is built, so cosine
+similarity reduces to a single matrix-vector product per query. Top-k
+selection uses ``np.argpartition`` (O(N)) and only sorts the k survivors.
+"""
+import threading
+
+import numpy as np
+
+# Filters matching at most this fraction of the corpus are served by exact
+# scoring of the matching rows instead of probing the ANN index
+EXACT_FILTER_FRACTION = 0.1
+
+
+def l2_normalize(vectors, dtype=np.float32):
+    """Returns a contiguous copy of `vectors` with unit-length rows.
+
+    Zero rows are left as zeros, matching sklearn's ``normalize``.
+    """
+    vectors = np.array(vectors, dtype=dtype, order="C", copy=True)
+    # Cells that failed numeric coercion in the CSV parts come through as NaN
+    np.nan_to_num(vectors, copy=False)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return vectors
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the `top_k` highest scores, best first.
+
+    Ties are broken by position so the order is deterministic.
+    """
+    n = len(scores)
+    top_k = min(top_k, n)
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < n:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+class DenseSearchEngine:
+    """Cosine-similarity search over a fixed set of document vectors.
+
+    Row i of the matrix corresponds to row i of the corpus DataFrame it was
+    built from, so results can be mapped back with ``corpus.iloc``.
+
+    Top-k retrieval is delegated to an index backend from ``shuttle.index``.
+    Backends are built (or loaded from ``<index_path>/<backend>``) on first
+    use and share the engine's matrix; ``score`` always computes exact
+    similarities.
+
+    With ``normalized=True`` the vectors are used as given (no normalised
+    copy), e.g. the memory-mapped matrix of a normalised embedding store;
+    the ``sq8``/``pq`` backends then score compact codes in memory and read
+    only their re-ranking shortlist from disk.
+    """
+
+    def __init__(self, vectors, ids=None, dtype=np.float32, backend="exact", index_params=None, index_path=None,
+                 normalized=False):
+        self.matrix = vectors if normalized else l2_normalize(vectors, dtype=dtype)
+        self.ids = np.asarray(ids) if ids is not None else None
+        self.default_backend = backend
+        self.index_params = index_params or {}
+        self.index_path = index_path
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, embeddings, dtype=np.float32, **kwargs):
+        """Builds an engine from a DataFrame of embedding columns indexed by cord_uid."""
+        return cls(embeddings.to_numpy(), ids=embeddings.index.to_numpy(), dtype=dtype, **kwargs)
+
+    @classmethod
+    def from_store(cls, store, dtype=np.float32, memory_map=False, **kwargs):
+        """Builds an engine from an ``EmbeddingStore``; with `memory_map` the
+        store's (normalised) memmap is searched in place."""
+        if memory_map:
+            if not store.normalized:
+                raise ValueError(
+                    f"{store.path} holds unnormalised vectors; rebuild it with "
+                    "`python -m shuttle.embedding_store <corpus_path>`"
+                )
+            return cls(store.vectors, ids=store.ids, normalized=True, **kwargs)
+        return cls(store.vectors, ids=store.ids, dtype=dtype, **kwargs)
+
+    def get_index(self, backend=None):
+        """The named backend's index, loading a matching saved index from
+        its directory under `index_path` or building it on first use."""
+        from shuttle.index import build_index, index_dir, load_index
+
+        backend = backend or self.default_backend
+        with self._lock:
+            if backend not in self.indexes:
+                index = None
+                if self.index_path is not None and self.ids is not None:
+                    index = load_index(index_dir(self.index_path, backend), self.matrix, self.ids, backend=backend)
+                if index is None:
+                    index = build_index(backend, self.matrix, **self.index_params.get(backend, {}))
+                self.indexes[backend] = index
+            return self.indexes[backend]
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def normalize_query(self, query_embedding):
+        return l2_normalize(np.reshape(query_embedding, -1), dtype=self.matrix.dtype)
+
+    def score(self, query_embedding):
+        """Cosine similarity of the query against every document."""
+        return self.matrix @ self.normalize_query(query_embedding)
+
+    def search(self, query_embedding, top_k=50, backend=None, mask=None, **search_params):
+        """Returns (row indices, scores) of the `top_k` closest documents, best first.
+
+        `mask` is an optional boolean array over rows (see ``FilterIndex.mask``);
+        only rows where it is True are returned, and up to `top_k` of them are
+        returned whenever that many match. `search_params` are the backend's
+        recall/speed knobs (e.g. ``nprobe``); knobs the chosen backend does not
+        take are ignored.
+        """
+        index = self.get_index(backend)
+        params = {k: v for k, v in search_params.items() if k in index.search_params}
+        query = self.normalize_query(query_embedding)
+        if mask is None:
+            return index.search(query, top_k, **params)
+
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=self.matrix.dtype)
+        # Selective filters: scoring only the matching rows is cheaper than
+        # any index probe, and exact
+        if index.name == "exact" or len(rows) <= EXACT_FILTER_FRACTION * len(self):
+            return self._search_rows(query, top_k, mask, rows)
+        return self._search_overfetch(index, query, top_k, mask, rows, params)
+
+    def search_batch(self, query_embeddings, top_k=50, backend=None, block=256, **search_params):
+        """Searches many queries at once; returns a list of (row indices, scores).
+
+        The exact backend scores each block of queries with a single
+        matrix-matrix product; other backends are queried one by one.
+        """
+        index = self.get_index(backend)
+        params = {k: v for k, v in search_params.items() if k in index.search_params}
+        queries = l2_normalize(np.reshape(query_embeddings, (len(query_embeddings), -1)), dtype=self.matrix.dtype)
+        if index.name != "exact":
+            return [index.search(q, top_k, **params) for q in queries]
+        results = []
+        for start in range(0, len(queries), block):
+            for scores in queries[start:start + block] @ self.matrix.T:
+                best = top_k_indices(scores, top_k)
+                results.append((best, scores[best]))
+        return results
+
+    def _search_rows(self, query, top_k, mask, rows):
+        """Exact top-k restricted to the masked rows."""
+        if 2 * len(rows) < len(self):
+            scores = self.matrix[rows] @ query
+            best = top_k_indices(scores, top_k)
+            return rows[best], scores[best]
+        scores = self.matrix @ query
+        scores[~mask] = -np.inf
+        best = top_k_indices(scores, min(top_k, len(rows)))
+        return best, scores[best]
+
+    def _search_overfetch(self, index, query, top_k, mask, rows, params):
+        """Approximate top-k under a filter: over-fetch from the index in
+        proportion to the filter's selectivity, growing the fetch until
+        `top_k` matches survive, and fall back to exact scoring of the
+        masked rows if the index cannot supply enough of them."""
+        n = len(self)
+        wanted = min(top_k, len(rows))
+        fetch = min(n, 2 * max(top_k, int(np.ceil(top_k * n / len(rows)))))
+        while True:
+            indices, scores = index.search(query, fetch, **params)
+            keep = mask[indices]
+            if keep.sum() >= wanted or fetch >= n:
+                break
+            fetch = min(n, 4 * fetch)
+        if keep.sum() < wanted:
+            return self._search_rows(query, top_k, mask, rows)
+        return indices[keep][:top_k], scores[keep][:top_k]
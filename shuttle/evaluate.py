@@ -0,0 +1,257 @@
+"""Offline batch retrieval and TREC-style evaluation over the qrels files.
+
+All queries are encoded in one batched ``model.encode`` call. The exact dense
+backend then scores them with a single matrix-matrix product per block of
+queries. For every system (dense index backends, BM25 and the hybrid
+modes) the harness:
+
+* writes a TREC run file (``<query-id> Q0 <cord_uid> <rank> <score> <system>``)
+* reports nDCG@k, MAP, P@k and recall@depth, overall and per ``query_type``
+* reports batch throughput (queries/sec) and per-query p50/p95/p99 latency
+
+so quality and speed regressions show up in the same report::
+
+    python -m shuttle.evaluate full_corpus_SBERT_trained \\
+        --queries DEMO_test_queries.csv --qrels DEMO_test_qrels.csv \\
+        --systems exact ivf bm25 rrf
+
+With ``--rerank N`` every system is also evaluated with its top N results
+re-ranked by the cross-encoder (``<system>+rerank``), reporting the nDCG
+gain and the added latency per query.
+
+Relevance follows the qrels ``judgement`` column: graded gains for nDCG,
+``judgement >= 1`` counts as relevant for MAP, P@k and recall. Query
+variants share their topic's judgements through ``topic-id``.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from shuttle.bm25 import build_from_corpus, load_bm25_index
+from shuttle.embedding_store import DEFAULT_MODEL, load_embedding_frame
+from shuttle.engine import DenseSearchEngine
+from shuttle.hybrid import HybridSearcher
+from shuttle.index import BACKENDS
+from shuttle.rerank import DEFAULT_BUDGET_MS, DEFAULT_RERANKER, CrossEncoderReranker, read_document_texts
+from shuttle.text import preprocess_text
+
+LEXICAL_SYSTEMS = ("bm25", "rrf", "weighted")
+SYSTEMS = tuple(BACKENDS) + LEXICAL_SYSTEMS
+
+
+def load_qrels(path):
+    """{topic-id: {cord_uid: judgement}}"""
+    qrels = pd.read_csv(path)
+    judged = {}
+    for topic, doc, judgement in zip(qrels["topic-id"], qrels["cord-id"], qrels["judgement"]):
+        judged.setdefault(topic, {})[doc] = int(judgement)
+    return judged
+
+
+def ndcg_at_k(ranked, judgements, k):
+    gains = np.array([judgements.get(d, 0) for d in ranked[:k]], dtype=np.float64)
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = (gains * discounts[:len(gains)]).sum()
+    ideal = np.sort(np.array(list(judgements.values()), dtype=np.float64))[::-1][:k]
+    idcg = (ideal * discounts[:len(ideal)]).sum()
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def average_precision(ranked, judgements):
+    n_relevant = sum(1 for j in judgements.values() if j >= 1)
+    if n_relevant == 0:
+        return 0.0
+    hits, total = 0, 0.0
+    for rank, d in enumerate(ranked, start=1):
+        if judgements.get(d, 0) >= 1:
+            hits += 1
+            total += hits / rank
+    return total / n_relevant
+
+
+def precision_at_k(ranked, judgements, k):
+    return sum(1 for d in ranked[:k] if judgements.get(d, 0) >= 1) / k
+
+
+def recall(ranked, judgements):
+    n_relevant = sum(1 for j in judgements.values() if j >= 1)
+    if n_relevant == 0:
+        return 0.0
+    return sum(1 for d in ranked if judgements.get(d, 0) >= 1) / n_relevant
+
+
+def evaluate_run(run, queries, qrels, k=10):
+    """Per-query metrics for `run` ({query-id: [cord_uid, ...] best first})."""
+    rows = []
+    for query_id, topic_id, query_type in zip(queries["query-id"], queries["topic-id"], queries["query_type"]):
+        judgements = qrels.get(topic_id, {})
+        ranked = run.get(query_id, [])
+        rows.append({
+            "query-id": query_id,
+            "query_type": query_type,
+            f"nDCG@{k}": ndcg_at_k(ranked, judgements, k),
+            "MAP": average_precision(ranked, judgements),
+            f"P@{k}": precision_at_k(ranked, judgements, k),
+            "recall": recall(ranked, judgements),
+        })
+    return pd.DataFrame(rows)
+
+
+def summarize(per_query):
+    """Mean metrics per query_type plus an "all" row."""
+    metrics = per_query.drop(columns=["query-id"])
+    by_type = metrics.groupby("query_type").mean()
+    by_type.loc["all"] = metrics.drop(columns=["query_type"]).mean()
+    return by_type
+
+
+def write_trec_run(path, run_rows, system):
+    """Writes (query-id, cord_uids, scores) triples as a TREC run file."""
+    with open(path, "w") as f:
+        for query_id, doc_ids, scores in run_rows:
+            for rank, (doc_id, score) in enumerate(zip(doc_ids, scores), start=1):
+                f.write(f"{query_id} Q0 {doc_id} {rank} {score:.6f} {system}\n")
+
+
+def latency_stats(timings):
+    ms = np.asarray(timings) * 1000
+    return {
+        "p50_ms": np.percentile(ms, 50),
+        "p95_ms": np.percentile(ms, 95),
+        "p99_ms": np.percentile(ms, 99),
+    }
+
+
+def run_system(system, engine, searcher, texts, embeddings, depth, search_params):
+    """Runs every query through `system`.
+
+    Returns the per-query (row indices, scores), batch throughput in
+    queries/sec and per-query latencies in seconds.
+    """
+    if system in BACKENDS:
+        engine.get_index(system)  # build outside the timed region
+        start = time.perf_counter()
+        results = engine.search_batch(embeddings, top_k=depth, backend=system, **search_params)
+        qps = len(texts) / (time.perf_counter() - start)
+        search = lambda i: engine.search(embeddings[i], top_k=depth, backend=system, **search_params)
+    else:
+        search = lambda i: searcher.search(texts[i], top_k=depth, mode=system, **search_params)
+        start = time.perf_counter()
+        results = [search(i) for i in range(len(texts))]
+        qps = len(texts) / (time.perf_counter() - start)
+
+    timings = []
+    for i in range(len(texts)):
+        start = time.perf_counter()
+        search(i)
+        timings.append(time.perf_counter() - start)
+    return results, qps, timings
+
+
+def rerank_run(reranker, texts, run_rows, doc_texts, candidates, budget_ms):
+    """Re-ranks the (query-id, cord_uids, scores) rows of a run. Returns the
+    new rows, per-query re-ranking latencies in seconds and the number of
+    queries that fell back to the first-stage order."""
+    reranked, timings, fallbacks = [], [], 0
+    for text, (query_id, doc_ids, scores) in zip(texts, run_rows):
+        start = time.perf_counter()
+        result = reranker.rerank(text, [doc_texts.get(d, "") for d in doc_ids], candidates, budget_ms)
+        timings.append(time.perf_counter() - start)
+        if result is None:
+            fallbacks += 1
+            reranked.append((query_id, doc_ids, scores))
+            continue
+        order, new_scores = result
+        # Rows below the re-ranked ones keep their order; give them scores below
+        new_scores = np.where(np.isnan(new_scores), -np.arange(1, len(order) + 1), new_scores)
+        reranked.append((query_id, [doc_ids[i] for i in order], new_scores.tolist()))
+    return reranked, timings, fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch retrieval + TREC evaluation over the qrels files.")
+    parser.add_argument("corpus_path", help="Directory holding the embeddings and metadata")
+    parser.add_argument("--queries", default="DEMO_test_queries.csv")
+    parser.add_argument("--qrels", default="DEMO_test_qrels.csv")
+    parser.add_argument("--systems", nargs="+", choices=SYSTEMS, default=["exact"])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--depth", type=int, default=100, help="Documents retrieved per query (recall cutoff)")
+    parser.add_argument("--k", type=int, default=10, help="Cutoff for nDCG@k and P@k")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--run-dir", default="runs", help="Where TREC run files are written")
+    parser.add_argument("--rerank", type=int, default=0, help="Also re-rank the top N with the cross-encoder")
+    parser.add_argument("--rerank-model", default=DEFAULT_RERANKER)
+    parser.add_argument("--rerank-budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Per-query re-ranking time budget (0: unlimited)")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    queries = pd.read_csv(args.queries)
+    qrels = load_qrels(args.qrels)
+    texts = [preprocess_text(q) for q in queries["query"]]
+
+    model = SentenceTransformer(args.model)
+    start = time.perf_counter()
+    embeddings = model.encode(texts, convert_to_tensor=False, batch_size=args.batch_size)
+    encode_secs = time.perf_counter() - start
+    print(f"Encoded {len(texts)} queries in {encode_secs:.2f}s ({len(texts) / encode_secs:.1f} queries/sec)")
+
+    embedding_frame = load_embedding_frame(args.corpus_path)
+    engine = DenseSearchEngine.from_frame(embedding_frame)
+    doc_ids = engine.ids
+
+    searcher = None
+    if any(s in LEXICAL_SYSTEMS for s in args.systems):
+        bm25 = load_bm25_index(args.corpus_path) or build_from_corpus(args.corpus_path)
+        encoded = dict(zip(texts, embeddings))
+        searcher = HybridSearcher(engine, bm25.align(embedding_frame.index), encode=encoded.__getitem__)
+
+    reranker = CrossEncoderReranker.load(args.rerank_model) if args.rerank else None
+
+    os.makedirs(args.run_dir, exist_ok=True)
+    search_params = {"nprobe": args.nprobe, "ef_search": args.ef_search}
+    speed = []
+    for system in args.systems:
+        results, qps, timings = run_system(system, engine, searcher, texts, embeddings, args.depth, search_params)
+        run_rows = [
+            (query_id, doc_ids[rows].tolist(), scores.tolist())
+            for query_id, (rows, scores) in zip(queries["query-id"], results)
+        ]
+        write_trec_run(os.path.join(args.run_dir, f"{system}.run"), run_rows, system)
+
+        run = {query_id: ranked for query_id, ranked, _ in run_rows}
+        print(f"\n== {system} ==")
+        summary = summarize(evaluate_run(run, queries, qrels, k=args.k))
+        print(summary.to_string(float_format=lambda x: f"{x:.4f}"))
+        speed.append({"system": system, "queries/sec": qps, **latency_stats(timings)})
+
+        if reranker is not None:
+            doc_texts = read_document_texts(
+                args.corpus_path, sorted({d for _, ranked, _ in run_rows for d in ranked[:args.rerank]})
+            )
+            rerank_rows, rerank_timings, fallbacks = rerank_run(
+                reranker, texts, run_rows, doc_texts, args.rerank, args.rerank_budget_ms
+            )
+            name = f"{system}+rerank"
+            write_trec_run(os.path.join(args.run_dir, f"{name}.run"), rerank_rows, name)
+            reranked_summary = summarize(evaluate_run(
+                {query_id: ranked for query_id, ranked, _ in rerank_rows}, queries, qrels, k=args.k
+            ))
+            gain = reranked_summary.loc["all", f"nDCG@{args.k}"] - summary.loc["all", f"nDCG@{args.k}"]
+            print(f"\n== {name} (top {args.rerank}, {fallbacks} budget fallbacks, nDCG@{args.k} {gain:+.4f}) ==")
+            print(reranked_summary.to_string(float_format=lambda x: f"{x:.4f}"))
+            total = np.asarray(timings) + np.asarray(rerank_timings)
+            speed.append({"system": name, "queries/sec": len(texts) / total.sum(), **latency_stats(total)})
+
+    print("\n== speed (search only; query encoding reported above) ==")
+    print(pd.DataFrame(speed).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Columnar filter index for date, tag and citation filters.
+
+The corpus filter columns are compiled once into:
+
+* a sorted day-number array plus its argsort, so a date range is two
+  binary searches
+* a posting list (sorted int32 row numbers) per tag, from ``TagIndex``
+* a dense citation-count array
+
+``FilterIndex.mask`` turns a filter selection into a boolean row mask that is
+handed to the search engine *before* scoring, so filtered queries return the
+best `top_k` matching documents rather than whatever survives post-filtering
+a fixed shortlist. ``FilterIndex.ordering`` gives the row orders browsing
+('*' queries) can sort by, computed once per index.
+"""
+import numpy as np
+import pandas as pd
+
+# Browse orders: corpus order, most cited first, newest first, oldest first
+SORT_ORDERS = ("corpus", "citations", "newest", "oldest")
+SORT_LABELS = {
+    "corpus": "Corpus order",
+    "citations": "Most cited",
+    "newest": "Newest first",
+    "oldest": "Oldest first",
+}
+
+
+def to_day(value):
+    """Day number (days since epoch) of a date/datetime/Timestamp."""
+    return pd.Timestamp(value).to_datetime64().astype("datetime64[D]").astype(np.int64)
+
+
+class FilterIndex:
+    """Precomputed filter structures over corpus rows (positional order)."""
+
+    def __init__(self, days, citations, tag_index):
+        self.days = days
+        self.date_order = np.argsort(days, kind="stable")
+        self.sorted_days = days[self.date_order]
+        self.citations = citations
+        self.missing_citations = bool(np.isnan(citations).any())
+        self.tag_index = tag_index
+        self._orderings = {}
+
+    @classmethod
+    def from_corpus(cls, corpus, tag_index):
+        """Builds the index over corpus rows; `tag_index` is re-aligned to them."""
+        # NaT converts to the smallest int64, so undated rows sort first and
+        # never fall inside a date range
+        days = corpus["publish_time"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        citations = corpus["referenced_by_count"].to_numpy(dtype=np.float64)
+        return cls(days, citations, tag_index.align(corpus.index))
+
+    def __len__(self):
+        return len(self.days)
+
+    def ordering(self, sort="corpus"):
+        """Row numbers in `sort` order (one of SORT_ORDERS); undated rows and
+        rows without a citation count come last. None for corpus order."""
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"sort must be one of {SORT_ORDERS}, got {sort!r}")
+        if sort == "corpus":
+            return None
+        if sort not in self._orderings:
+            # Undated rows hold the smallest day number and sort first
+            undated = int(np.searchsorted(self.sorted_days, np.iinfo(np.int64).min, side="right"))
+            if sort == "citations":
+                # Stable descending sort with NaN counts last
+                order = np.argsort(-np.nan_to_num(self.citations, nan=-np.inf), kind="stable")
+            elif sort == "newest":
+                order = self.date_order[::-1]
+            else:
+                order = np.concatenate([self.date_order[undated:], self.date_order[:undated]])
+            self._orderings[sort] = np.ascontiguousarray(order)
+        return self._orderings[sort]
+
+    def matching_rows(self, mask, sort="corpus"):
+        """Rows passing `mask` (None: all rows) in `sort` order; a range when
+        no array is needed."""
+        order = self.ordering(sort)
+        if order is None:
+            return range(len(self)) if mask is None else np.flatnonzero(mask)
+        return order if mask is None else order[mask[order]]
+
+    def date_rows(self, start_date=None, end_date=None):
+        """Row numbers published within [start_date, end_date] (inclusive
+        days; None leaves that end open). Undated rows never match."""
+        if start_date is None:
+            lo = np.searchsorted(self.sorted_days, np.iinfo(np.int64).min, side="right")
+        else:
+            lo = np.searchsorted(self.sorted_days, to_day(start_date), side="left")
+        if end_date is None:
+            hi = len(self.sorted_days)
+        else:
+            hi = np.searchsorted(self.sorted_days, to_day(end_date), side="right")
+        return self.date_order[lo:hi]
+
+    def tag_rows(self, tags, match="any"):
+        """Row numbers carrying any (or, with match="all", every) of `tags`."""
+        if match == "all":
+            return self.tag_index.rows_all(tags)
+        return self.tag_index.rows_any(tags)
+
+    def mask(self, start_date=None, end_date=None, tags=None, tag_match="any", min_refs=0):
+        """Boolean mask of rows passing every active filter, or None if no
+        filter is active (every row passes)."""
+        mask = None
+
+        if start_date is not None or end_date is not None:
+            # Not pd.Timestamp.min/max for an open end: their day numbers
+            # overflow (Timestamp.min comes out in 2262)
+            rows = self.date_rows(start_date, end_date)
+            if len(rows) < len(self):
+                mask = np.zeros(len(self), dtype=bool)
+                mask[rows] = True
+
+        if tags:
+            tag_mask = np.zeros(len(self), dtype=bool)
+            tag_mask[self.tag_rows(tags, tag_match)] = True
+            mask = tag_mask if mask is None else mask & tag_mask
+
+        # NaN citation counts never pass, as with the pandas comparison, so
+        # even min_refs=0 filters when some counts are missing
+        if min_refs is not None and (min_refs > 0 or self.missing_citations):
+            refs_mask = self.citations >= min_refs
+            mask = refs_mask if mask is None else mask & refs_mask
+
+        return mask
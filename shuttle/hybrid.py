@@ -0,0 +1,101 @@
+"""Hybrid lexical + dense retrieval with rank fusion.
+
+Modes, selectable per query:
+
+* ``dense`` - SBERT cosine similarity only (the original ranking)
+* ``bm25`` - BM25 only
+* ``rrf`` - reciprocal-rank fusion of the dense and BM25 rankings
+* ``weighted`` - weighted sum of min-max normalised dense and BM25 scores
+
+In the hybrid modes both legs retrieve ``depth`` candidates concurrently on
+a shared thread pool (query encoding, the BLAS product and the numpy BM25
+accumulation all release the GIL for most of their runtime), so hybrid
+latency stays close to the slower leg.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from shuttle.engine import top_k_indices
+
+MODES = ("dense", "bm25", "rrf", "weighted")
+MODE_LABELS = {
+    "dense": "Semantic (SBERT)",
+    "bm25": "Keyword (BM25)",
+    "rrf": "Hybrid (reciprocal rank)",
+    "weighted": "Hybrid (weighted score)",
+}
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """Fuses rankings (arrays of row indices, best first) by summing
+    1 / (k + rank) per document. Returns (rows, fused scores), best first."""
+    rows = np.concatenate([np.asarray(r, dtype=np.int64) for r in rankings])
+    if len(rows) == 0:
+        return rows, np.empty(0)
+    contributions = np.concatenate([1.0 / (k + np.arange(1, len(r) + 1)) for r in rankings])
+    unique, inverse = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    best = top_k_indices(fused, top_k)
+    return unique[best], fused[best]
+
+
+def _min_max(scores):
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores, dtype=np.float64)
+    return (scores - low) / (high - low)
+
+
+def weighted_fusion(results, weights, top_k):
+    """Fuses (rows, scores) pairs by a weighted sum of per-leg min-max
+    normalised scores; a document missing from a leg scores 0 there."""
+    rows = np.concatenate([np.asarray(r, dtype=np.int64) for r, _ in results])
+    if len(rows) == 0:
+        return rows, np.empty(0)
+    contributions = np.concatenate([w * _min_max(np.asarray(s, dtype=np.float64)) for (_, s), w in zip(results, weights)])
+    unique, inverse = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    best = top_k_indices(fused, top_k)
+    return unique[best], fused[best]
+
+
+class HybridSearcher:
+    """Runs the dense and BM25 legs and fuses them according to the mode.
+
+    `encode` turns query text into an embedding (e.g. ``model.encode``).
+    """
+
+    def __init__(self, engine, bm25, encode, depth=100, rrf_k=60, dense_weight=0.5, max_workers=4):
+        self.engine = engine
+        self.bm25 = bm25
+        self.encode = encode
+        self.depth = depth
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hybrid")
+
+    def dense(self, query, top_k, mask=None, backend=None, **search_params):
+        embedding = self.encode(query)
+        return self.engine.search(embedding, top_k=top_k, backend=backend, mask=mask, **search_params)
+
+    def search(self, query, top_k=50, mode="dense", mask=None, backend=None, **search_params):
+        """Returns (row indices, scores) best first. Scores are cosine
+        similarities in ``dense`` mode, BM25 scores in ``bm25`` mode and
+        fused scores otherwise."""
+        if mode == "dense":
+            return self.dense(query, top_k, mask=mask, backend=backend, **search_params)
+        if mode == "bm25":
+            return self.bm25.search(query, top_k, mask=mask)
+        if mode not in MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; choose from {MODES}")
+
+        depth = max(top_k, self.depth)
+        dense = self.pool.submit(self.dense, query, depth, mask, backend, **search_params)
+        lexical = self.pool.submit(self.bm25.search, query, depth, mask)
+        dense, lexical = dense.result(), lexical.result()
+        if mode == "rrf":
+            return reciprocal_rank_fusion([dense[0], lexical[0]], top_k, k=self.rrf_k)
+        return weighted_fusion([dense, lexical], [self.dense_weight, 1 - self.dense_weight], top_k)
@@ -0,0 +1,449 @@
+"""Pluggable nearest-neighbour index backends.
+
+Every backend indexes an L2-normalised float matrix (see ``engine.l2_normalize``)
+and exposes the same interface:
+
+* ``search(query, top_k, **params)`` -> (row indices, scores), best first
+* ``search_params`` - the per-query recall/speed knobs it accepts and their defaults
+* ``save(path)`` / ``load(path, matrix)`` to skip rebuilding on startup
+
+Backends:
+
+* ``exact`` - brute-force inner product, the reference ranking
+* ``ivf`` - inverted-file index over spherical k-means clusters, pure numpy;
+  ``nprobe`` clusters are scanned per query
+* ``hnsw`` - HNSW graph via the optional ``hnswlib`` package; ``ef_search``
+  controls the candidate list size
+* ``sq8`` - per-dimension int8 scalar quantization (4x smaller than float32)
+* ``pq`` - product quantization, one byte per subspace (``m`` bytes per
+  document, 32x smaller than float32 at the default m=96)
+
+``sq8`` and ``pq`` score every document on their compact codes, then
+re-rank a shortlist of ``rerank`` candidates with the full-precision
+vectors. Paired with a memory-mapped store (``DenseSearchEngine(...,
+normalized=True)``) only the codes and the shortlist rows are in memory.
+
+Build and persist an index from the embedding parts with::
+
+    python -m shuttle.index full_corpus_SBERT_trained --backend ivf
+
+Each backend is saved in its own directory, ``<corpus>/index/<backend>``,
+so prebuilt indexes of different backends live side by side and the
+engine loads the one it was asked for.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from shuttle.engine import l2_normalize, top_k_indices
+
+INDEX_DIRNAME = "index"
+
+
+class ExactIndex:
+    name = "exact"
+    search_params = {}
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, query, top_k):
+        scores = self.matrix @ query
+        indices = top_k_indices(scores, top_k)
+        return indices, scores[indices]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        _write_meta(path, self.name, {}, len(self.matrix))
+
+    @classmethod
+    def load(cls, path, matrix):
+        return cls(matrix)
+
+
+def _spherical_kmeans(x, n_clusters, n_iter, rng, block=65536):
+    """Cosine k-means; returns unit-length centroids."""
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(x, centroids, block)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=n_clusters)
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+        centroids = l2_normalize(sums, dtype=x.dtype)
+    return centroids
+
+
+def _assign(x, centroids, block=65536):
+    # Blocked so the (N x n_clusters) score matrix never has to fit in memory
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), block):
+        assign[start:start + block] = np.argmax(x[start:start + block] @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """Inverted-file index: documents are bucketed by nearest centroid and a
+    query only scores the documents in its ``nprobe`` closest buckets."""
+
+    name = "ivf"
+    search_params = {"nprobe": 16}
+
+    def __init__(self, matrix, centroids, order, offsets, nprobe=16):
+        self.matrix = matrix
+        self.centroids = centroids
+        # Row ids grouped by list: list l holds order[offsets[l]:offsets[l + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, nprobe=16, n_iter=10, train_size=None, seed=0):
+        n = len(matrix)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+        train_size = min(n, train_size or 64 * n_lists)
+        sample = matrix[np.sort(rng.choice(n, train_size, replace=False))]
+        centroids = _spherical_kmeans(sample, n_lists, n_iter, rng)
+
+        assign = _assign(matrix, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(matrix, centroids, order, offsets, nprobe=nprobe)
+
+    def search(self, query, top_k, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+        scores = self.matrix[candidates] @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "order.npy"), self.order)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        _write_meta(path, self.name, {"nprobe": self.nprobe}, len(self.matrix))
+
+    @classmethod
+    def load(cls, path, matrix):
+        meta = _read_meta(path)
+        return cls(
+            matrix,
+            np.load(os.path.join(path, "centroids.npy")),
+            np.load(os.path.join(path, "order.npy")),
+            np.load(os.path.join(path, "offsets.npy")),
+            **meta["params"],
+        )
+
+
+class HNSWIndex:
+    """HNSW graph index backed by ``hnswlib`` (optional dependency)."""
+
+    name = "hnsw"
+    search_params = {"ef_search": 64}
+
+    def __init__(self, graph, ef_search=64):
+        self.graph = graph
+        self.ef_search = ef_search
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The hnsw backend needs hnswlib: pip install hnswlib") from e
+        return hnswlib
+
+    @classmethod
+    def build(cls, matrix, m=16, ef_construction=200, ef_search=64, seed=0):
+        hnswlib = cls._hnswlib()
+        graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.init_index(max_elements=len(matrix), ef_construction=ef_construction, M=m, random_seed=seed)
+        graph.add_items(matrix, np.arange(len(matrix)))
+        return cls(graph, ef_search=ef_search)
+
+    def search(self, query, top_k, ef_search=None):
+        top_k = min(top_k, self.graph.get_current_count())
+        # ef must be at least k for hnswlib to return k results
+        self.graph.set_ef(max(ef_search or self.ef_search, top_k))
+        labels, distances = self.graph.knn_query(query.reshape(1, -1), k=top_k)
+        # "ip" distance is 1 - inner product
+        return labels[0].astype(np.int64), (1 - distances[0]).astype(query.dtype)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.graph.save_index(os.path.join(path, "graph.bin"))
+        _write_meta(path, self.name, {"ef_search": self.ef_search}, self.graph.get_current_count())
+
+    @classmethod
+    def load(cls, path, matrix):
+        hnswlib = cls._hnswlib()
+        meta = _read_meta(path)
+        graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.load_index(os.path.join(path, "graph.bin"), max_elements=len(matrix))
+        return cls(graph, **meta["params"])
+
+
+def _blocked(n, score_block, block=65536):
+    """Scores rows [0, n) block by block, so decoded blocks stay small."""
+    scores = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block):
+        scores[start:start + block] = score_block(start, min(n, start + block))
+    return scores
+
+
+def _rerank(matrix, query, candidates, top_k):
+    """Exact top-k among `candidates`, reading only their full-precision rows."""
+    candidates = np.sort(candidates)  # ascending rows read a memmap sequentially
+    scores = np.asarray(matrix[candidates], dtype=np.float32) @ query.astype(np.float32)
+    best = top_k_indices(scores, top_k)
+    return candidates[best], scores[best]
+
+
+class SQ8Index:
+    """int8 scalar quantization: each dimension is scaled by its largest
+    absolute value to [-127, 127]."""
+
+    name = "sq8"
+    search_params = {"rerank": 200}
+
+    def __init__(self, matrix, codes, scale, rerank=200):
+        self.matrix = matrix
+        self.codes = codes
+        self.scale = scale
+        self.rerank = rerank
+
+    @classmethod
+    def build(cls, matrix, rerank=200, block=65536):
+        peak = np.zeros(matrix.shape[1], dtype=np.float32)
+        for start in range(0, len(matrix), block):
+            peak = np.maximum(peak, np.abs(np.asarray(matrix[start:start + block], dtype=np.float32)).max(axis=0))
+        scale = np.where(peak > 0, peak / 127, 1).astype(np.float32)
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, len(matrix), block):
+            rows = np.asarray(matrix[start:start + block], dtype=np.float32)
+            codes[start:start + block] = np.clip(np.rint(rows / scale), -127, 127)
+        return cls(matrix, codes, scale, rerank=rerank)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.nbytes
+
+    def search(self, query, top_k, rerank=None):
+        scaled = (query * self.scale).astype(np.float32)
+        approx = _blocked(len(self.codes), lambda a, b: self.codes[a:b].astype(np.float32) @ scaled, block=16384)
+        shortlist = top_k_indices(approx, max(top_k, rerank or self.rerank))
+        return _rerank(self.matrix, query, shortlist, top_k)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+        np.save(os.path.join(path, "scale.npy"), self.scale)
+        _write_meta(path, self.name, {"rerank": self.rerank}, len(self.codes))
+
+    @classmethod
+    def load(cls, path, matrix):
+        meta = _read_meta(path)
+        return cls(
+            matrix,
+            np.load(os.path.join(path, "codes.npy")),
+            np.load(os.path.join(path, "scale.npy")),
+            **meta["params"],
+        )
+
+
+def _kmeans(x, n_clusters, n_iter, rng):
+    """Euclidean k-means (for PQ codebooks); returns the centroids."""
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+    return centroids
+
+
+def _nearest(x, centroids):
+    # argmin ||x - c||^2 = argmax (x.c - ||c||^2 / 2)
+    return np.argmax(x @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+
+
+class PQIndex:
+    """Product quantization: the vector is split into `m` subspaces, each
+    coded as the nearest of 256 centroids; a query scores a document by
+    summing per-subspace lookup-table entries."""
+
+    name = "pq"
+    search_params = {"rerank": 200}
+
+    def __init__(self, matrix, codebooks, codes, rerank=200):
+        self.matrix = matrix
+        # (m, 256, dim / m) centroids and (N, m) uint8 codes
+        self.codebooks = codebooks
+        self.codes = codes
+        self.rerank = rerank
+        self._subspaces = np.arange(len(codebooks))
+
+    @classmethod
+    def build(cls, matrix, m=96, n_iter=10, train_size=None, rerank=200, seed=0, block=65536):
+        n, dim = matrix.shape
+        if dim % m:
+            raise ValueError(f"pq: m={m} must divide the embedding dimension {dim}")
+        sub = dim // m
+        rng = np.random.default_rng(seed)
+        train_size = min(n, train_size or 256 * 64)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, train_size, replace=False))], dtype=np.float32)
+        n_centroids = min(256, train_size)
+        codebooks = np.stack([
+            _kmeans(sample[:, j * sub:(j + 1) * sub], n_centroids, n_iter, rng) for j in range(m)
+        ]).astype(np.float32)
+
+        codes = np.empty((n, m), dtype=np.uint8)
+        for start in range(0, n, block):
+            rows = np.asarray(matrix[start:start + block], dtype=np.float32)
+            for j in range(m):
+                codes[start:start + block, j] = _nearest(rows[:, j * sub:(j + 1) * sub], codebooks[j])
+        return cls(matrix, codebooks, codes, rerank=rerank)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def search(self, query, top_k, rerank=None):
+        m, _, sub = self.codebooks.shape
+        # lut[j, c] = <query subvector j, centroid c of subspace j>
+        lut = np.einsum("mcd,md->mc", self.codebooks, query.astype(np.float32).reshape(m, sub))
+        approx = _blocked(len(self.codes), lambda a, b: lut[self._subspaces, self.codes[a:b]].sum(axis=1), block=16384)
+        shortlist = top_k_indices(approx, max(top_k, rerank or self.rerank))
+        return _rerank(self.matrix, query, shortlist, top_k)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "codebooks.npy"), self.codebooks)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+        _write_meta(path, self.name, {"rerank": self.rerank}, len(self.codes))
+
+    @classmethod
+    def load(cls, path, matrix):
+        meta = _read_meta(path)
+        return cls(
+            matrix,
+            np.load(os.path.join(path, "codebooks.npy")),
+            np.load(os.path.join(path, "codes.npy")),
+            **meta["params"],
+        )
+
+
+BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+    HNSWIndex.name: HNSWIndex,
+    SQ8Index.name: SQ8Index,
+    PQIndex.name: PQIndex,
+}
+
+
+def build_index(backend, matrix, **params):
+    """Builds the named backend over an L2-normalised matrix."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown index backend {backend!r}; choose from {sorted(BACKENDS)}")
+    if backend == ExactIndex.name:
+        return ExactIndex(matrix)
+    return BACKENDS[backend].build(matrix, **params)
+
+
+def ids_digest(ids):
+    """Fingerprint of the row order an index was built over."""
+    return hashlib.sha1("\n".join(map(str, ids)).encode("utf-8")).hexdigest()
+
+
+def index_dir(root, backend):
+    """Directory of `backend`'s saved index under the index root."""
+    return os.path.join(root, backend)
+
+
+def save_index(index, path, ids):
+    index.save(path)
+    meta = _read_meta(path)
+    meta["ids_digest"] = ids_digest(ids)
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_index(path, matrix, ids, backend=None):
+    """Loads a saved index, or returns None if `path` holds none, holds a
+    different backend, or was built over a different row order."""
+    if not os.path.exists(os.path.join(path, "index.json")):
+        return None
+    meta = _read_meta(path)
+    if backend is not None and meta["backend"] != backend:
+        return None
+    if meta["count"] != len(matrix) or meta.get("ids_digest") != ids_digest(ids):
+        return None
+    return BACKENDS[meta["backend"]].load(path, matrix)
+
+
+def _write_meta(path, backend, params, count):
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"backend": backend, "params": params, "count": count}, f, indent=2)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, "index.json")) as f:
+        return json.load(f)
+
+
+def main():
+    from shuttle.embedding_store import load_embedding_frame
+
+    parser = argparse.ArgumentParser(description="Build and save a nearest-neighbour index from the embedding parts.")
+    parser.add_argument("corpus_path", help="Directory holding the embedding store or embeddings_part*.csv.gz")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=IVFIndex.name)
+    parser.add_argument("--out", default=None,
+                        help=f"Index root; written to <out>/<backend> (default: <corpus_path>/{INDEX_DIRNAME})")
+    parser.add_argument("--n-lists", type=int, default=None, help="ivf: number of clusters (default 4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, default=IVFIndex.search_params["nprobe"])
+    parser.add_argument("--m", type=int, default=16, help="hnsw: graph degree")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, default=HNSWIndex.search_params["ef_search"])
+    parser.add_argument("--pq-m", type=int, default=96, help="pq: subspaces (bytes per document)")
+    parser.add_argument("--rerank", type=int, default=PQIndex.search_params["rerank"],
+                        help="sq8/pq: candidates re-ranked with full-precision vectors")
+    args = parser.parse_args()
+
+    embeddings = load_embedding_frame(args.corpus_path)
+    matrix = l2_normalize(embeddings.to_numpy())
+    if args.backend == IVFIndex.name:
+        params = {"n_lists": args.n_lists, "nprobe": args.nprobe}
+    elif args.backend == HNSWIndex.name:
+        params = {"m": args.m, "ef_construction": args.ef_construction, "ef_search": args.ef_search}
+    elif args.backend == SQ8Index.name:
+        params = {"rerank": args.rerank}
+    elif args.backend == PQIndex.name:
+        params = {"m": args.pq_m, "rerank": args.rerank}
+    else:
+        params = {}
+    index = build_index(args.backend, matrix, **params)
+
+    out_path = index_dir(args.out or os.path.join(args.corpus_path, INDEX_DIRNAME), args.backend)
+    save_index(index, out_path, embeddings.index)
+    print(f"Wrote {args.backend} index over {len(matrix)} documents to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
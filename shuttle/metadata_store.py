@@ -0,0 +1,144 @@
+"""Columnar (Parquet) metadata store with lazy row access.
+
+The converter parses the metadata CSV parts once - including the slow
+``publish_time`` parse with ``format='mixed', dayfirst=True`` - and writes a
+typed Parquet file in small row groups. At startup only the filter columns
+are read in full; heavy text columns (title, abstract, summary, url, ...)
+are read with ``MetadataStore.take`` for just the rows being displayed,
+touching only the row groups that hold them.
+
+    python -m shuttle.metadata_store full_corpus_SBERT_trained
+"""
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from shuttle.tag_index import METADATA_FILES, TagIndex, save_tag_index
+
+METADATA_STORE_FILE = "metadata.parquet"
+# Columns needed for every query (filters, sidebar stats); everything else
+# is loaded lazily per displayed row
+EAGER_COLUMNS = ["publish_time", "referenced_by_count"]
+ROW_GROUP_SIZE = 2048
+
+
+def parse_dates(values):
+    return pd.to_datetime(values, format='mixed', dayfirst=True)
+
+
+class MetadataStore:
+    """Read access to ``metadata.parquet``: whole columns or selected rows."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = pq.ParquetFile(path)
+        self.columns = [c for c in self.file.schema_arrow.names if c != "cord_uid"]
+        sizes = [self.file.metadata.row_group(g).num_rows for g in range(self.file.num_row_groups)]
+        self.group_starts = np.concatenate([[0], np.cumsum(sizes)])
+        self.ids = pd.Index(self.file.read(columns=["cord_uid"]).column(0).to_pandas(), name="cord_uid")
+        # ParquetFile readers are not safe to share between Streamlit threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def read(self, columns=EAGER_COLUMNS):
+        """Whole columns as a DataFrame indexed by cord_uid."""
+        with self._lock:
+            table = self.file.read(columns=list(columns))
+        df = table.to_pandas()
+        df.index = self.ids
+        return df
+
+    def take(self, ids, columns):
+        """`columns` for the documents `ids`, in that order, reading only the
+        row groups that contain them. Unknown ids come back as missing values."""
+        positions = self.ids.get_indexer(ids)
+        found = positions[positions >= 0]
+        if len(found) == 0:
+            return pd.DataFrame(index=pd.Index(ids, name="cord_uid"), columns=list(columns))
+
+        group_of = np.searchsorted(self.group_starts, found, side="right") - 1
+        groups = np.unique(group_of)
+        with self._lock:
+            table = self.file.read_row_groups(groups.tolist(), columns=list(columns))
+        # Offset of each selected group inside the concatenated table
+        sizes = self.group_starts[groups + 1] - self.group_starts[groups]
+        local_start = dict(zip(groups, np.concatenate([[0], np.cumsum(sizes)[:-1]])))
+        local = found - self.group_starts[group_of] + np.array([local_start[g] for g in group_of])
+
+        df = table.take(pa.array(local)).to_pandas()
+        df.index = self.ids[found]
+        return df.reindex(pd.Index(ids, name="cord_uid"))
+
+
+def open_metadata_store(corpus_path, metadata_files=METADATA_FILES):
+    """The metadata store for a corpus directory, or None when it is missing
+    or older than any of the metadata CSV parts."""
+    path = os.path.join(corpus_path, METADATA_STORE_FILE)
+    if not os.path.exists(path):
+        return None
+    built = os.path.getmtime(path)
+    for f in metadata_files:
+        csv_path = os.path.join(corpus_path, f)
+        if os.path.exists(csv_path) and os.path.getmtime(csv_path) > built:
+            return None
+    return MetadataStore(path)
+
+
+def convert_csv_parts(csv_paths, out_path, chunksize=20000):
+    """Converts metadata CSV parts into one Parquet file, chunk by chunk.
+
+    Returns the tag index built from the ``tags`` column on the way through.
+    """
+    writer = None
+    schema = None
+    ids, tags = [], []
+    try:
+        for csv_path in csv_paths:
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                chunk['cord_uid'] = chunk['cord_uid'].astype(str)
+                chunk['publish_time'] = parse_dates(chunk['publish_time'])
+                # Integer columns turn float in chunks with missing values, so
+                # store every numeric column as float64 for one stable schema
+                for col in chunk.select_dtypes(include='number').columns:
+                    chunk[col] = chunk[col].astype('float64')
+                ids.extend(chunk['cord_uid'])
+                tags.extend(chunk['tags'])
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    # Text columns that happen to be empty in the first chunk
+                    # would otherwise be typed as null
+                    schema = pa.schema([
+                        pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                        for f in table.schema
+                    ]).remove_metadata()
+                    writer = pq.ParquetWriter(out_path, schema)
+                writer.write_table(table.cast(schema), row_group_size=ROW_GROUP_SIZE)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("No metadata rows found in the given CSV parts")
+    return TagIndex.from_strings(np.array(ids), tags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the metadata CSV parts into a Parquet store.")
+    parser.add_argument("corpus_path", help="Directory holding metadata_part*_final.csv")
+    parser.add_argument("--parts", nargs="+", default=METADATA_FILES)
+    args = parser.parse_args()
+
+    out_path = os.path.join(args.corpus_path, METADATA_STORE_FILE)
+    tag_index = convert_csv_parts([os.path.join(args.corpus_path, p) for p in args.parts], out_path)
+    save_tag_index(args.corpus_path, tag_index)
+    print(f"Wrote {len(tag_index)} rows to {out_path} and the tag index alongside it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""ONNX Runtime (optionally int8) query encoder for CPU-only nodes.
+
+Export a local copy of the SBERT model - no network access is needed or
+attempted - to ONNX, optionally with dynamic int8 weight quantization::
+
+    python -m shuttle.onnx_encoder export models/sbert-IR-covid-search-v2 models/sbert-onnx --int8
+
+then check retrieval quality of each exported variant against the PyTorch
+model on the qrels. A variant whose nDCG@10 drops by more than
+``--max-drop`` is marked as failed in the manifest and cannot be loaded::
+
+    python -m shuttle.onnx_encoder check models/sbert-onnx full_corpus_SBERT_trained \\
+        --reference models/sbert-IR-covid-search-v2
+
+The export directory holds ``model.onnx`` (and ``model_int8.onnx``), the
+tokenizer, and ``encoder.json`` with the pooling settings and the quality
+check results. Select the encoder at runtime with ``SHUTTLE_ENCODER``
+(``torch``, ``onnx`` or ``onnx-int8``) and ``SHUTTLE_ONNX_PATH``.
+
+Needs the optional ``onnxruntime`` package (``pip install onnxruntime``).
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+MANIFEST_FILE = "encoder.json"
+VARIANTS = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+ENCODERS = ("torch",) + tuple(VARIANTS)
+DEFAULT_MAX_DROP = 0.01
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def variant_fingerprint(path, variant):
+    """Size and modification time of an exported variant's model file."""
+    stat = os.stat(os.path.join(path, VARIANTS[variant]))
+    return f"{stat.st_size}:{stat.st_mtime:.0f}"
+
+
+def write_manifest(path, manifest):
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The ONNX encoder needs onnxruntime: pip install onnxruntime") from e
+    return onnxruntime
+
+
+def load_reference(model_dir):
+    """The PyTorch SentenceTransformer, from a local directory only."""
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    from sentence_transformers import SentenceTransformer
+
+    if not os.path.isdir(model_dir):
+        raise FileNotFoundError(f"{model_dir} is not a local model directory")
+    return SentenceTransformer(model_dir, device="cpu")
+
+
+def export(model_dir, out_dir, int8=False, opset=14):
+    """Exports the transformer of the SentenceTransformer in `model_dir`;
+    pooling and normalisation are re-done in numpy by ``OnnxEncoder``."""
+    import torch
+    from sentence_transformers.models import Normalize, Pooling
+
+    if int8:
+        _onnxruntime()  # quantization runs last; fail before the export
+    model = load_reference(model_dir)
+    transformer = model[0].auto_model.eval()
+    transformer.config.return_dict = False  # plain tuple outputs for tracing
+    tokenizer = model.tokenizer
+    pooling = next(m for m in model if isinstance(m, Pooling)).get_pooling_mode_str()
+    if pooling not in ("mean", "cls", "max"):
+        raise ValueError(f"Unsupported pooling mode {pooling!r}")
+    input_names = list(tokenizer.model_input_names)
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample = tokenizer(["sample query"], return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "tokens"}
+    fp32_path = os.path.join(out_dir, VARIANTS["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(out_dir)
+
+    variants = ["onnx"]
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, os.path.join(out_dir, VARIANTS["onnx-int8"]), weight_type=QuantType.QInt8)
+        variants.append("onnx-int8")
+
+    write_manifest(out_dir, {
+        "source": os.path.abspath(model_dir),
+        "input_names": input_names,
+        "pooling": pooling,
+        "normalize": any(isinstance(m, Normalize) for m in model),
+        "max_seq_length": model.max_seq_length,
+        "variants": variants,
+        "quality": {},
+    })
+    return variants
+
+
+def pool(token_embeddings, attention_mask, mode):
+    mask = attention_mask[..., None].astype(token_embeddings.dtype)
+    if mode == "cls":
+        return token_embeddings[:, 0]
+    if mode == "max":
+        return np.where(mask > 0, token_embeddings, -np.inf).max(axis=1)
+    return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class OnnxEncoder:
+    """``encode`` compatible with ``SentenceTransformer.encode`` for the
+    keyword arguments this repo uses; returns a float32 array."""
+
+    def __init__(self, path, variant="onnx", threads=None, require_check=True):
+        from transformers import AutoTokenizer
+
+        ort = _onnxruntime()
+
+        self.manifest = read_manifest(path)
+        if variant not in self.manifest["variants"]:
+            raise ValueError(f"{path} has no {variant} export; available: {self.manifest['variants']}")
+        check = self.manifest["quality"].get(variant)
+        if require_check and variant != "onnx" and not (check and check["passed"]):
+            raise ValueError(
+                f"{variant} encoder in {path} has not passed the quality check; "
+                f"run `python -m shuttle.onnx_encoder check {path} <corpus_path>`"
+            )
+        self.variant = variant
+        self.tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, VARIANTS[variant]), options, providers=["CPUExecutionProvider"]
+        )
+        self.max_seq_length = self.manifest["max_seq_length"]
+
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        # Length-sorted batches pad less
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        embeddings = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feed = {name: inputs[name].astype(np.int64) for name in self.manifest["input_names"]}
+            token_embeddings = self.session.run(None, feed)[0]
+            pooled = pool(token_embeddings, inputs["attention_mask"], self.manifest["pooling"])
+            if self.manifest["normalize"]:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled.astype(np.float32)):
+                embeddings[i] = vector
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.stack(embeddings)
+        return embeddings[0] if single else embeddings
+
+
+def dense_ndcg(model, texts, queries, qrels, engine, k, depth):
+    """Mean nDCG@k of exact dense search with `model`'s query embeddings,
+    and its per-query encode latency in ms."""
+    from shuttle.evaluate import evaluate_run
+
+    start = time.perf_counter()
+    for text in texts:
+        model.encode([text], convert_to_tensor=False)
+    latency_ms = 1000 * (time.perf_counter() - start) / len(texts)
+
+    embeddings = model.encode(texts, convert_to_tensor=False, batch_size=32)
+    results = engine.search_batch(embeddings, top_k=depth)
+    run = {query_id: engine.ids[rows].tolist() for query_id, (rows, _) in zip(queries["query-id"], results)}
+    return evaluate_run(run, queries, qrels, k=k)[f"nDCG@{k}"].mean(), latency_ms
+
+
+def check(path, corpus_path, reference_dir=None, queries_path="DEMO_test_queries.csv",
+          qrels_path="DEMO_test_qrels.csv", max_drop=DEFAULT_MAX_DROP, k=10, depth=100):
+    """Scores every exported variant against the reference model and records
+    pass/fail in the manifest. Returns the recorded results."""
+    import pandas as pd
+
+    from shuttle.embedding_store import load_embedding_frame
+    from shuttle.engine import DenseSearchEngine
+    from shuttle.evaluate import load_qrels
+    from shuttle.text import preprocess_text
+
+    manifest = read_manifest(path)
+    queries = pd.read_csv(queries_path)
+    qrels = load_qrels(qrels_path)
+    texts = [preprocess_text(q) for q in queries["query"]]
+    engine = DenseSearchEngine.from_frame(load_embedding_frame(corpus_path))
+
+    reference = load_reference(reference_dir or manifest["source"])
+    reference_ndcg, reference_ms = dense_ndcg(reference, texts, queries, qrels, engine, k, depth)
+    for variant in manifest["variants"]:
+        encoder = OnnxEncoder(path, variant, require_check=False)
+        ndcg, latency_ms = dense_ndcg(encoder, texts, queries, qrels, engine, k, depth)
+        manifest["quality"][variant] = {
+            f"nDCG@{k}": ndcg,
+            f"reference_nDCG@{k}": reference_ndcg,
+            "delta": ndcg - reference_ndcg,
+            "max_drop": max_drop,
+            "passed": bool(reference_ndcg - ndcg <= max_drop),
+            "encode_ms": latency_ms,
+            "reference_encode_ms": reference_ms,
+            "queries": len(texts),
+        }
+    write_manifest(path, manifest)
+    return manifest["quality"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the SBERT query encoder to ONNX and check its quality.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export", help="Export a local model directory to ONNX")
+    export_cmd.add_argument("model_dir", help="Local SentenceTransformer directory (no downloads are made)")
+    export_cmd.add_argument("out_dir")
+    export_cmd.add_argument("--int8", action="store_true", help="Also write a dynamically int8-quantized model")
+    export_cmd.add_argument("--opset", type=int, default=14)
+
+    check_cmd = commands.add_parser("check", help="nDCG of each exported variant vs the PyTorch model on the qrels")
+    check_cmd.add_argument("path", help="Export directory")
+    check_cmd.add_argument("corpus_path", help="Directory holding the document embeddings")
+    check_cmd.add_argument("--reference", default=None, help="Local model directory (default: the export source)")
+    check_cmd.add_argument("--queries", default="DEMO_test_queries.csv")
+    check_cmd.add_argument("--qrels", default="DEMO_test_qrels.csv")
+    check_cmd.add_argument("--max-drop", type=float, default=DEFAULT_MAX_DROP, help="Largest allowed nDCG@k drop")
+    check_cmd.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        variants = export(args.model_dir, args.out_dir, int8=args.int8, opset=args.opset)
+        print(f"Exported {', '.join(variants)} to {args.out_dir}")
+        return
+
+    quality = check(args.path, args.corpus_path, args.reference, args.queries, args.qrels, args.max_drop, args.k)
+    for variant, result in quality.items():
+        status = "passed" if result["passed"] else "FAILED"
+        print(
+            f"{variant}: nDCG@{args.k} {result[f'nDCG@{args.k}']:.4f} "
+            f"(reference {result[f'reference_nDCG@{args.k}']:.4f}, delta {result['delta']:+.4f}) {status}; "
+            f"encode {result['encode_ms']:.1f} ms/query vs {result['reference_encode_ms']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""CPU inference for the multi-label search-purpose classifier.
+
+Tags documents with the ``MultiLabelBERT`` model trained in
+``CategoryTraining - SE.ipynb`` (bert-base-uncased, pooled [CLS] output, a
+linear layer over the seven purpose labels, sigmoid > 0.5). Save the
+trained weights from the notebook with
+``torch.save(model.state_dict(), "multilabel_bert.pt")``, then::
+
+    python -m shuttle.purpose_classifier full_corpus_SBERT_trained multilabel_bert.pt --workers 4 --int8
+
+The notebook's ``ArticleDataset`` tokenized one row per ``iloc`` lookup,
+padded every abstract to 128 tokens and predicted in batches of 16. Here
+each shard of abstracts is tokenized in one call to the fast tokenizer,
+sorted by token length and cut into batches padded only to their longest
+member. Shards run in a pool of worker processes, each holding one copy
+of the model, optionally with dynamic int8 quantization of its linear
+layers. Label probabilities are cached in SQLite by abstract hash (per
+checkpoint and settings), so re-tagging only runs the model on new or
+changed abstracts.
+
+As in the notebook, only documents without tags are predicted unless
+``--all`` is given; predicted labels are added to each document's stored
+tags and the result is written as the tag index (``tag_index.npz``) that
+the app and service load. A startup bundle (``python -m shuttle.bundle``)
+holds its own copy of the index, so an existing bundle is rebuilt
+afterwards (``--no-bundle`` skips that; the stale bundle is then ignored
+and the retriever loads the corpus files instead).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from shuttle.bundle import BUNDLE_FILE, build_bundle, bundle_path
+from shuttle.tag_index import METADATA_FILES, TAG_INDEX_FILE, TagIndex, parse_tags
+
+LABEL_NAMES = [
+    "Methodologies or Experimental Designs",
+    "Theoretical Frameworks or Models",
+    "Research Gaps",
+    "Quantitative Data and Analysis",
+    "Literature Review",
+    "Comparative Works",
+    "Exploring Interdisciplinary Connection",
+]
+BASE_MODEL = "bert-base-uncased"
+CACHE_FILE = "purpose_cache.sqlite"
+MAX_LEN = 128
+THRESHOLD = 0.5
+
+_classifier = None
+
+
+def build_model(base_model=BASE_MODEL, num_labels=len(LABEL_NAMES)):
+    """The notebook's MultiLabelBERT, so its state_dict loads unchanged."""
+    import torch.nn as nn
+    from transformers import BertModel
+
+    class MultiLabelBERT(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.bert = BertModel.from_pretrained(base_model)
+            self.dropout = nn.Dropout(0.3)
+            self.classifier = nn.Linear(768, num_labels)
+
+        def forward(self, input_ids, attention_mask):
+            pooled_output = self.bert(input_ids=input_ids, attention_mask=attention_mask)[1]
+            return self.classifier(self.dropout(pooled_output))
+
+    return MultiLabelBERT()
+
+
+def checkpoint_key(checkpoint, base_model, int8, max_len):
+    """Identifies the model a cached prediction came from."""
+    stat = os.stat(checkpoint)
+    return (f"{base_model}:{os.path.basename(checkpoint)}:{stat.st_size}:{stat.st_mtime:.0f}"
+            f":int8={int8}:max_len={max_len}")
+
+
+def content_hash(text, model_key):
+    return hashlib.sha1(f"{model_key}\0{text}".encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """SQLite cache of label probabilities (float32 blobs) by content hash."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS predictions (hash TEXT PRIMARY KEY, probs BLOB)")
+        self._db.commit()
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 900):  # SQLite's bound-parameter limit
+            batch = hashes[start:start + 900]
+            rows = self._db.execute(
+                f"SELECT hash, probs FROM predictions WHERE hash IN ({','.join('?' * len(batch))})", batch
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, probs):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?)",
+            [(h, p.astype(np.float32).tobytes()) for h, p in probs.items()],
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class PurposeClassifier:
+    def __init__(self, checkpoint, base_model=BASE_MODEL, int8=False, max_len=MAX_LEN, batch_size=64):
+        import torch
+        from transformers import BertTokenizerFast
+
+        self._torch = torch
+        self.tokenizer = BertTokenizerFast.from_pretrained(base_model)
+        model = build_model(base_model)
+        model.load_state_dict(torch.load(checkpoint, map_location="cpu"))
+        model.eval()
+        if int8:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.max_len = max_len
+        self.batch_size = batch_size
+
+    def probabilities(self, abstracts):
+        """(n, labels) sigmoid outputs; batches are formed in token-length
+        order and padded only to their longest member."""
+        encoded = self.tokenizer(
+            [str(a) for a in abstracts], truncation=True, max_length=self.max_len
+        )["input_ids"]
+        order = np.argsort([len(ids) for ids in encoded], kind="stable")
+        out = np.empty((len(encoded), len(LABEL_NAMES)), dtype=np.float32)
+        with self._torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                padded = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+                logits = self.model(padded["input_ids"], padded["attention_mask"])
+                out[batch] = self._torch.sigmoid(logits).numpy()
+        return out
+
+
+def _init_worker(checkpoint, base_model, int8, max_len, batch_size, threads):
+    global _classifier
+    import torch
+
+    torch.set_num_threads(threads)
+    _classifier = PurposeClassifier(checkpoint, base_model, int8, max_len, batch_size)
+
+
+def _predict_shard(abstracts):
+    return _classifier.probabilities(abstracts)
+
+
+def labels_from_probabilities(probs, threshold=THRESHOLD):
+    return [[LABEL_NAMES[i] for i in np.flatnonzero(row > threshold)] for row in probs]
+
+
+def predict(abstracts, checkpoint, base_model=BASE_MODEL, int8=False, max_len=MAX_LEN, batch_size=64,
+            workers=1, threads=1, shard_size=2048, cache_path=CACHE_FILE):
+    """(n, labels) probabilities for `abstracts`, running the model only on
+    abstracts missing from the cache. Returns (probabilities, stats)."""
+    model_key = checkpoint_key(checkpoint, base_model, int8, max_len)
+    texts = [str(a) for a in abstracts]
+    hashes = [content_hash(t, model_key) for t in texts]
+    cache = PredictionCache(cache_path)
+    try:
+        cached = cache.get_many(set(hashes))
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached:
+                missing.setdefault(h, t)
+        items = list(missing.items())
+        shards = [items[s:s + shard_size] for s in range(0, len(items), shard_size)]
+
+        start = time.perf_counter()
+        if shards:
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                     initargs=(checkpoint, base_model, int8, max_len, batch_size, threads)) as pool:
+                results = pool.map(_predict_shard, [[t for _, t in shard] for shard in shards])
+                for shard, probs in zip(shards, results):
+                    fresh = {h: p for (h, _), p in zip(shard, probs)}
+                    # Committed per shard, so an interrupted run keeps finished shards
+                    cache.put_many(fresh)
+                    cached.update(fresh)
+        elapsed = time.perf_counter() - start
+    finally:
+        cache.close()
+
+    probs = np.stack([cached[h] for h in hashes]) if hashes else np.empty((0, len(LABEL_NAMES)), np.float32)
+    stats = {
+        "documents": len(texts),
+        "predicted": len(items),
+        "cache_hits": len(texts) - sum(1 for h in hashes if h in missing),
+        "seconds": elapsed,
+        "docs_per_sec": len(items) / elapsed if elapsed else 0.0,
+    }
+    return probs, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict search-purpose tags and write the tag index.")
+    parser.add_argument("corpus_path", help="Directory holding metadata_part*_final.csv")
+    parser.add_argument("checkpoint", help="MultiLabelBERT state_dict saved with torch.save")
+    parser.add_argument("--parts", nargs="+", default=METADATA_FILES)
+    parser.add_argument("--out", default=None, help=f"Tag index path (default: <corpus_path>/{TAG_INDEX_FILE})")
+    parser.add_argument("--all", action="store_true", help="Predict for every document, not only untagged ones")
+    parser.add_argument("--base-model", default=BASE_MODEL)
+    parser.add_argument("--int8", action="store_true", help="Dynamically quantize the linear layers to int8")
+    parser.add_argument("--max-len", type=int, default=MAX_LEN)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1, help="Inference processes")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per process")
+    parser.add_argument("--shard-size", type=int, default=2048, help="Abstracts per worker task")
+    parser.add_argument("--cache", default=CACHE_FILE, help="SQLite prediction cache")
+    parser.add_argument("--no-bundle", action="store_true", help="Do not rebuild an existing startup bundle")
+    args = parser.parse_args()
+
+    frame = pd.concat([
+        pd.read_csv(os.path.join(args.corpus_path, p), usecols=["cord_uid", "abstract", "tags"]) for p in args.parts
+    ], ignore_index=True)
+    tag_lists = [parse_tags(t) for t in frame["tags"]]
+    rows = np.arange(len(frame)) if args.all else np.flatnonzero([not tags for tags in tag_lists])
+
+    probs, stats = predict(
+        frame["abstract"].to_numpy()[rows],
+        args.checkpoint,
+        base_model=args.base_model,
+        int8=args.int8,
+        max_len=args.max_len,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        threads=args.threads,
+        shard_size=args.shard_size,
+        cache_path=args.cache,
+    )
+    for row, labels in zip(rows, labels_from_probabilities(probs, args.threshold)):
+        tag_lists[row] = tag_lists[row] + [label for label in labels if label not in tag_lists[row]]
+
+    index = TagIndex.from_lists(frame["cord_uid"].astype(str).to_numpy(), tag_lists)
+    out_path = args.out or os.path.join(args.corpus_path, TAG_INDEX_FILE)
+    index.save(out_path)
+    print(
+        f"Predicted {stats['predicted']} of {stats['documents']} documents ({stats['cache_hits']} cached) "
+        f"in {stats['seconds']:.1f}s ({stats['docs_per_sec']:.1f} docs/sec)"
+    )
+    print(f"Wrote {len(index.vocab)} tags over {len(index)} documents to {out_path}")
+
+    # The bundle serves a copy of the corpus tag index; refresh it so the
+    # predicted purposes reach the filters
+    header_path = os.path.join(bundle_path(args.corpus_path), BUNDLE_FILE)
+    if args.out is None and not args.no_bundle and os.path.exists(header_path):
+        with open(header_path) as f:
+            model_name = json.load(f)["model"]
+        header = build_bundle(args.corpus_path, model_name, args.parts)
+        print(f"Rebuilt the startup bundle ({header['count']} documents) with the new tags")
+
+
+if __name__ == "__main__":
+    main()
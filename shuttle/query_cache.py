@@ -0,0 +1,166 @@
+"""Query-embedding cache: bounded in-memory LRU with an optional on-disk tier.
+
+Entries are keyed on the encoder id (model plus torch/ONNX variant, see
+``shuttle.core.encoder_id``) and the ``preprocess_text``-normalised
+query, so Streamlit reruns (filter or slider changes) and repeated
+queries skip ``model.encode``. The disk tier is a SQLite file, so popular queries
+survive restarts and can be shared by several app processes.
+
+Pre-warm the disk tier from the demo queries or a query log (one query per
+line, or a CSV with a ``query`` column)::
+
+    python -m shuttle.query_cache full_corpus_SBERT_trained/query_cache.sqlite DEMO_test_queries.csv
+
+Pass ``--encoder onnx-int8`` (or set ``SHUTTLE_ENCODER``) to warm the
+entries an ONNX-serving process reads.
+"""
+import argparse
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from shuttle.embedding_store import DEFAULT_MODEL
+from shuttle.text import preprocess_text
+
+
+class QueryEmbeddingCache:
+    """Caches `encode_batch` results (a function from a list of texts to a
+    2-D array of embeddings) for one model."""
+
+    def __init__(self, encode_batch, model_id, max_size=1024, disk_path=None):
+        self.encode_batch = encode_batch
+        self.model_id = model_id
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path is not None:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, dtype TEXT, vector BLOB, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __call__(self, query):
+        return self.encode(query)
+
+    def encode(self, query):
+        """Embedding for `query`, from memory, disk or the model in that order."""
+        key = preprocess_text(query)
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+            vector = self._disk_get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+            self.misses += 1
+
+        # Encode outside the lock so concurrent misses don't serialise
+        vector = np.asarray(self.encode_batch([key]))[0]
+        with self._lock:
+            self._remember(key, vector)
+            self._disk_put([(key, vector)])
+        return vector
+
+    def warm(self, queries, batch_size=64):
+        """Encodes and stores every query not yet cached; returns how many were new."""
+        keys = list(dict.fromkeys(preprocess_text(q) for q in queries if isinstance(q, str)))
+        with self._lock:
+            missing = [k for k in keys if k not in self.memory and self._disk_get(k) is None]
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = np.asarray(self.encode_batch(batch))
+            with self._lock:
+                for key, vector in zip(batch, vectors):
+                    self._remember(key, vector)
+                self._disk_put(list(zip(batch, vectors)))
+        return len(missing)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT dtype, vector FROM query_embeddings WHERE model = ? AND query = ?",
+            (self.model_id, key),
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[1], dtype=row[0])
+
+    def _disk_put(self, items):
+        if self._db is None:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+            [(self.model_id, key, str(v.dtype), np.ascontiguousarray(v).tobytes()) for key, v in items],
+        )
+        self._db.commit()
+
+
+def read_queries(path):
+    """Queries from a CSV with a ``query`` column, or a plain one-per-line log."""
+    if path.endswith(".csv"):
+        return pd.read_csv(path)["query"].tolist()
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the on-disk query-embedding cache.")
+    parser.add_argument("cache_path", help="SQLite file of the disk tier")
+    parser.add_argument("queries", nargs="+", help="CSV files with a 'query' column or query logs")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--encoder", default=None,
+                        help="torch, onnx or onnx-int8 (default: $SHUTTLE_ENCODER, else torch)")
+    parser.add_argument("--onnx-path", default=None, help="ONNX export directory (default: $SHUTTLE_ONNX_PATH)")
+    args = parser.parse_args()
+
+    # Imported here: shuttle.core itself imports this module
+    from shuttle.core import ENCODER, ONNX_PATH, encoder_id, load_model
+
+    encoder = args.encoder or ENCODER
+    onnx_path = args.onnx_path or ONNX_PATH
+    # Warm with the encoder the app will serve, under the key it looks up
+    model = load_model(args.model, encoder, onnx_path)
+    cache = QueryEmbeddingCache(
+        lambda texts: model.encode(texts, convert_to_tensor=False),
+        encoder_id(args.model, encoder, onnx_path),
+        disk_path=args.cache_path,
+    )
+    queries = [q for path in args.queries for q in read_queries(path)]
+    added = cache.warm(queries)
+    print(f"Cached {added} new query embeddings ({len(queries)} queries read) in {args.cache_path}")
+
+
+if __name__ == "__main__":
+    main()
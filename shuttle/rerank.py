@@ -0,0 +1,135 @@
+"""Second-stage cross-encoder re-ranking of the top candidates.
+
+The bi-encoder (or BM25/hybrid) ranking is cheap but scores query and
+document independently. A cross-encoder reads each (query, document) pair
+together and ranks the top of the list more precisely, at a cost per
+candidate. ``CrossEncoderReranker`` bounds that cost two ways:
+
+* a candidate budget - only the first ``candidates`` first-stage results are
+  re-scored; the rest keep their first-stage order below them
+* a time budget - candidates are scored in batches, and when the next batch
+  would overrun ``budget_ms`` the re-ranking is abandoned and the
+  first-stage order is kept unchanged
+
+Re-ranked scores are cross-encoder probabilities in [0, 1] (shown as
+relevance by ``shuttle.results.relevance_scores(scores, "rerank")``); rows below
+the candidate budget have no cross-encoder score and get NaN.
+
+Enable it in the app and the service with ``SHUTTLE_RERANKER`` (a
+sentence-transformers ``CrossEncoder`` name or local directory), and measure
+its nDCG gain and latency cost with
+``python -m shuttle.evaluate full_corpus_SBERT_trained --rerank 50``.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from shuttle.metadata_store import open_metadata_store
+from shuttle.tag_index import METADATA_FILES
+
+DEFAULT_RERANKER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_CANDIDATES = 50
+DEFAULT_BUDGET_MS = 500.0
+
+
+def document_texts(frame):
+    """Title + abstract of each row, the text the cross-encoder reads."""
+    return (frame["title"].fillna("") + ". " + frame["abstract"].fillna("")).tolist()
+
+
+class CrossEncoderReranker:
+    def __init__(self, model, candidates=DEFAULT_CANDIDATES, budget_ms=DEFAULT_BUDGET_MS, batch_size=16,
+                 window=10000):
+        self.model = model
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._fallbacks = 0
+        self._latencies = deque(maxlen=window)
+
+    @classmethod
+    def load(cls, model_name=DEFAULT_RERANKER, **kwargs):
+        from sentence_transformers import CrossEncoder
+
+        return cls(CrossEncoder(model_name, device="cpu"), **kwargs)
+
+    def rerank(self, query, texts, candidates=None, budget_ms=None):
+        """Re-orders a first-stage result list given its document `texts`
+        (best first). Returns (order, scores) - row positions into `texts`
+        and their cross-encoder scores - or None when the time budget ran
+        out, meaning keep the first-stage order."""
+        candidates = self.candidates if candidates is None else candidates
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        n = min(len(texts), candidates)
+        pairs = [(query, text) for text in texts[:n]]
+
+        start = time.perf_counter()
+        scored, last_batch_ms = [], 0.0
+        for offset in range(0, n, self.batch_size):
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+            # Stop before a batch that would overrun the budget
+            if budget_ms and offset and elapsed_ms + last_batch_ms > budget_ms:
+                self._record(elapsed_ms, fallback=True)
+                return None
+            batch_start = time.perf_counter()
+            scored.append(np.asarray(
+                self.model.predict(pairs[offset:offset + self.batch_size], batch_size=self.batch_size,
+                                   show_progress_bar=False),
+                dtype=np.float64
+            ))
+            last_batch_ms = 1000 * (time.perf_counter() - batch_start)
+        self._record(1000 * (time.perf_counter() - start), fallback=False)
+
+        scores = np.concatenate(scored) if scored else np.empty(0)
+        head = np.argsort(-scores, kind="stable")
+        order = np.concatenate([head, np.arange(n, len(texts))])
+        return order, np.concatenate([scores[head], np.full(len(texts) - n, np.nan)])
+
+    def rerank_results(self, query, results, scores, candidates=None, budget_ms=None):
+        """(results, scores, reranked) for a result frame with title and
+        abstract columns; unchanged with reranked=False on a fallback."""
+        reranked = self.rerank(query, document_texts(results), candidates, budget_ms)
+        if reranked is None:
+            return results, scores, False
+        order, scores = reranked
+        return results.iloc[order], scores, True
+
+    def _record(self, ms, fallback):
+        with self._lock:
+            self._calls += 1
+            self._fallbacks += int(fallback)
+            self._latencies.append(ms)
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            calls, fallbacks = self._calls, self._fallbacks
+        return {
+            "calls": calls,
+            "fallbacks": fallbacks,
+            "candidates": self.candidates,
+            "budget_ms": self.budget_ms,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        }
+
+
+def read_document_texts(corpus_path, ids, metadata_files=METADATA_FILES):
+    """{cord_uid: cross-encoder text} for `ids`, from the metadata store when
+    built, otherwise from the metadata CSVs."""
+    store = open_metadata_store(corpus_path, metadata_files)
+    if store is not None:
+        frame = store.take(pd.Index(ids), ["title", "abstract"])
+    else:
+        frame = pd.concat([
+            pd.read_csv(os.path.join(corpus_path, f), usecols=["cord_uid", "title", "abstract"], index_col="cord_uid")
+            for f in metadata_files
+        ])
+        frame = frame[~frame.index.duplicated()].reindex(pd.Index(ids))
+    return dict(zip(frame.index.astype(str), document_texts(frame)))
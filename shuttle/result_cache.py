@@ -0,0 +1,102 @@
+"""Result-set cache: filter and slider changes re-use a query's candidates.
+
+For each (query, mode, backend, knobs) the unfiltered candidate list - row
+indices and scores, best first, ``depth`` deep - is cached. A filter change
+then only masks and slices the cached candidates. Only when a selective
+filter leaves fewer than ``top_k`` of them (and the shortlist was cut off at
+``depth``) does the search run again with the filter pushed into it, so
+results stay complete.
+
+Entries are tied to a version string (model id + corpus fingerprint); when
+the version changes the whole cache is dropped.
+"""
+import threading
+from collections import OrderedDict
+
+from shuttle.text import preprocess_text
+
+
+class CachedResults:
+    __slots__ = ("rows", "scores", "complete")
+
+    def __init__(self, rows, scores, complete):
+        self.rows = rows
+        self.scores = scores
+        # True when every candidate the search could produce is present
+        # (it returned fewer than `depth`), so masking never loses results
+        self.complete = complete
+
+
+class ResultSetCache:
+    """Size-bounded LRU of unfiltered candidate lists."""
+
+    def __init__(self, max_entries=256, version=None):
+        self.max_entries = max_entries
+        self.version = version
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def set_version(self, version):
+        """Drops every entry if the corpus/model version changed."""
+        with self._lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, rows, scores, complete):
+        entry = CachedResults(rows, scores, complete)
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class CachedSearcher:
+    """Wraps a searcher (e.g. ``HybridSearcher``) with a ``ResultSetCache``;
+    ``search`` has the same signature and return value."""
+
+    def __init__(self, searcher, cache, depth=1000):
+        self.searcher = searcher
+        self.cache = cache
+        self.depth = depth
+
+    def search(self, query, top_k=50, mode="dense", mask=None, backend=None, **search_params):
+        if top_k > self.depth:
+            return self.searcher.search(query, top_k=top_k, mode=mode, mask=mask, backend=backend, **search_params)
+
+        key = (preprocess_text(query), mode, backend, tuple(sorted(search_params.items())))
+        entry = self.cache.get(key)
+        if entry is None:
+            rows, scores = self.searcher.search(
+                query, top_k=self.depth, mode=mode, backend=backend, **search_params
+            )
+            entry = self.cache.put(key, rows, scores, complete=len(rows) < self.depth)
+
+        if mask is None:
+            return entry.rows[:top_k], entry.scores[:top_k]
+        keep = mask[entry.rows]
+        rows, scores = entry.rows[keep][:top_k], entry.scores[keep][:top_k]
+        if len(rows) < top_k and not entry.complete:
+            # Too selective for the cached shortlist: search under the mask
+            return self.searcher.search(query, top_k=top_k, mode=mode, mask=mask, backend=backend, **search_params)
+        return rows, scores
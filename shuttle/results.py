@@ -0,0 +1,71 @@
+"""Result assembly for display: relevance calibration and ranks as array
+operations over one result list.
+
+``Retriever.search`` returns result rows and their scores aligned and best
+first, so ranks and relevance are computed here in single numpy passes
+rather than per row. Calibration ranges map a mode's raw scores onto 0-100;
+they default to the original hand-set dense range and are replaced by
+ranges fitted on the qrels with ``python -m shuttle.calibration``.
+"""
+import numpy as np
+
+RESULT_COLUMNS = ['title', 'publish_time', 'abstract', 'referenced_by_count', 'url']
+DISPLAY_COLUMNS = ['Rank'] + RESULT_COLUMNS + ['similarity']
+DISPLAY_DATE_FORMAT = '%d %b %Y'
+# (low, high) raw score per mode mapping to relevance 0 and 100. Cross-encoder
+# scores are probabilities; BM25 and fused scores have no fixed range and are
+# scaled to the best hit instead.
+DEFAULT_RANGES = {
+    "dense": (0.999, 1.0),
+    "rerank": (0.0, 1.0),
+}
+
+
+def recalibrate_score(score, low=0.999, high=1.0):
+    """Rescales similarity scores (a scalar or an array) to 0-100 relevance."""
+    score = np.clip(score, low, high)
+    return np.round(100 * (score - low) / (high - low), 1)
+
+
+def relevance_scores(scores, mode="dense", ranges=None):
+    """0-100 display relevance for the scores of one result list; `ranges`
+    overrides DEFAULT_RANGES per mode. Missing scores stay NaN."""
+    scores = np.asarray(scores, dtype=np.float64)
+    ranges = {**DEFAULT_RANGES, **(ranges or {})}
+    if mode in ranges:
+        low, high = ranges[mode]
+        return recalibrate_score(scores, low, high)
+    if not len(scores) or np.isnan(scores).all():
+        return np.full(len(scores), np.nan)
+    return np.round(100 * scores / np.nanmax(scores), 1)
+
+
+def ranks(scores):
+    """1-based ranks of best-first `scores`, ties sharing the smallest rank
+    (pandas' method='min'). Missing scores each get their own position."""
+    scores = np.asarray(scores)
+    positions = np.arange(1, len(scores) + 1)
+    if len(scores) < 2:
+        return positions
+    starts = np.empty(len(scores), dtype=bool)
+    starts[0] = True
+    np.not_equal(scores[1:], scores[:-1], out=starts[1:])
+    return np.maximum.accumulate(np.where(starts, positions, 0))
+
+
+def display_frame(results, scores=None, mode="dense", ranges=None, first_rank=1):
+    """DISPLAY_COLUMNS for one result list. Without `scores` (browsing '*'),
+    ranks are positions counted from `first_rank` and relevance is empty."""
+    frame = results[RESULT_COLUMNS].reset_index(drop=True)
+    if scores is None:
+        frame.insert(0, 'Rank', np.arange(first_rank, first_rank + len(frame)))
+        frame['similarity'] = np.nan
+    else:
+        frame.insert(0, 'Rank', ranks(scores))
+        frame['similarity'] = relevance_scores(scores, mode, ranges)
+    return frame
+
+
+def to_csv(frame, header=True):
+    """CSV text of a display frame, dates formatted as shown in the app."""
+    return frame.to_csv(index=False, header=header, na_rep='', date_format=DISPLAY_DATE_FORMAT)
@@ -0,0 +1,409 @@
+"""Incremental ingestion: immutable segments, tombstones and compaction.
+
+New documents are appended as segments under ``<corpus>/segments/`` instead
+of rerunning the indexing notebook. Each segment is a directory holding an
+embedding store (``embeddings/``, L2-normalised rows) and
+``metadata.parquet``, and is never modified after it is published. A
+``manifest.json`` lists the live segments and the tombstones (deletions),
+and is replaced atomically on every change; its ``generation`` counter tells
+readers something changed.
+
+The original corpus files are segment 0. Segment ``seg-000007`` was created
+at generation 7. A tombstone ``{cord_uid: g}`` deletes the copies of that
+document in every segment numbered ``<= g``, so deleting a document and
+ingesting it again makes the new copy live.
+
+    python -m shuttle.segments ingest full_corpus_SBERT_trained new_rows.csv
+    python -m shuttle.segments delete full_corpus_SBERT_trained --ids 0a1b2c3d
+    python -m shuttle.segments compact full_corpus_SBERT_trained
+    python -m shuttle.segments status full_corpus_SBERT_trained
+
+Ingestion encodes only cord_uids that are not already live, in batches, and
+streams them into the new segment. Compaction merges all segments into one
+and physically drops their deleted rows; tombstones on the original corpus
+are kept. ``shuttle.core.Retriever.refresh`` picks up a new manifest
+generation by loading only the segments it has not seen yet, and searches
+them alongside the original index with results merged by score.
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from shuttle.bm25 import BM25Index, document_text
+from shuttle.embedding_store import (
+    DEFAULT_MODEL, EMBEDDING_FILES, STORE_DIRNAME, EmbeddingStore, StoreWriter, store_exists
+)
+from shuttle.engine import DenseSearchEngine, l2_normalize, top_k_indices
+from shuttle.metadata_store import parse_dates
+from shuttle.tag_index import parse_tags
+
+SEGMENTS_DIRNAME = "segments"
+MANIFEST_FILE = "manifest.json"
+SEGMENT_EMBEDDINGS = "embeddings"
+SEGMENT_METADATA = "metadata.parquet"
+LOCK_FILE = ".lock"
+REQUIRED_COLUMNS = ["cord_uid", "title", "summarised_abstracts", "publish_time"]
+# Compaction is due once this many segments have accumulated
+MAX_SEGMENTS = 8
+
+
+def segments_path(corpus_path):
+    return os.path.join(corpus_path, SEGMENTS_DIRNAME)
+
+
+def read_manifest(corpus_path):
+    path = os.path.join(segments_path(corpus_path), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"generation": 0, "segments": [], "tombstones": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(corpus_path, manifest):
+    # Written aside and renamed over the old one, so readers never see a
+    # partial manifest
+    path = os.path.join(segments_path(corpus_path), MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def _locked(corpus_path):
+    """Serialises writers (ingest, delete, compact) across processes."""
+    os.makedirs(segments_path(corpus_path), exist_ok=True)
+    with open(os.path.join(segments_path(corpus_path), LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def segment_number(name):
+    return int(name.split("-")[1])
+
+
+def encoding_text(frame):
+    """The text a document is embedded from, as in the indexing notebook."""
+    if "combined_sum_text" in frame.columns:
+        return frame["combined_sum_text"].fillna("").tolist()
+    return (frame["title"].fillna("") + " [SEP] " + frame["summarised_abstracts"].fillna("")).tolist()
+
+
+def live_mask(ids, numbers, tombstones):
+    """Boolean mask of rows (cord_uid `ids`, segment `numbers`) that no
+    tombstone deletes, or None when every row is live."""
+    if not tombstones:
+        return None
+    deleted_up_to = pd.Series(tombstones, dtype=np.float64).reindex(np.asarray(ids)).to_numpy()
+    live = ~(deleted_up_to >= np.asarray(numbers))  # NaN (no tombstone) compares False
+    return None if live.all() else live
+
+
+class Segment:
+    """A published segment: metadata, memory-mapped vectors, and the dense
+    and BM25 indexes over its rows."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.number = segment_number(self.name)
+        self.store = EmbeddingStore(os.path.join(path, SEGMENT_EMBEDDINGS))
+        self.metadata = pd.read_parquet(os.path.join(path, SEGMENT_METADATA)).set_index("cord_uid")
+        if list(self.metadata.index) != list(self.store.ids):
+            raise ValueError(f"{path}: metadata and embedding rows are not aligned")
+        self.engine = DenseSearchEngine.from_store(self.store, memory_map=True)
+        self.bm25 = BM25Index.build(self.metadata.index.to_numpy(), document_text(self.metadata))
+
+    def __len__(self):
+        return len(self.metadata)
+
+    @property
+    def tag_lists(self):
+        if "tags" not in self.metadata.columns:
+            return [[] for _ in range(len(self))]
+        return [parse_tags(t) for t in self.metadata["tags"]]
+
+
+def open_segments(corpus_path, manifest, loaded=None):
+    """Segments listed in `manifest`, reusing already opened ones from `loaded`."""
+    loaded = loaded or {}
+    return [
+        loaded.get(name) or Segment(os.path.join(segments_path(corpus_path), name))
+        for name in manifest["segments"]
+    ]
+
+
+class SegmentedEngine:
+    """Dense search over consecutive row ranges - the original engine, then
+    one exact engine per segment - merged by score. Same ``search``
+    interface as ``DenseSearchEngine``."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.starts = np.concatenate([[0], np.cumsum([len(e) for e in engines])[:-1]])
+
+    @property
+    def default_backend(self):
+        return self.engines[0].default_backend
+
+    def get_index(self, backend=None):
+        return self.engines[0].get_index(backend)
+
+    def __len__(self):
+        return sum(len(e) for e in self.engines)
+
+    def search(self, query_embedding, top_k=50, backend=None, mask=None, **search_params):
+        parts = []
+        for i, (engine, start) in enumerate(zip(self.engines, self.starts)):
+            part_mask = None if mask is None else mask[start:start + len(engine)]
+            if part_mask is not None and not part_mask.any():
+                continue
+            # Segments are small: always searched exactly
+            rows, scores = engine.search(
+                query_embedding, top_k, backend=backend if i == 0 else None, mask=part_mask, **search_params
+            )
+            parts.append((rows + start, scores))
+        return _merge(parts, top_k)
+
+
+class SegmentedBM25:
+    """BM25 over the original index and each segment's own index, merged by
+    score. Segment scores use that segment's term statistics."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.starts = np.concatenate([[0], np.cumsum([len(i) for i in indexes])[:-1]])
+
+    def __len__(self):
+        return sum(len(i) for i in self.indexes)
+
+    def search(self, query, top_k=50, mask=None):
+        parts = []
+        for index, start in zip(self.indexes, self.starts):
+            part_mask = None if mask is None else mask[start:start + len(index)]
+            if part_mask is not None and not part_mask.any():
+                continue
+            rows, scores = index.search(query, top_k, mask=part_mask)
+            parts.append((rows + start, scores))
+        return _merge(parts, top_k)
+
+
+def _merge(parts, top_k):
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows = np.concatenate([r for r, _ in parts])
+    scores = np.concatenate([s for _, s in parts])
+    best = top_k_indices(scores, top_k)
+    return rows[best], scores[best]
+
+
+def base_ids(corpus_path, embedding_files=EMBEDDING_FILES):
+    """cord_uids of the original corpus embeddings."""
+    store_path = os.path.join(corpus_path, STORE_DIRNAME)
+    if store_exists(store_path):
+        return pd.Index(EmbeddingStore(store_path).ids)
+    return pd.Index(pd.concat([
+        pd.read_csv(os.path.join(corpus_path, p), compression="gzip", usecols=["cord_uid"])["cord_uid"]
+        for p in embedding_files
+    ]).astype(str))
+
+
+def live_ids(corpus_path, manifest, embedding_files=EMBEDDING_FILES):
+    """Every cord_uid with a live copy in the corpus or its segments."""
+    ids, numbers = [base_ids(corpus_path, embedding_files)], [0]
+    for name in manifest["segments"]:
+        store = EmbeddingStore(os.path.join(segments_path(corpus_path), name, SEGMENT_EMBEDDINGS))
+        ids.append(pd.Index(store.ids))
+        numbers.append(segment_number(name))
+    all_ids = np.concatenate([i.to_numpy(dtype=str) for i in ids])
+    all_numbers = np.repeat(numbers, [len(i) for i in ids])
+    live = live_mask(all_ids, all_numbers, manifest["tombstones"])
+    return pd.Index(all_ids if live is None else all_ids[live]).unique()
+
+
+def _write_segment(corpus_path, number, frame, vectors, model_name):
+    """Publishes rows as segment `number`: written to a temporary directory
+    and renamed into place. `vectors` yields normalised row blocks."""
+    name = f"seg-{number:06d}"
+    tmp = os.path.join(segments_path(corpus_path), f".{name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    writer = None
+    start = 0
+    for block in vectors:
+        if writer is None:
+            writer = StoreWriter(os.path.join(tmp, SEGMENT_EMBEDDINGS), block.shape[1],
+                                 model_name=model_name, normalized=True)
+        writer.append(frame["cord_uid"].iloc[start:start + len(block)].tolist(), block)
+        start += len(block)
+    writer.close()
+
+    frame = frame.copy()
+    for col in frame.select_dtypes(include='number').columns:
+        frame[col] = frame[col].astype('float64')
+    frame.to_parquet(os.path.join(tmp, SEGMENT_METADATA), index=False)
+    os.rename(tmp, os.path.join(segments_path(corpus_path), name))
+    return name
+
+
+def ingest(corpus_path, rows, encode_batch, model_name=DEFAULT_MODEL, batch_size=64,
+           embedding_files=EMBEDDING_FILES):
+    """Encodes the rows whose cord_uid is not live yet and publishes them as
+    a new segment. Returns (segment name or None, rows added)."""
+    missing = [c for c in REQUIRED_COLUMNS if c not in rows.columns]
+    if missing:
+        raise ValueError(f"New rows lack columns {missing}")
+    rows = rows.copy()
+    rows["cord_uid"] = rows["cord_uid"].astype(str)
+    rows = rows.drop_duplicates("cord_uid", keep="last")
+
+    with _locked(corpus_path):
+        manifest = read_manifest(corpus_path)
+        rows = rows[~rows["cord_uid"].isin(live_ids(corpus_path, manifest, embedding_files))]
+        if rows.empty:
+            return None, 0
+        rows = rows.reset_index(drop=True)
+        rows["publish_time"] = parse_dates(rows["publish_time"])
+        texts = encoding_text(rows)
+
+        def vectors():
+            for start in range(0, len(texts), batch_size):
+                yield l2_normalize(np.asarray(encode_batch(texts[start:start + batch_size])))
+
+        number = manifest["generation"] + 1
+        name = _write_segment(corpus_path, number, rows, vectors(), model_name)
+        manifest["segments"].append(name)
+        manifest["generation"] = number
+        _write_manifest(corpus_path, manifest)
+    return name, len(rows)
+
+
+def delete(corpus_path, ids):
+    """Tombstones every current copy of `ids`; returns the new generation."""
+    with _locked(corpus_path):
+        manifest = read_manifest(corpus_path)
+        for cord_uid in ids:
+            manifest["tombstones"][str(cord_uid)] = manifest["generation"]
+        manifest["generation"] += 1
+        _write_manifest(corpus_path, manifest)
+    return manifest["generation"]
+
+
+def compact(corpus_path, embedding_files=EMBEDDING_FILES):
+    """Merges all segments into one, dropping deleted rows. Returns the new
+    segment name, or None if there was nothing to compact.
+
+    Replaced segment directories are left for running readers and removed
+    by the next compaction.
+    """
+    with _locked(corpus_path):
+        manifest = read_manifest(corpus_path)
+        names = manifest["segments"]
+        tombstones = manifest["tombstones"]
+        root = segments_path(corpus_path)
+        segment_ids = {}
+        for name in names:
+            segment_ids[name] = EmbeddingStore(os.path.join(root, name, SEGMENT_EMBEDDINGS)).ids
+        has_deleted = any(
+            tombstones.get(i, -1) >= segment_number(name) for name, ids in segment_ids.items() for i in ids
+        )
+        if len(names) < 2 and not has_deleted:
+            return None
+
+        frames, stores = [], []
+        for name in names:
+            store = EmbeddingStore(os.path.join(root, name, SEGMENT_EMBEDDINGS))
+            frame = pd.read_parquet(os.path.join(root, name, SEGMENT_METADATA))
+            live = live_mask(store.ids, np.full(len(store), segment_number(name)), tombstones)
+            keep = np.arange(len(store)) if live is None else np.flatnonzero(live)
+            frames.append(frame.iloc[keep])
+            stores.append((store, keep))
+        merged = pd.concat(frames, ignore_index=True)
+
+        def vectors():
+            for store, keep in stores:
+                if len(keep):
+                    yield np.asarray(store.vectors[keep], dtype=np.float32)
+
+        number = manifest["generation"] + 1
+        model_name = stores[0][0].model_name
+        new_names = [_write_segment(corpus_path, number, merged, vectors(), model_name)] if len(merged) else []
+
+        # Tombstones now only matter for the original corpus
+        base = set(base_ids(corpus_path, embedding_files))
+        manifest["tombstones"] = {i: g for i, g in tombstones.items() if i in base}
+        manifest["segments"] = new_names
+        manifest["generation"] = number
+        _write_manifest(corpus_path, manifest)
+
+        # Garbage-collect segments replaced by earlier compactions
+        for entry in os.listdir(root):
+            if entry.startswith("seg-") and entry not in new_names and entry not in names:
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return new_names[0] if new_names else None
+
+
+def compaction_due(corpus_path, max_segments=MAX_SEGMENTS):
+    return len(read_manifest(corpus_path)["segments"]) >= max_segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append, delete and compact corpus segments.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_cmd = commands.add_parser("ingest", help="Encode unseen documents into a new segment")
+    ingest_cmd.add_argument("corpus_path")
+    ingest_cmd.add_argument("rows", nargs="+", help="CSV files of new metadata rows (metadata_part*_final.csv columns)")
+    ingest_cmd.add_argument("--model", default=DEFAULT_MODEL)
+    ingest_cmd.add_argument("--batch-size", type=int, default=64)
+
+    delete_cmd = commands.add_parser("delete", help="Tombstone documents")
+    delete_cmd.add_argument("corpus_path")
+    delete_cmd.add_argument("--ids", nargs="*", default=[])
+    delete_cmd.add_argument("--ids-file", default=None, help="One cord_uid per line")
+
+    compact_cmd = commands.add_parser("compact", help="Merge segments and drop deleted rows")
+    compact_cmd.add_argument("corpus_path")
+
+    status_cmd = commands.add_parser("status", help="Show the manifest")
+    status_cmd.add_argument("corpus_path")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(args.model)
+        rows = pd.concat([pd.read_csv(p) for p in args.rows], ignore_index=True)
+        name, added = ingest(
+            args.corpus_path, rows,
+            lambda texts: model.encode(texts, convert_to_tensor=False, batch_size=args.batch_size),
+            model_name=args.model, batch_size=args.batch_size
+        )
+        print(f"Added {added} new documents as {name}" if name else "No unseen documents to add")
+    elif args.command == "delete":
+        ids = list(args.ids)
+        if args.ids_file:
+            with open(args.ids_file) as f:
+                ids.extend(line.strip() for line in f if line.strip())
+        generation = delete(args.corpus_path, ids)
+        print(f"Tombstoned {len(ids)} documents (generation {generation})")
+    elif args.command == "compact":
+        name = compact(args.corpus_path)
+        print(f"Compacted segments into {name}" if name else "Nothing to compact")
+    else:
+        manifest = read_manifest(args.corpus_path)
+        print(f"generation {manifest['generation']}, {len(manifest['tombstones'])} tombstones")
+        for name in manifest["segments"]:
+            store = EmbeddingStore(os.path.join(segments_path(args.corpus_path), name, SEGMENT_EMBEDDINGS))
+            print(f"  {name}: {len(store)} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Headless retrieval service: one warm ``Retriever`` behind an async HTTP/JSON API.
+
+    python -m shuttle.service full_corpus_SBERT_trained --port 8765
+
+Endpoints:
+
+* ``GET /health`` - liveness
+* ``GET /info`` - document count, corpus version, date range, max citations,
+  tag vocabulary and counts (what the UI needs for its filter controls)
+* ``GET /stats`` - query-cache, result-cache and encoder batching metrics
+* ``POST /search`` - one query::
+
+      {"query": "masks in schools", "top_k": 50, "mode": "dense",
+       "backend": null, "params": {"nprobe": 16},
+       "filters": {"start_date": "2020-01-01", "end_date": "2021-12-31",
+                   "tags": ["Treatment"], "tag_match": "any", "min_refs": 0},
+       "rerank": {"candidates": 50, "budget_ms": 500}}
+
+  Every field but ``query`` is optional; ``rerank`` needs a service started
+  with ``SHUTTLE_RERANKER`` set. The reply is
+  ``{"results": [{"rank", "cord_uid", "title", "publish_time", "abstract",
+  "referenced_by_count", "url", "score", "relevance"}, ...], "reranked",
+  "took_ms"}``, where ``reranked`` is false if the re-ranking ran out of
+  time and the first-stage order was kept.
+* ``POST /batch_search`` - ``{"queries": [...], ...}`` with the same shared
+  options; uncached queries are encoded in one batch first. The reply has
+  one result list (and one ``reranked`` flag) per query.
+* ``POST /browse`` - one page of every document matching ``filters``::
+
+      {"filters": {...}, "sort": "citations", "page": 0, "page_size": 50}
+
+  ``sort`` is ``corpus``, ``citations``, ``newest`` or ``oldest``. The reply
+  is ``{"results": [...], "total", "pages", "page"}``.
+* ``POST /export`` - the same ``filters`` and ``sort``; streams every
+  matching document as CSV, a page at a time.
+
+Searches run on a thread pool, so the event loop keeps accepting requests
+while numpy and the model work (both release the GIL). The Streamlit app
+talks to this service when ``SHUTTLE_SERVICE_URL`` is set.
+
+Every ``--refresh-seconds`` the service checks the segment manifest and
+loads documents ingested with ``python -m shuttle.segments`` (and new
+tombstones) without reloading the rest; with ``--compact-segments N`` it
+also compacts in the background once N segments have accumulated.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from aiohttp import web
+
+from shuttle.core import (
+    CORPUS_PATH, INDEX_BACKEND, MODEL_NAME, RERANK_CANDIDATES, SEARCH_MODE, SEARCH_PARAMS, Retriever, to_records
+)
+from shuttle.filters import SORT_ORDERS
+from shuttle.hybrid import MODES
+from shuttle.index import BACKENDS
+from shuttle.segments import MAX_SEGMENTS, compact, compaction_due
+
+DEFAULT_PORT = 8765
+MAX_TOP_K = 1000
+MAX_BATCH = 256
+EXPORT_PAGE_SIZE = 1000
+FILTER_FIELDS = ("start_date", "end_date", "tags", "tag_match", "min_refs")
+RERANK_FIELDS = ("candidates", "budget_ms")
+
+
+class RequestError(ValueError):
+    pass
+
+
+def parse_filters(body):
+    filters = body.get("filters") or {}
+    if not isinstance(filters, dict):
+        raise RequestError("filters must be a JSON object")
+    unknown = set(filters) - set(FILTER_FIELDS)
+    if unknown:
+        raise RequestError(f"unknown filters {sorted(unknown)}; expected {list(FILTER_FIELDS)}")
+    filters = dict(filters)
+    for field in ("start_date", "end_date"):
+        if filters.get(field) is not None:
+            try:
+                filters[field] = date.fromisoformat(filters[field])
+            except (TypeError, ValueError):
+                raise RequestError(f"{field} must be an ISO date (YYYY-MM-DD)")
+    tags = filters.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(t, str) for t in tags)):
+        raise RequestError("tags must be a list of strings")
+    if filters.get("tag_match", "any") not in ("any", "all"):
+        raise RequestError("tag_match must be 'any' or 'all'")
+    min_refs = filters.get("min_refs")
+    if min_refs is not None and (not isinstance(min_refs, int) or isinstance(min_refs, bool) or min_refs < 0):
+        raise RequestError("min_refs must be a non-negative integer")
+    return filters
+
+
+def parse_browse(body):
+    """Validated ``Retriever.browse`` keyword arguments."""
+    sort = body.get("sort", "corpus")
+    if sort not in SORT_ORDERS:
+        raise RequestError(f"sort must be one of {list(SORT_ORDERS)}")
+    page_size = body.get("page_size", 50)
+    if not isinstance(page_size, int) or not 1 <= page_size <= MAX_TOP_K:
+        raise RequestError(f"page_size must be an integer between 1 and {MAX_TOP_K}")
+    return {"sort": sort, "page_size": page_size, **parse_filters(body)}
+
+
+def parse_options(body):
+    """Validated search keyword arguments shared by /search and /batch_search."""
+    top_k = body.get("top_k", 50)
+    if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise RequestError(f"top_k must be an integer between 1 and {MAX_TOP_K}")
+    mode = body.get("mode", SEARCH_MODE)
+    if mode not in MODES:
+        raise RequestError(f"mode must be one of {list(MODES)}")
+    backend = body.get("backend")
+    if backend is not None and backend not in BACKENDS:
+        raise RequestError(f"backend must be one of {list(BACKENDS)}")
+
+    filters = parse_filters(body)
+
+    params = body.get("params") or {}
+    if not set(params) <= set(SEARCH_PARAMS):
+        raise RequestError(f"params may only set {list(SEARCH_PARAMS)}")
+    if not all(isinstance(v, int) for v in params.values()):
+        raise RequestError("params values must be integers")
+
+    rerank = body.get("rerank") or {}
+    if not set(rerank) <= set(RERANK_FIELDS):
+        raise RequestError(f"rerank may only set {list(RERANK_FIELDS)}")
+    candidates = rerank.get("candidates", RERANK_CANDIDATES if rerank else 0)
+    if not isinstance(candidates, int) or not 0 <= candidates <= MAX_TOP_K:
+        raise RequestError(f"rerank candidates must be an integer between 0 and {MAX_TOP_K}")
+    budget_ms = rerank.get("budget_ms")
+    if budget_ms is not None and (not isinstance(budget_ms, (int, float)) or budget_ms <= 0):
+        raise RequestError("rerank budget_ms must be a positive number")
+    return {
+        "top_k": top_k, "mode": mode, "backend": backend, **filters, **params,
+        "rerank_candidates": candidates, "rerank_budget_ms": budget_ms,
+    }
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise RequestError("request body must be JSON")
+    if not isinstance(body, dict):
+        raise RequestError("request body must be a JSON object")
+    return body
+
+
+def run_search(retriever, query, options):
+    """(records, reranked) for one query."""
+    results, scores = retriever.search(query, **options)
+    reranked = results.attrs['reranked']
+    mode = None if query.strip() == '*' else "rerank" if reranked else options["mode"]
+    return to_records(results, scores, mode, retriever.calibration), reranked
+
+
+def run_batch(retriever, queries, options):
+    retriever.warm(queries)
+    return [run_search(retriever, query, options) for query in queries]
+
+
+def check_rerank(app, options):
+    if options["rerank_candidates"] and not app["info"]["reranker"]:
+        raise RequestError("this service has no re-ranker; start it with SHUTTLE_RERANKER set")
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    try:
+        return await handler(request)
+    except RequestError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+
+async def health(request):
+    return web.json_response({"status": "ok"})
+
+
+async def info(request):
+    facts = dict(request.app["info"])
+    facts["min_date"] = facts["min_date"].isoformat()
+    facts["max_date"] = facts["max_date"].isoformat()
+    return web.json_response(facts)
+
+
+async def stats(request):
+    return web.json_response(request.app["retriever"].stats())
+
+
+async def search(request):
+    body = await read_json(request)
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise RequestError("query must be a non-empty string")
+    options = parse_options(body)
+    check_rerank(request.app, options)
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    results, reranked = await loop.run_in_executor(
+        request.app["pool"], run_search, request.app["retriever"], query, options
+    )
+    return web.json_response({
+        "results": results, "reranked": reranked, "took_ms": 1000 * (time.perf_counter() - start)
+    })
+
+
+async def batch_search(request):
+    body = await read_json(request)
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        raise RequestError("queries must be a non-empty list of non-empty strings")
+    if len(queries) > MAX_BATCH:
+        raise RequestError(f"at most {MAX_BATCH} queries per batch")
+    options = parse_options(body)
+    check_rerank(request.app, options)
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    answers = await loop.run_in_executor(request.app["pool"], run_batch, request.app["retriever"], queries, options)
+    return web.json_response({
+        "results": [records for records, _ in answers],
+        "reranked": [reranked for _, reranked in answers],
+        "took_ms": 1000 * (time.perf_counter() - start),
+    })
+
+
+def run_browse(retriever, options, page):
+    cursor = retriever.browse(**options)
+    results = cursor.page(page)
+    records = to_records(results, [0.0] * len(results), None)
+    return {"results": records, "total": cursor.total, "pages": cursor.pages, "page": page}
+
+
+async def browse(request):
+    body = await read_json(request)
+    options = parse_browse(body)
+    page = body.get("page", 0)
+    if not isinstance(page, int) or page < 0:
+        raise RequestError("page must be a non-negative integer")
+
+    loop = asyncio.get_running_loop()
+    reply = await loop.run_in_executor(request.app["pool"], run_browse, request.app["retriever"], options, page)
+    return web.json_response(reply)
+
+
+async def export(request):
+    body = await read_json(request)
+    options = parse_browse({**body, "page_size": EXPORT_PAGE_SIZE})
+
+    loop = asyncio.get_running_loop()
+    pool = request.app["pool"]
+    cursor = await loop.run_in_executor(pool, lambda: request.app["retriever"].browse(**options))
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/csv; charset=utf-8",
+        "Content-Disposition": 'attachment; filename="search_results.csv"',
+    })
+    await response.prepare(request)
+    # Pages are read and formatted on the pool, one at a time
+    chunks = cursor.csv_chunks()
+    while (chunk := await loop.run_in_executor(pool, next, chunks, None)) is not None:
+        await response.write(chunk.encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def refresh_segments(app, interval, compact_segments):
+    retriever = app["retriever"]
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if compact_segments and await loop.run_in_executor(
+                app["pool"], compaction_due, retriever.corpus_path, compact_segments
+            ):
+                await loop.run_in_executor(app["pool"], compact, retriever.corpus_path)
+            if await loop.run_in_executor(app["pool"], retriever.refresh):
+                app["info"] = retriever.info()
+        except (OSError, ValueError) as e:
+            # A segment being compacted away or half-written: retry next time
+            print(f"Segment refresh failed: {e}")
+
+
+async def start_refresh(app):
+    if app["refresh_seconds"]:
+        app["refresher"] = asyncio.create_task(
+            refresh_segments(app, app["refresh_seconds"], app["compact_segments"])
+        )
+
+
+async def shutdown_pool(app):
+    if "refresher" in app:
+        app["refresher"].cancel()
+    await asyncio.to_thread(app["pool"].shutdown)
+
+
+def create_app(retriever, workers=4, refresh_seconds=5, compact_segments=0):
+    app = web.Application(middlewares=[error_middleware])
+    app["retriever"] = retriever
+    app["info"] = retriever.info()
+    app["pool"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    app["refresh_seconds"] = refresh_seconds
+    app["compact_segments"] = compact_segments
+    app.on_startup.append(start_refresh)
+    app.on_cleanup.append(shutdown_pool)
+    app.router.add_get("/health", health)
+    app.router.add_get("/info", info)
+    app.router.add_get("/stats", stats)
+    app.router.add_post("/search", search)
+    app.router.add_post("/batch_search", batch_search)
+    app.router.add_post("/browse", browse)
+    app.router.add_post("/export", export)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve retrieval over HTTP/JSON from one warm index.")
+    parser.add_argument("corpus_path", nargs="?", default=CORPUS_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backend", choices=BACKENDS, default=INDEX_BACKEND)
+    parser.add_argument("--workers", type=int, default=4, help="Search threads")
+    parser.add_argument("--refresh-seconds", type=float, default=5,
+                        help="How often to look for new segments (0 disables)")
+    parser.add_argument("--compact-segments", type=int, default=0,
+                        help=f"Compact once this many segments exist, e.g. {MAX_SEGMENTS} (0 disables)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    retriever = Retriever.load(args.corpus_path, model_name=args.model, backend=args.backend)
+    print(f"Loaded {len(retriever.corpus)} documents in {time.perf_counter() - start:.1f}s")
+    app = create_app(
+        retriever, workers=args.workers, refresh_seconds=args.refresh_seconds, compact_segments=args.compact_segments
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Batched, cached extractive summarisation of the abstracts.
+
+Produces the ``summarised_abstracts`` column that the retrieval embeddings
+are built from. ``BertSUM-summarised_abstracts.ipynb`` constructed a new
+``Summarizer()`` (reloading BERT) for every abstract and embedded its
+sentences one forward pass at a time. This stage follows the same
+algorithm as bert-extractive-summarizer's defaults - spaCy sentences of
+41-599 characters, the mean of BERT's second-to-last hidden layer per
+sentence, KMeans (``random_state=12345``) with ``min(num_sentences,
+sentences)`` clusters, the sentence closest to each centroid, plus the
+first sentence - but:
+
+* each worker process loads the model once and embeds the sentences of a
+  whole batch of abstracts together, sorted by length, in padded
+  forward passes;
+* summaries are kept in a SQLite cache keyed by a hash of the model,
+  settings and abstract text, so reruns on an updated corpus only
+  summarise new or changed abstracts, and a crashed run resumes from
+  whatever it had already summarised;
+* the input CSV is read and written in chunks, so neither the corpus nor
+  the summaries are held in memory (the output is written to a temporary
+  file and renamed once complete)::
+
+    python -m shuttle.summarise preprocessed_metadata.csv preprocessed_metadata_with_summaries.csv \\
+        --workers 4 --threads 2
+
+Sentence splitting needs the optional bert-extractive-summarizer and spaCy
+packages (``pip install bert-extractive-summarizer spacy``).
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL = "bert-large-uncased"
+CACHE_FILE = "summary_cache.sqlite"
+NUM_SENTENCES = 2
+MIN_LENGTH = 40
+MAX_LENGTH = 600
+HIDDEN_LAYER = -2
+RANDOM_STATE = 12345
+
+_worker = None
+
+
+def content_hash(text, model_name=DEFAULT_MODEL, num_sentences=NUM_SENTENCES):
+    """Cache key of one abstract under one model and summary length."""
+    return hashlib.sha1(f"{model_name}\0{num_sentences}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """SQLite cache of summaries by content hash."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS summaries (hash TEXT PRIMARY KEY, summary TEXT)")
+        self._db.commit()
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 900):  # SQLite's bound-parameter limit
+            batch = hashes[start:start + 900]
+            found.update(self._db.execute(
+                f"SELECT hash, summary FROM summaries WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ))
+        return found
+
+    def put_many(self, summaries):
+        self._db.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?)", summaries.items())
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+# Module probed for -> package to install
+DEPENDENCIES = {"summarizer": "bert-extractive-summarizer", "spacy": "spacy"}
+
+
+def check_dependencies():
+    """Fails with an install hint before any worker process loads a model."""
+    for module, package in DEPENDENCIES.items():
+        if importlib.util.find_spec(module) is None:
+            raise ImportError(f"Summarisation needs {package}: pip install {package}")
+
+
+def sentence_splitter():
+    """bert-extractive-summarizer's sentence handler (its module moved
+    between releases)."""
+    try:
+        from summarizer.text_processors.sentence_handler import SentenceHandler
+    except ImportError:
+        from summarizer.sentence_handler import SentenceHandler
+    return SentenceHandler()
+
+
+def closest_sentences(features, k):
+    """Sorted indices of the sentences nearest each KMeans centroid; a
+    sentence is picked for at most one centroid."""
+    from sklearn.cluster import KMeans
+
+    centroids = KMeans(n_clusters=k, random_state=RANDOM_STATE).fit(features).cluster_centers_
+    used = []
+    for centroid in centroids:
+        distances = np.linalg.norm(features - centroid, axis=1)
+        distances[used] = np.inf
+        used.append(int(np.argmin(distances)))
+    return sorted(used)
+
+
+class Summariser:
+    """Extractive summaries for batches of abstracts with one loaded model."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, num_sentences=NUM_SENTENCES, batch_size=32):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name, output_hidden_states=True).eval()
+        self.split = sentence_splitter()
+        self.num_sentences = num_sentences
+        self.batch_size = batch_size
+        self.sentences_embedded = 0
+
+    def embed(self, sentences):
+        """Mean second-to-last-layer state of each sentence (no special
+        tokens, as the summarizer library does), batched by length."""
+        encoded = self.tokenizer(sentences, add_special_tokens=False, truncation=True, max_length=512)["input_ids"]
+        order = np.argsort([len(ids) for ids in encoded], kind="stable")
+        out = None
+        with self._torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                padded = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+                hidden = self.model(**padded).hidden_states[HIDDEN_LAYER]
+                mask = padded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                means = ((hidden * mask).sum(1) / mask.sum(1).clamp(min=1)).numpy()
+                if out is None:
+                    out = np.empty((len(sentences), means.shape[1]), dtype=means.dtype)
+                out[batch] = means
+        self.sentences_embedded += len(sentences)
+        return out
+
+    def summarise_many(self, abstracts):
+        splits = [self.split(a, MIN_LENGTH, MAX_LENGTH) if isinstance(a, str) else [] for a in abstracts]
+        flat = [s for sentences in splits for s in sentences]
+        features = self.embed(flat) if flat else None
+
+        summaries, start = [], 0
+        for sentences in splits:
+            if not sentences:
+                summaries.append("")
+                continue
+            chosen = closest_sentences(features[start:start + len(sentences)], min(self.num_sentences, len(sentences)))
+            if chosen[0] != 0:
+                chosen.insert(0, 0)
+            summaries.append(" ".join(sentences[i] for i in chosen))
+            start += len(sentences)
+        return summaries
+
+
+def _init_worker(model_name, num_sentences, batch_size, threads):
+    global _worker
+    import torch
+
+    torch.set_num_threads(threads)
+    _worker = Summariser(model_name, num_sentences, batch_size)
+
+
+def _summarise_batch(hashes, abstracts):
+    return dict(zip(hashes, _worker.summarise_many(abstracts)))
+
+
+def summarise_csv(input_path, output_path, column="abstract", model_name=DEFAULT_MODEL,
+                  num_sentences=NUM_SENTENCES, cache_path=CACHE_FILE, workers=2, threads=1,
+                  chunk_size=2000, docs_per_task=64, batch_size=32, log=print):
+    """Writes `input_path` plus a ``summarised_abstracts`` column to
+    `output_path`, summarising only abstracts missing from the cache.
+    Returns the run's stats."""
+    check_dependencies()
+    cache = SummaryCache(cache_path)
+    tmp = f"{output_path}.tmp"
+    stats = {"rows": 0, "cache_hits": 0, "summarised": 0}
+    started = time.perf_counter()
+
+    def store(summaries):
+        # Committed as each batch lands, so a crash keeps finished work
+        cache.put_many(summaries)
+        stats["summarised"] += len(summaries)
+        elapsed = time.perf_counter() - started
+        log(f"{stats['summarised']} abstracts summarised, {stats['summarised'] / elapsed:.1f} docs/sec")
+
+    try:
+        # Header first, so an input without rows still gives a (header-only) output
+        header = pd.read_csv(input_path, nrows=0)
+        header["summarised_abstracts"] = pd.Series(dtype=object)
+        header.to_csv(tmp, index=False)
+
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                 initargs=(model_name, num_sentences, batch_size, threads)) as pool:
+            for chunk in pd.read_csv(input_path, chunksize=chunk_size):
+                texts = chunk[column].where(chunk[column].map(lambda a: isinstance(a, str)), "")
+                hashes = texts.map(lambda a: content_hash(a, model_name, num_sentences))
+                summaries = cache.get_many(set(hashes))
+                missing = {h: a for h, a in zip(hashes, texts) if h not in summaries}
+                stats["cache_hits"] += len(chunk) - int(hashes.isin(list(missing)).sum())
+
+                pending = set()
+                items = list(missing.items())
+                for start in range(0, len(items), docs_per_task):
+                    # Bound the batches in flight
+                    while len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            store(future.result())
+                    batch = items[start:start + docs_per_task]
+                    pending.add(pool.submit(_summarise_batch, [h for h, _ in batch], [a for _, a in batch]))
+                for future in wait(pending).done:
+                    store(future.result())
+                summaries.update(cache.get_many(missing))
+
+                chunk["summarised_abstracts"] = hashes.map(summaries)
+                chunk.to_csv(tmp, mode="a", header=False, index=False)
+                stats["rows"] += len(chunk)
+    finally:
+        cache.close()
+    os.replace(tmp, output_path)
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["docs_per_sec"] = stats["summarised"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add extractive abstract summaries to a metadata CSV.")
+    parser.add_argument("input", help="Preprocessed metadata CSV")
+    parser.add_argument("output")
+    parser.add_argument("--column", default="abstract")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--num-sentences", type=int, default=NUM_SENTENCES)
+    parser.add_argument("--cache", default=CACHE_FILE, help="SQLite summary cache")
+    parser.add_argument("--workers", type=int, default=2, help="Summariser processes")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per process")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="CSV rows read and written at a time")
+    parser.add_argument("--docs-per-task", type=int, default=64, help="Abstracts embedded together by a worker")
+    parser.add_argument("--batch-size", type=int, default=32, help="Sentences per forward pass")
+    args = parser.parse_args()
+
+    stats = summarise_csv(
+        args.input,
+        args.output,
+        column=args.column,
+        model_name=args.model,
+        num_sentences=args.num_sentences,
+        cache_path=args.cache,
+        workers=args.workers,
+        threads=args.threads,
+        chunk_size=args.chunk_size,
+        docs_per_task=args.docs_per_task,
+        batch_size=args.batch_size,
+    )
+    print(
+        f"Wrote {stats['rows']} rows to {args.output}: {stats['summarised']} summarised, "
+        f"{stats['cache_hits']} from the cache, in {stats['seconds']:.1f}s ({stats['docs_per_sec']:.1f} docs/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Compact tag index: vocabulary, per-tag posting lists and frequencies.
+
+Postings are stored CSR-style: one int32 array of row numbers grouped by tag,
+plus an offsets array, so tag ``t`` (the ``t``-th vocabulary entry) owns
+``postings[offsets[t]:offsets[t + 1]]`` in ascending row order. The
+vocabulary is kept in sidebar order (frequency descending, then alphabetical).
+
+The index is persisted next to the metadata as ``tag_index.npz`` so app
+startup never has to ``ast.literal_eval`` the ``tags`` column::
+
+    python -m shuttle.tag_index full_corpus_SBERT_trained
+"""
+import argparse
+import ast
+import os
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+TAG_INDEX_FILE = "tag_index.npz"
+METADATA_FILES = ["metadata_part1_final.csv", "metadata_part2_final.csv"]
+
+
+def parse_tags(value):
+    """Parses a stored tags cell such as "['Treatment', 'Vaccine']"."""
+    if pd.notnull(value) and value.startswith('['):
+        return ast.literal_eval(value)
+    return []
+
+
+class TagIndex:
+    """Tag vocabulary and posting lists over a fixed document order."""
+
+    def __init__(self, ids, vocab, offsets, postings):
+        # Row i of the index is the document with cord_uid ids[i]
+        self.ids = np.asarray(ids)
+        self.vocab = list(vocab)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.postings = np.asarray(postings, dtype=np.int32)
+        self.frequencies = np.diff(self.offsets)
+        self._positions = {tag: i for i, tag in enumerate(self.vocab)}
+
+    @classmethod
+    def from_rows(cls, ids, rows):
+        """Builds an index from a {tag: row numbers} mapping."""
+        vocab = sorted(rows, key=lambda t: (-len(rows[t]), t))
+        offsets = np.concatenate([[0], np.cumsum([len(rows[t]) for t in vocab])])
+        postings = np.concatenate([np.sort(rows[t]) for t in vocab]) if vocab else []
+        return cls(ids, vocab, offsets, postings)
+
+    @classmethod
+    def from_lists(cls, ids, tag_lists):
+        rows = defaultdict(list)
+        for i, tags in enumerate(tag_lists):
+            for tag in set(tags):
+                rows[tag].append(i)
+        return cls.from_rows(ids, rows)
+
+    @classmethod
+    def from_strings(cls, ids, tag_strings):
+        return cls.from_lists(ids, [parse_tags(s) for s in tag_strings])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def tag_frequency(self):
+        """Tag -> number of documents carrying it."""
+        return dict(zip(self.vocab, self.frequencies.tolist()))
+
+    def rows(self, tag):
+        """Sorted row numbers carrying `tag` (empty if the tag is unknown)."""
+        t = self._positions.get(tag)
+        if t is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[t]:self.offsets[t + 1]]
+
+    def rows_any(self, tags):
+        """Sorted row numbers carrying at least one of `tags`."""
+        lists = [self.rows(t) for t in tags]
+        if not lists:
+            return self.postings[:0]
+        return np.unique(np.concatenate(lists))
+
+    def rows_all(self, tags):
+        """Sorted row numbers carrying every one of `tags`."""
+        # Intersect shortest-first so the running result shrinks fastest
+        lists = sorted((self.rows(t) for t in tags), key=len)
+        if not lists:
+            return self.postings[:0]
+        result = lists[0]
+        for other in lists[1:]:
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def align(self, ids):
+        """Re-numbers rows to positions in `ids`, dropping documents not in it.
+
+        Used to line the index up with the corpus after the metadata and
+        embeddings are merged.
+        """
+        ids = pd.Index(ids)
+        if ids.equals(pd.Index(self.ids)):
+            return self
+        new_rows = ids.get_indexer(self.ids)
+        rows = {}
+        for tag in self.vocab:
+            mapped = new_rows[self.rows(tag)]
+            mapped = mapped[mapped >= 0]
+            if len(mapped):
+                rows[tag] = mapped
+        return TagIndex.from_rows(ids.to_numpy(), rows)
+
+    def extend(self, ids, tag_lists):
+        """Index over these rows followed by new rows `ids` carrying `tag_lists`."""
+        rows = {tag: [self.rows(tag)] for tag in self.vocab}
+        new_rows = defaultdict(list)
+        for i, tags in enumerate(tag_lists, start=len(self)):
+            for tag in set(tags):
+                new_rows[tag].append(i)
+        for tag, added in new_rows.items():
+            rows.setdefault(tag, []).append(np.asarray(added, dtype=np.int32))
+        rows = {tag: np.concatenate(parts) for tag, parts in rows.items()}
+        return TagIndex.from_rows(np.concatenate([self.ids, np.asarray(ids)]), rows)
+
+    def keep_tags(self, previous):
+        """This index plus every tag `previous` gave the same cord_uids, e.g.
+        labels predicted by ``shuttle.purpose_classifier`` that the raw
+        ``tags`` column this index was built from does not hold."""
+        mapped = pd.Index(self.ids).get_indexer(previous.ids)
+        rows = {tag: self.rows(tag) for tag in self.vocab}
+        for tag in previous.vocab:
+            kept = mapped[previous.rows(tag)]
+            rows[tag] = np.union1d(self.rows(tag), kept[kept >= 0])
+        return TagIndex.from_rows(self.ids, {tag: r for tag, r in rows.items() if len(r)})
+
+    def save(self, path):
+        np.savez(
+            path,
+            ids=self.ids.astype(str),
+            vocab=np.array(self.vocab, dtype=str),
+            offsets=self.offsets,
+            postings=self.postings,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["ids"], data["vocab"].tolist(), data["offsets"], data["postings"])
+
+
+def build_tag_index(metadata_paths):
+    """Builds a TagIndex from the ``cord_uid`` and ``tags`` columns of the metadata CSVs."""
+    frames = [pd.read_csv(p, usecols=["cord_uid", "tags"]) for p in metadata_paths]
+    df = pd.concat(frames)
+    return TagIndex.from_strings(df["cord_uid"].astype(str).to_numpy(), df["tags"])
+
+
+def save_tag_index(corpus_path, tag_index):
+    """Writes `tag_index`, rebuilt from the raw tags column, as the corpus's
+    tag index without dropping the tags the current file adds (see
+    ``TagIndex.keep_tags``). Returns the index written."""
+    path = os.path.join(corpus_path, TAG_INDEX_FILE)
+    if os.path.exists(path):
+        tag_index = tag_index.keep_tags(TagIndex.load(path))
+    tag_index.save(path)
+    return tag_index
+
+
+def load_tag_index(corpus_path, metadata_files=METADATA_FILES):
+    """The persisted tag index for a corpus directory, or None when it is
+    missing or older than any of the metadata files."""
+    path = os.path.join(corpus_path, TAG_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    built = os.path.getmtime(path)
+    for f in metadata_files:
+        meta_path = os.path.join(corpus_path, f)
+        if os.path.exists(meta_path) and os.path.getmtime(meta_path) > built:
+            return None
+    return TagIndex.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the persisted tag index from the metadata CSVs.")
+    parser.add_argument("corpus_path", help="Directory holding metadata_part*_final.csv")
+    parser.add_argument("--parts", nargs="+", default=METADATA_FILES)
+    args = parser.parse_args()
+
+    index = build_tag_index([os.path.join(args.corpus_path, p) for p in args.parts])
+    out_path = os.path.join(args.corpus_path, TAG_INDEX_FILE)
+    index.save(out_path)
+    print(f"Wrote {len(index.vocab)} tags over {len(index)} documents to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Search-purpose tagging with one multi-pattern automaton per rule set.
+
+Reproduces ``assign_research_tags`` and ``assign_strict_abstract_tags``
+from ``Search_Purpose_pt1_SE.ipynb``: a document gets every category one
+of whose keywords occurs in its lower-cased title; only documents with no
+title tags are tagged from the stricter abstract keywords. The notebook
+tests each keyword with ``keyword in text``, rescanning the text once per
+keyword. Here all keywords of a rule set are compiled into one
+Aho-Corasick automaton whose states carry a bitmask of the categories
+matched so far, so each title and abstract is scanned once (and the scan
+stops as soon as every category has matched)::
+
+    python -m shuttle.tagging metadata_cut_clean.csv purposes_metadata.csv --workers 4
+
+Matching is plain substring matching, exactly like the notebook ("vs"
+matches inside "canvas"). The automaton comes from pyahocorasick when it
+is installed (``pip install pyahocorasick``) and is otherwise built in
+pure Python. Chunks of rows are tagged in parallel worker processes.
+"""
+import argparse
+import importlib.util
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+TITLE_RULES = [
+    ("Literature Review", [
+        'review', 'meta-analysis', 'survey', 'overview', 'systematic review', 'literature review',
+        'comprehensive review', 'critical review', 'scoping review', 'narrative review']),
+    ("Methodologies or Experimental Designs", [
+        'method', 'methodology', 'design', 'experiment', 'approach', 'technique', 'protocol', 'procedure',
+        'framework', 'model', 'strategy', 'system', 'algorithm', 'paradigm', 'tool', 'instrument', 'guide',
+        'feasibility of']),
+    ("Theoretical Frameworks or Models", [
+        'theory', 'model', 'framework', 'conceptual', 'theoretical', 'paradigm', 'hypothesis', 'perspective',
+        'approach', 'lens', 'construct', 'schema', 'ontology', 'epistemology', 'role of']),
+    ("Research Gaps", [
+        'gap', 'future research', 'research agenda', 'unexplored', 'understudied', 'limitation', 'challenge',
+        'opportunity', 'prospect', 'frontier', 'avenue', 'direction', 'need for', 'call for', 'roadblocks']),
+    ("Comparative Works", [
+        'comparison', 'comparative', 'versus', 'vs.', 'vs', 'alternative', 'contrast', 'differ', 'debate',
+        'controversy', 'disagreement', 'dispute', 'conflict', 'competing', 'multiple', 'diverse', 'varied',
+        'relationship between']),
+    ("Quantitative Data and Analysis", [
+        'empirical', 'quantitative', 'statistical', 'analysis', 'data', 'case study', 'case-finding',
+        'case finding', 'regression', 'correlation', 'experiment', 'survey', 'meta-analysis', 'replication',
+        'evidence', 'results', 'findings', 'dataset', 'database', 'survey data', 'forecasting', 'forecast',
+        'predict', 'estimation', 'estimate', 'estimating', 'case series', 'factors impacting', 'determinants',
+        'causes of', 'implications', 'outcomes', 'evaluation of', 'clinical trial']),
+    ("Exploring Interdisciplinary Connection", [
+        'interdisciplinary', 'multidisciplinary', 'transdisciplinary', 'cross-disciplinary', 'hybrid', 'fusion',
+        'integration', 'convergence']),
+]
+
+ABSTRACT_RULES = [
+    ("Literature Review", [
+        'meta-analysis', 'systematic review', 'literature review', 'comprehensive review', 'critical review',
+        'scoping review', 'narrative review']),
+    ("Methodologies or Experimental Designs", [
+        'methodology', 'experiment', 'technique', 'protocol', 'procedure', 'algorithm', 'tool', 'instrument',
+        'feasibility of', 'propose a method']),
+    ("Theoretical Frameworks or Models", [
+        'theory', 'model', 'framework', 'conceptual', 'theoretical', 'hypothesis', 'ontology', 'epistemology',
+        'role of']),
+    ("Research Gaps", [
+        'gap', 'unexplored', 'understudied', 'limitation', 'challenge', 'frontier', 'need for', 'call for',
+        'roadblocks', 'little is known', 'more research', 'further research']),
+    ("Comparative Works", [
+        'comparison', 'comparative', 'versus', 'vs.', 'vs', 'contrast', 'debate', 'controversy', 'dispute',
+        'competing']),
+    ("Quantitative Data and Analysis", [
+        'empirical', 'quantitative', 'statistical', 'regression', 'correlation', 'meta-analysis', 'replication',
+        'data', 'real-time', 'real time', 'dataset', 'database', 'forecasting', 'forecast', 'predict', 'estimation',
+        'clinical trial', 'case study']),
+    ("Exploring Interdisciplinary Connection", [
+        'interdisciplinary', 'multidisciplinary', 'transdisciplinary', 'cross-disciplinary', 'integration',
+        'convergence']),
+]
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def keyword_masks(rules):
+    """{keyword: bitmask of the categories listing it}; bit i is rules[i]."""
+    masks = {}
+    for i, (_, keywords) in enumerate(rules):
+        for keyword in keywords:
+            masks[keyword] = masks.get(keyword, 0) | 1 << i
+    return masks
+
+
+class KeywordTagger:
+    """The categories of `rules` ((tag, keywords) pairs) whose keywords occur
+    in a text, in rule order."""
+
+    def __init__(self, rules, native=None):
+        self.tags = [tag for tag, _ in rules]
+        self.full = (1 << len(rules)) - 1
+        masks = keyword_masks(rules)
+        # Tag lists per bitmask, shared between documents
+        self._tag_lists = {}
+        if native is None:
+            native = importlib.util.find_spec("ahocorasick") is not None
+        self.native = native
+        if native:
+            import ahocorasick
+
+            self._automaton = ahocorasick.Automaton()
+            for keyword, mask in masks.items():
+                self._automaton.add_word(keyword, mask)
+            self._automaton.make_automaton()
+        else:
+            self._build(masks)
+
+    def _build(self, masks):
+        """Goto trie, failure links and output masks, flattened into a
+        complete transition table (one dict per state)."""
+        goto, output = [{}], [0]
+        for keyword, mask in masks.items():
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    output.append(0)
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state] |= mask
+
+        # Breadth-first: a state's failure target is always shallower, so its
+        # output and transitions are complete by the time they are inherited
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] |= output[fail[state]]
+            delta[state] = dict(delta[fail[state]], **goto[state])
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                queue.append(child)
+        self._delta = delta
+        self._output = output
+
+    def mask(self, text):
+        """Bitmask of the categories with a keyword in `text`."""
+        found = 0
+        full = self.full
+        if self.native:
+            for _, mask in self._automaton.iter(text):
+                found |= mask
+                if found == full:
+                    break
+            return found
+        delta, output = self._delta, self._output
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+                if found == full:
+                    break
+        return found
+
+    def tag_list(self, mask):
+        tags = self._tag_lists.get(mask)
+        if tags is None:
+            tags = self._tag_lists[mask] = [tag for i, tag in enumerate(self.tags) if mask >> i & 1]
+        return list(tags)
+
+    def __call__(self, text):
+        return self.tag_list(self.mask(text))
+
+
+class PurposeTagger:
+    """Title tags, falling back to the strict abstract tags."""
+
+    def __init__(self, title_rules=TITLE_RULES, abstract_rules=ABSTRACT_RULES, native=None):
+        self.title = KeywordTagger(title_rules, native)
+        self.abstract = KeywordTagger(abstract_rules, native)
+
+    def tag(self, title, abstract):
+        # str() as in the notebook, so a missing value is scanned as "nan"
+        tags = self.title(str(title).lower())
+        if tags:
+            return tags
+        return self.abstract(str(abstract).lower())
+
+    def tag_many(self, titles, abstracts):
+        return [self.tag(title, abstract) for title, abstract in zip(titles, abstracts)]
+
+
+_tagger = None
+
+
+def _init_worker(native):
+    global _tagger
+    _tagger = PurposeTagger(native=native)
+
+
+def _tag_chunk(titles, abstracts):
+    return _tagger.tag_many(titles, abstracts)
+
+
+def tag_documents(titles, abstracts, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, native=None):
+    """Tag lists for aligned sequences of titles and abstracts."""
+    titles, abstracts = list(titles), list(abstracts)
+    if workers <= 1 or len(titles) <= chunk_size:
+        return PurposeTagger(native=native).tag_many(titles, abstracts)
+    starts = range(0, len(titles), chunk_size)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(native,)) as pool:
+        chunks = pool.map(
+            _tag_chunk,
+            [titles[s:s + chunk_size] for s in starts],
+            [abstracts[s:s + chunk_size] for s in starts],
+        )
+        return [tags for chunk in chunks for tags in chunk]
+
+
+def tag_frame(frame, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, native=None):
+    """Copy of `frame` with the ``tags`` column from its title and abstract."""
+    frame = frame.copy()
+    frame["tags"] = tag_documents(frame["title"], frame["abstract"], workers, chunk_size, native)
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign search-purpose tags from title and abstract keywords.")
+    parser.add_argument("input", help="Metadata CSV with title and abstract columns")
+    parser.add_argument("output")
+    parser.add_argument("--workers", type=int, default=1, help="Tagging processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per worker task")
+    parser.add_argument("--pure-python", action="store_true", help="Use the pure-Python automaton")
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.input)
+    start = time.perf_counter()
+    frame = tag_frame(frame, args.workers, args.chunk_size, native=False if args.pure_python else None)
+    elapsed = time.perf_counter() - start
+    frame.to_csv(args.output, index=False)
+
+    counts = Counter(tag for tags in frame["tags"] for tag in tags)
+    untagged = int((frame["tags"].map(len) == 0).sum())
+    print(f"Tagged {len(frame)} documents in {elapsed:.1f}s ({len(frame) / max(elapsed, 1e-9):.0f} docs/sec); "
+          f"{untagged} without tags")
+    for tag, count in counts.most_common():
+        print(f"  {count:8d}  {tag}")
+
+
+if __name__ == "__main__":
+    main()
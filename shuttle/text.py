@@ -0,0 +1,7 @@
+"""Query text normalisation shared by the app and offline tools."""
+
+
+def preprocess_text(text):
+    if isinstance(text, str):
+        return ' '.join(text.lower().split())
+    return text
@@ -0,0 +1,105 @@
+"""BM25 scoring and MaxScore top-k against brute force."""
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from shuttle.bm25 import BM25Index, tokenize
+
+WORDS = ("virus covid vaccine trial model data review mask cell immune lung mortality risk "
+         "transmission children antibody serology ventilator icu outcome").split()
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    # Zipf-like word frequencies, so posting lists and max impacts differ
+    weights = 1 / np.arange(1, len(WORDS) + 1)
+    texts = [" ".join(rng.choice(WORDS, rng.integers(3, 40), p=weights / weights.sum())) for _ in range(400)]
+    ids = np.array([f"doc{i}" for i in range(len(texts))])
+    return ids, texts
+
+
+@pytest.fixture(scope="module")
+def index(corpus):
+    return BM25Index.build(*corpus)
+
+
+def brute_force_scores(index, query, mask=None):
+    """Every document's exact score: the sum of its query-term impacts."""
+    scores = np.zeros(len(index), dtype=np.float64)
+    matched = np.zeros(len(index), dtype=bool)
+    for term in set(tokenize(query)):
+        t = index.term_ids.get(term)
+        if t is None:
+            continue
+        docs = index.docs[index.offsets[t]:index.offsets[t + 1]]
+        scores[docs] += index.impacts[index.offsets[t]:index.offsets[t + 1]]
+        matched[docs] = True
+    if mask is not None:
+        matched &= mask
+    return scores, matched
+
+
+def test_impacts_are_okapi_bm25(corpus, index):
+    ids, texts = corpus
+    k1, b = 1.2, 0.75
+    docs = [Counter(tokenize(t)) for t in texts]
+    avgdl = np.mean([sum(d.values()) for d in docs])
+    for term in ("covid", "ventilator"):
+        df = sum(1 for d in docs if term in d)
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        t = index.term_ids[term]
+        for row, impact in zip(index.docs[index.offsets[t]:index.offsets[t + 1]],
+                               index.impacts[index.offsets[t]:index.offsets[t + 1]]):
+            tf, dl = docs[row][term], sum(docs[row].values())
+            expected = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+            assert impact == pytest.approx(expected, rel=1e-5)
+
+
+@pytest.mark.parametrize("query", [
+    "covid", "covid vaccine", "ventilator icu outcome", "antibody serology children transmission",
+    "virus covid vaccine trial model data review", "the covid of", "unknownword covid",
+])
+@pytest.mark.parametrize("top_k", [1, 5, 50, 1000])
+def test_maxscore_top_k_matches_brute_force(index, query, top_k):
+    rows, scores = index.search(query, top_k)
+    exact, matched = brute_force_scores(index, query)
+
+    expected = np.sort(exact[matched])[::-1][:top_k]
+    assert len(rows) == len(expected)
+    np.testing.assert_allclose(scores, expected, rtol=1e-5)
+    # Returned scores are the documents' exact scores, best first
+    np.testing.assert_allclose(scores, exact[rows], rtol=1e-5)
+    assert np.all(np.diff(scores) <= 0)
+    assert matched[rows].all()
+
+
+def test_mask_restricts_results(index):
+    mask = np.random.default_rng(1).random(len(index)) < 0.3
+    for query in ("covid vaccine", "icu antibody", "risk"):
+        rows, scores = index.search(query, 20, mask=mask)
+        exact, matched = brute_force_scores(index, query, mask)
+        assert mask[rows].all()
+        np.testing.assert_allclose(scores, np.sort(exact[matched])[::-1][:20], rtol=1e-5)
+
+
+def test_no_matching_terms(index):
+    for query in ("", "the of and", "unknownword"):
+        rows, scores = index.search(query, 10)
+        assert len(rows) == 0 and len(scores) == 0
+
+
+def test_align_and_round_trip(tmp_path, corpus, index):
+    ids, _ = corpus
+    order = np.random.default_rng(2).permutation(len(ids))[:300]
+    aligned = index.align(ids[order])
+    for query in ("covid vaccine", "lung mortality"):
+        rows, scores = aligned.search(query, 10)
+        exact, matched = brute_force_scores(index, query)
+        np.testing.assert_allclose(scores, exact[order][rows], rtol=1e-5)
+
+    index.save(tmp_path / "bm25_index.npz")
+    loaded = BM25Index.load(tmp_path / "bm25_index.npz")
+    np.testing.assert_array_equal(loaded.search("covid vaccine", 10)[0], index.search("covid vaccine", 10)[0])
@@ -0,0 +1,101 @@
+"""Browse cursor paging over the FilterIndex orderings."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from shuttle.browse import BrowseCursor
+from shuttle.filters import SORT_ORDERS, FilterIndex
+from shuttle.results import display_frame, to_csv
+from shuttle.tag_index import TagIndex
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    n = 230
+    # Few distinct days and counts, so the orderings have ties to keep stable
+    days = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 40, n), unit="D")
+    return pd.DataFrame({
+        "title": [f"title {i}" for i in range(n)],
+        "publish_time": pd.Series(days).where(rng.random(n) > 0.1).to_numpy(),
+        "abstract": [f"abstract {i}" for i in range(n)],
+        "referenced_by_count": np.where(rng.random(n) > 0.1, rng.integers(0, 30, n), np.nan),
+        "url": [f"https://example.org/{i}" for i in range(n)],
+    }, index=pd.Index([f"doc{i}" for i in range(n)], name="cord_uid"))
+
+
+@pytest.fixture(scope="module")
+def filter_index(corpus):
+    return FilterIndex.from_corpus(corpus, TagIndex.from_lists(corpus.index.to_numpy(), [[]] * len(corpus)))
+
+
+def cursor(corpus, filter_index, mask=None, sort="corpus", page_size=50):
+    rows = filter_index.matching_rows(mask, sort)
+    return BrowseCursor(rows, lambda page_rows: corpus.iloc[list(page_rows)], page_size)
+
+
+def reference_order(corpus, mask, sort):
+    """Row numbers passing `mask` in `sort` order, by pandas."""
+    frame = corpus.reset_index(drop=True)
+    if mask is not None:
+        frame = frame[mask]
+    if sort == "citations":
+        frame = frame.sort_values("referenced_by_count", ascending=False, kind="stable", na_position="last")
+    elif sort in ("newest", "oldest"):
+        frame = frame.sort_values("publish_time", ascending=sort == "oldest", kind="stable", na_position="last")
+    return frame.index.to_numpy()
+
+
+@pytest.mark.parametrize("sort", SORT_ORDERS)
+@pytest.mark.parametrize("with_mask", [False, True])
+def test_pages_cover_the_matching_rows_in_order(corpus, filter_index, sort, with_mask):
+    mask = np.random.default_rng(1).random(len(corpus)) < 0.4 if with_mask else None
+    browse = cursor(corpus, filter_index, mask, sort, page_size=17)
+    expected = reference_order(corpus, mask, sort)
+
+    assert browse.total == len(expected)
+    assert browse.pages == -(-len(expected) // 17)
+    pages = list(browse)
+    assert [len(p) for p in pages[:-1]] == [17] * (len(pages) - 1)
+    assert 0 < len(pages[-1]) <= 17
+    got = corpus.index.get_indexer(pd.concat(pages).index)
+    if sort == "newest":
+        # Days tie; only the key order is specified, newest first, undated last
+        published = corpus["publish_time"].iloc[got]
+        assert set(got) == set(expected)
+        assert published.notna().is_monotonic_decreasing
+        assert published.dropna().is_monotonic_decreasing
+    else:
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_page_past_the_end_is_empty(corpus, filter_index):
+    browse = cursor(corpus, filter_index, page_size=100)
+    assert browse.pages == 3
+    assert len(browse.page(2)) == 30
+    assert len(browse.page(3)) == 0
+    assert browse.page(0).index[0] == "doc0"
+
+
+def test_empty_result(corpus, filter_index):
+    browse = cursor(corpus, filter_index, np.zeros(len(corpus), dtype=bool))
+    assert browse.total == 0 and browse.pages == 0
+    assert list(browse) == []
+    # The export still has its header
+    (chunk,) = browse.csv_chunks()
+    assert chunk == to_csv(display_frame(corpus.iloc[:0]))
+
+
+def test_csv_chunks_join_to_the_whole_export(corpus, filter_index):
+    mask = corpus["referenced_by_count"].to_numpy() >= 10
+    browse = cursor(corpus, filter_index, mask, sort="citations", page_size=20)
+    everything = corpus.iloc[filter_index.matching_rows(mask, "citations")]
+
+    chunks = list(browse.csv_chunks())
+    assert len(chunks) == browse.pages
+    assert "".join(chunks) == to_csv(display_frame(everything))
+
+
+def test_page_size_must_be_positive(corpus, filter_index):
+    with pytest.raises(ValueError):
+        cursor(corpus, filter_index, page_size=0)
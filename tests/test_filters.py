@@ -0,0 +1,100 @@
+"""FilterIndex masks against the original app's pandas filtering."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from shuttle.filters import FilterIndex
+from shuttle.tag_index import TagIndex
+
+TAGS = ["Literature Review", "Research Gaps", "Comparative Works", "Quantitative Data and Analysis"]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(0)
+    n = 500
+    days = pd.Timestamp("2019-06-01") + pd.to_timedelta(rng.integers(0, 1200, n), unit="D")
+    frame = pd.DataFrame({
+        # Some rows undated, some without a citation count
+        "publish_time": pd.Series(days).where(rng.random(n) > 0.05).to_numpy(),
+        "referenced_by_count": np.where(rng.random(n) > 0.05, rng.integers(0, 200, n), np.nan),
+        "tags": [sorted(set(rng.choice(TAGS, rng.integers(0, 3)))) for _ in range(n)],
+    }, index=pd.Index([f"doc{i}" for i in range(n)], name="cord_uid"))
+    return frame
+
+
+@pytest.fixture(scope="module")
+def filter_index(corpus):
+    # Tag index in a different row order, as loaded from tag_index.npz
+    shuffled = corpus.sample(frac=1, random_state=1)
+    tag_index = TagIndex.from_lists(shuffled.index.to_numpy(), shuffled["tags"])
+    return FilterIndex.from_corpus(corpus, tag_index)
+
+
+def reference_mask(corpus, start_date=None, end_date=None, tags=None, tag_match="any", min_refs=0):
+    """The pandas filters of the original app, one boolean Series per filter."""
+    mask = pd.Series(True, index=corpus.index)
+    if start_date is not None or end_date is not None:
+        published = corpus["publish_time"].dt.date
+        in_range = published.notna()
+        if start_date is not None:
+            in_range &= published >= start_date
+        if end_date is not None:
+            in_range &= published <= end_date
+        mask &= in_range.astype(bool)
+    if tags:
+        match = all if tag_match == "all" else any
+        mask &= corpus["tags"].apply(lambda x: match(tag in x for tag in tags))
+    if min_refs is not None:
+        mask &= corpus["referenced_by_count"] >= min_refs
+    return mask.to_numpy()
+
+
+def as_array(mask, n):
+    return np.ones(n, dtype=bool) if mask is None else mask
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"start_date": date(2020, 3, 1), "end_date": date(2021, 3, 1)},
+    {"start_date": date(2020, 3, 1)},
+    {"end_date": date(2019, 12, 31)},
+    {"start_date": date(2020, 5, 5), "end_date": date(2020, 5, 5)},
+    {"tags": ["Research Gaps"]},
+    {"tags": ["Research Gaps", "Literature Review"], "tag_match": "any"},
+    {"tags": ["Research Gaps", "Literature Review"], "tag_match": "all"},
+    {"tags": ["No such tag"]},
+    {"min_refs": 50},
+    {"min_refs": 0},
+    {"start_date": date(2020, 1, 1), "end_date": date(2021, 12, 31), "tags": ["Comparative Works"], "min_refs": 20},
+])
+def test_mask_matches_pandas(corpus, filter_index, filters):
+    got = as_array(filter_index.mask(**filters), len(corpus))
+    np.testing.assert_array_equal(got, reference_mask(corpus, **filters))
+
+
+def test_random_filters_match_pandas(corpus, filter_index):
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        start = date(2019, 6, 1) + pd.Timedelta(days=int(rng.integers(0, 1200)))
+        filters = {
+            "start_date": start,
+            "end_date": start + pd.Timedelta(days=int(rng.integers(0, 400))),
+            "tags": list(rng.choice(TAGS, rng.integers(0, 3), replace=False)),
+            "tag_match": str(rng.choice(["any", "all"])),
+            "min_refs": int(rng.integers(0, 150)),
+        }
+        got = as_array(filter_index.mask(**filters), len(corpus))
+        np.testing.assert_array_equal(got, reference_mask(corpus, **filters), err_msg=str(filters))
+
+
+def test_no_active_filter_is_none():
+    corpus = pd.DataFrame({
+        "publish_time": pd.to_datetime(["2020-01-01", "2020-02-01"]),
+        "referenced_by_count": [1.0, 2.0],
+    }, index=pd.Index(["a", "b"], name="cord_uid"))
+    index = FilterIndex.from_corpus(corpus, TagIndex.from_lists(np.array(["a", "b"]), [[], []]))
+    assert index.mask() is None
+    assert index.mask(start_date=date(2019, 1, 1), end_date=date(2021, 1, 1)) is None
@@ -0,0 +1,79 @@
+"""Rank fusion of the dense and BM25 legs."""
+import numpy as np
+import pytest
+
+from shuttle.hybrid import HybridSearcher, reciprocal_rank_fusion, weighted_fusion
+
+
+def reference_rrf(rankings, k=60):
+    """{row: sum of 1 / (k + rank)} over the rankings, ranks from 1."""
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def test_rrf_matches_definition():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        rankings = [rng.permutation(200)[:rng.integers(0, 60)] for _ in range(2)]
+        rows, scores = reciprocal_rank_fusion(rankings, top_k=25)
+        fused = reference_rrf(rankings)
+
+        assert len(rows) == min(25, len(fused))
+        assert len(set(rows.tolist())) == len(rows)
+        np.testing.assert_allclose(scores, [fused[r] for r in rows])
+        np.testing.assert_allclose(scores, sorted(fused.values(), reverse=True)[:len(rows)])
+
+
+def test_rrf_rewards_agreement():
+    # Ranked second by both legs beats first by one leg and absent from the other
+    rows, scores = reciprocal_rank_fusion([[1, 2, 3], [4, 2, 5]], top_k=5)
+    assert rows[0] == 2
+    assert scores[0] == pytest.approx(2 / 62)
+    assert set(rows.tolist()) == {1, 2, 3, 4, 5}
+
+
+def test_rrf_k_and_empty_rankings():
+    rows, scores = reciprocal_rank_fusion([[7, 8]], top_k=2, k=0)
+    np.testing.assert_array_equal(rows, [7, 8])
+    np.testing.assert_allclose(scores, [1.0, 0.5])
+    rows, scores = reciprocal_rank_fusion([[], []], top_k=10)
+    assert len(rows) == 0 and len(scores) == 0
+
+
+def test_weighted_fusion_normalises_each_leg():
+    dense = (np.array([0, 1, 2]), np.array([0.9, 0.5, 0.1]))
+    lexical = (np.array([2, 3]), np.array([12.0, 4.0]))
+    rows, scores = weighted_fusion([dense, lexical], [0.5, 0.5], top_k=4)
+    expected = {0: 0.5, 1: 0.25, 2: 0.5, 3: 0.0}
+    np.testing.assert_allclose(scores, [expected[r] for r in rows])
+    assert set(rows.tolist()) == set(expected)
+
+
+class _Leg:
+    def __init__(self, rows):
+        self.rows = np.asarray(rows)
+
+    def search(self, query, top_k=50, mask=None, **params):
+        rows = self.rows if mask is None else self.rows[mask[self.rows]]
+        rows = rows[:top_k]
+        return rows, np.linspace(1, 0.5, len(rows))
+
+
+def test_searcher_fuses_both_legs_under_the_mask():
+    engine = _Leg([3, 1, 4, 0, 5])
+    bm25 = _Leg([4, 2, 3, 6])
+    searcher = HybridSearcher(engine, bm25, encode=lambda text: np.zeros(4), depth=10)
+    mask = np.ones(8, dtype=bool)
+    mask[3] = False
+
+    rows, scores = searcher.search("q", top_k=3, mode="rrf", mask=mask)
+    fused = reference_rrf([[1, 4, 0, 5], [4, 2, 6]])
+    assert rows[0] == 4
+    assert 3 not in rows
+    np.testing.assert_allclose(scores, sorted(fused.values(), reverse=True)[:3])
+
+    with pytest.raises(ValueError):
+        searcher.search("q", mode="nonsense")
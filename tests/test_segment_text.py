@@ -0,0 +1,37 @@
+"""Display text of documents deleted and re-ingested as a segment."""
+import numpy as np
+import pandas as pd
+
+from shuttle.core import DISPLAY_TEXT_COLUMNS, with_segment_text
+
+
+def _results(rows):
+    frame = pd.DataFrame(rows, columns=["cord_uid"] + DISPLAY_TEXT_COLUMNS).set_index("cord_uid")
+    frame["publish_time"] = pd.Timestamp("2020-01-01")
+    return frame
+
+
+def test_reingested_document_shows_segment_text():
+    # `segments.delete` then `segments.ingest` of "a": the base store still
+    # joins the old text, the live segment row carries the new one
+    results = _results([
+        ("a", "old title", "old abstract", "http://old"),
+        ("b", "base title", "base abstract", "http://b"),
+    ])
+    segment_text = _results([("a", "new title", "new abstract", np.nan)])[DISPLAY_TEXT_COLUMNS]
+
+    shown = with_segment_text(results, segment_text)
+
+    assert shown.loc["a", "title"] == "new title"
+    assert shown.loc["a", "abstract"] == "new abstract"
+    # A value the new copy lacks is not back-filled from the deleted one
+    assert pd.isna(shown.loc["a", "url"])
+    assert shown.loc["b"].tolist()[:3] == ["base title", "base abstract", "http://b"]
+    assert list(shown.index) == ["a", "b"]
+    assert "publish_time" in shown.columns
+
+
+def test_results_without_segment_rows_are_unchanged():
+    results = _results([("b", "base title", "base abstract", "http://b")])
+    segment_text = _results([("z", "t", "a", "u")])[DISPLAY_TEXT_COLUMNS]
+    assert with_segment_text(results, segment_text) is results
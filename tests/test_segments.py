@@ -0,0 +1,140 @@
+"""Segment ingestion, tombstones and compaction."""
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from shuttle.embedding_store import STORE_DIRNAME, write_store
+from shuttle.engine import DenseSearchEngine, l2_normalize
+from shuttle.segments import (
+    SEGMENT_EMBEDDINGS, SegmentedEngine, compact, delete, encoding_text, ingest, live_ids, live_mask,
+    open_segments, read_manifest, segments_path
+)
+
+DIM = 8
+
+
+def encode(texts):
+    """Deterministic stand-in for the SBERT model."""
+    return np.stack([np.random.default_rng(zlib.crc32(t.encode())).standard_normal(DIM) for t in texts])
+
+
+def rows(ids, version="v1"):
+    return pd.DataFrame({
+        "cord_uid": ids,
+        "title": [f"{i} title {version}" for i in ids],
+        "summarised_abstracts": [f"{i} summary {version}" for i in ids],
+        "publish_time": "2021-01-01",
+        "tags": "['Research Gaps']",
+    })
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    ids = ["a", "b", "c"]
+    write_store(str(tmp_path / STORE_DIRNAME), ids, l2_normalize(encode(ids)), normalized=True)
+    return str(tmp_path)
+
+
+def live(corpus_path):
+    return set(live_ids(corpus_path, read_manifest(corpus_path)))
+
+
+def test_live_mask_applies_tombstones_per_segment():
+    ids = np.array(["a", "b", "a", "c"])
+    numbers = np.array([0, 0, 3, 3])
+    assert live_mask(ids, numbers, {}) is None
+    # "a" deleted at generation 2: the base copy is dead, the segment 3 copy live
+    np.testing.assert_array_equal(live_mask(ids, numbers, {"a": 2}), [False, True, True, True])
+    np.testing.assert_array_equal(live_mask(ids, numbers, {"a": 3, "c": 5}), [False, True, False, False])
+    assert live_mask(ids, numbers, {"z": 9}) is None
+
+
+def test_ingest_adds_only_new_documents(corpus_path):
+    name, added = ingest(corpus_path, rows(["b", "d", "e", "d"]), encode)
+    assert (name, added) == ("seg-000001", 2)
+    assert live(corpus_path) == {"a", "b", "c", "d", "e"}
+
+    assert ingest(corpus_path, rows(["a", "d"]), encode) == (None, 0)
+    manifest = read_manifest(corpus_path)
+    assert manifest["segments"] == ["seg-000001"]
+    assert manifest["generation"] == 1
+
+
+def test_delete_then_reingest_revives_the_document(corpus_path):
+    ingest(corpus_path, rows(["d"]), encode)
+    delete(corpus_path, ["a", "d"])
+    assert live(corpus_path) == {"b", "c"}
+
+    name, added = ingest(corpus_path, rows(["a", "d"], version="v2"), encode)
+    assert added == 2
+    assert live(corpus_path) == {"a", "b", "c", "d"}
+    segments = open_segments(corpus_path, read_manifest(corpus_path))
+    assert segments[-1].name == name
+    assert segments[-1].metadata.loc["a", "title"] == "a title v2"
+
+
+def test_compact_merges_segments_and_drops_deleted_rows(corpus_path):
+    ingest(corpus_path, rows(["d", "e"]), encode)
+    ingest(corpus_path, rows(["f"]), encode)
+    delete(corpus_path, ["a", "e"])
+    ingest(corpus_path, rows(["e"], version="v2"), encode)
+    before = live(corpus_path)
+
+    name = compact(corpus_path)
+    manifest = read_manifest(corpus_path)
+    assert manifest["segments"] == [name]
+    # Only the tombstone on the original corpus is still needed
+    assert manifest["tombstones"] == {"a": manifest["tombstones"]["a"]}
+    assert live(corpus_path) == before == {"b", "c", "d", "e", "f"}
+
+    (segment,) = open_segments(corpus_path, manifest)
+    assert sorted(segment.metadata.index) == ["d", "e", "f"]
+    assert segment.metadata.loc["e", "title"] == "e title v2"
+    # Rows keep the normalised vectors of the copy that is live
+    for doc_id, version in (("d", "v1"), ("e", "v2"), ("f", "v1")):
+        expected = l2_normalize(encode(encoding_text(rows([doc_id], version))))[0]
+        np.testing.assert_allclose(segment.store.vectors[segment.store.ids.index(doc_id)], expected, rtol=1e-6)
+
+
+def test_compact_is_a_no_op_without_work(corpus_path):
+    assert compact(corpus_path) is None
+    ingest(corpus_path, rows(["d"]), encode)
+    assert compact(corpus_path) is None
+    # A deleted row makes the only segment worth rewriting; without its one
+    # row nothing is left, so the segment is dropped
+    delete(corpus_path, ["d"])
+    assert compact(corpus_path) is None
+    assert read_manifest(corpus_path)["segments"] == []
+    assert live(corpus_path) == {"a", "b", "c"}
+
+
+def test_replaced_segments_are_removed_by_the_next_compaction(corpus_path):
+    ingest(corpus_path, rows(["d"]), encode)
+    ingest(corpus_path, rows(["e"]), encode)
+    first = compact(corpus_path)
+    ingest(corpus_path, rows(["f"]), encode)
+    second = compact(corpus_path)
+
+    on_disk = sorted(e for e in os.listdir(segments_path(corpus_path)) if e.startswith("seg-"))
+    # The segments merged by the first compaction are gone; the ones merged by
+    # the second stay for readers until the next one
+    assert on_disk == sorted([first, "seg-000004", second])
+    assert os.path.exists(os.path.join(segments_path(corpus_path), second, SEGMENT_EMBEDDINGS))
+
+
+def test_segmented_engine_matches_one_engine():
+    rng = np.random.default_rng(0)
+    parts = [rng.standard_normal((n, DIM)) for n in (50, 7, 12)]
+    segmented = SegmentedEngine([DenseSearchEngine(p) for p in parts])
+    single = DenseSearchEngine(np.concatenate(parts))
+    mask = rng.random(69) < 0.5
+
+    for query in rng.standard_normal((5, DIM)):
+        for m in (None, mask):
+            found, scores = segmented.search(query, 10, mask=m)
+            expected_rows, expected_scores = single.search(query, 10, mask=m)
+            np.testing.assert_array_equal(found, expected_rows)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)